@@ -1,12 +1,16 @@
 #!/usr/bin/env python3
-from tuda_workspace_scripts.build import clean_logs, clean_packages
+from tuda_workspace_scripts.build import clean_logs, clean_packages, clean_stale
+from tuda_workspace_scripts.disk_usage import print_disk_usage
 from tuda_workspace_scripts.print import print_workspace_error
-from tuda_workspace_scripts.workspace import get_workspace_root, PackageChoicesCompleter
+from tuda_workspace_scripts.workspace import (
+    get_workspace_root,
+    load_package_index,
+    PackageChoicesCompleter,
+)
 from helpers.remove_packages_from_env import *
 import argcomplete
 import argparse
 
-
 if __name__ == "__main__":
     workspace_root = get_workspace_root()
     parser = argparse.ArgumentParser(
@@ -23,6 +27,18 @@ if __name__ == "__main__":
         action="store_true",
         help="If specified only the logs are cleaned",
     )
+    parser.add_argument(
+        "--stale",
+        default=False,
+        action="store_true",
+        help="Only clean the build, install and log directories of packages that no longer exist in the workspace.",
+    )
+    parser.add_argument(
+        "--usage",
+        default=False,
+        action="store_true",
+        help="Print the disk usage of the packages and caches instead of cleaning.",
+    )
 
     argcomplete.autocomplete(parser)
     args = parser.parse_args()
@@ -31,6 +47,13 @@ if __name__ == "__main__":
         print_workspace_error()
         exit(1)
 
+    if args.usage:
+        print_disk_usage(
+            workspace_root, load_package_index(workspace_root).packages.keys()
+        )
+        exit(0)
+    if args.stale:
+        exit(0 if clean_stale(workspace_root, force=args.force) else 1)
     if args.logs:
         exit(clean_logs(workspace_root, args.packages or [], force=args.force))
     else:
@@ -1,6 +1,15 @@
 #!/usr/bin/env python3
-from tuda_workspace_scripts.build import build_packages
-from tuda_workspace_scripts.print import print_error, print_workspace_error
+from tuda_workspace_scripts.build import (
+    build_packages,
+    print_build_schedule,
+    watch_and_build,
+)
+from tuda_workspace_scripts.build_history import print_build_stats
+from tuda_workspace_scripts.print import (
+    print_error,
+    print_info,
+    print_workspace_error,
+)
 from tuda_workspace_scripts.workspace import *
 from tuda_workspace_scripts.completion import *
 from _clean import clean_packages
@@ -8,7 +17,6 @@ import argcomplete
 import argparse
 import os
 
-
 if __name__ == "__main__":
     workspace_root = get_workspace_root()
     parser = argparse.ArgumentParser()
@@ -43,6 +51,54 @@ if __name__ == "__main__":
         action="store_true",
         help="Build only the specified packages, not their dependencies.",
     )
+    parser.add_argument(
+        "--changed",
+        default=False,
+        action="store_true",
+        help="Build only packages whose sources changed since they were last built with --changed and the packages depending on them.",
+    )
+    parser.add_argument(
+        "--memory-aware",
+        default=False,
+        action="store_true",
+        help="Choose the number of parallel workers and make jobs based on the available memory and the memory usage of previous builds and pause jobs if the memory usage gets too high.",
+    )
+    parser.add_argument(
+        "--critical-path",
+        default=False,
+        action="store_true",
+        help="Start the packages with the longest remaining chain of builds first based on the durations of previous builds.",
+    )
+    parser.add_argument(
+        "--cache",
+        default=False,
+        action="store_true",
+        help="Restore packages whose sources, build arguments and dependencies did not change from the local artifact cache instead of building them.",
+    )
+    parser.add_argument(
+        "--compiler-cache",
+        default=None,
+        choices=["none", "ccache", "sccache"],
+        help="Use the given compiler cache with a cache directory in the workspace. Defaults to the compiler_cache config variable.",
+    )
+    parser.add_argument(
+        "--dry-run",
+        default=False,
+        action="store_true",
+        help="Print the predicted build time with colcon's and the critical path order instead of building.",
+    )
+    parser.add_argument(
+        "--watch",
+        default=False,
+        action="store_true",
+        help="Keep running after the build and rebuild packages whose sources change.",
+    )
+    parser.add_argument(
+        "--dependents",
+        default=False,
+        action="store_true",
+        help="With --watch, also rebuild the packages depending on the changed packages.",
+    )
     parser.add_argument(
         "--continue-on-error",
         default=False,
@@ -57,7 +113,16 @@ if __name__ == "__main__":
         "-v",
         default=False,
         action="store_true",
-        help="Print verbose output.",
+        help="Print the full output of colcon instead of a compact live view.",
+    )
+    parser.add_argument(
+        "--stats",
+        default=None,
+        nargs="?",
+        const=10,
+        type=int,
+        metavar="N",
+        help="Print the slowest packages, trends and regressions of the last N builds (default: 10) instead of building.",
     )
     parser.add_argument(
         "--yes",
@@ -75,6 +140,10 @@ if __name__ == "__main__":
         print_workspace_error()
         exit(1)
 
+    if args.stats is not None:
+        print_build_stats(workspace_root, args.stats)
+        exit(0)
+
     packages = args.packages or []
     if args.this:
         packages = find_packages_in_directory(os.getcwd())
@@ -86,20 +155,42 @@ if __name__ == "__main__":
             print_error("No package found in the current directory!")
             exit(1)
 
+    if args.dry_run:
+        print_build_schedule(workspace_root, packages, no_deps=args.no_deps)
+        exit(0)
+
     if args.clean and not clean_packages(workspace_root, packages, force=args.yes):
         exit(1)
+    build_arguments = dict(
+        build_type=args.build_type[0] if args.build_type else None,
+        continue_on_error=args.continue_on_error,
+        build_tests=args.build_tests,
+        verbose=args.verbose,
+        memory_aware=args.memory_aware,
+        critical_path=args.critical_path,
+        use_cache=args.cache,
+        compiler_cache=args.compiler_cache,
+    )
     try:
-        exit(
-            build_packages(
-                workspace_root,
-                packages,
-                build_type=args.build_type[0] if args.build_type else None,
-                no_deps=args.no_deps,
-                continue_on_error=args.continue_on_error,
-                build_tests=args.build_tests,
-                verbose=args.verbose,
-            )
+        returncode = build_packages(
+            workspace_root,
+            packages,
+            no_deps=args.no_deps,
+            changed_only=args.changed,
+            **build_arguments,
+        )
+        if not args.watch:
+            exit(returncode)
+        watch_and_build(
+            workspace_root,
+            packages,
+            no_deps=args.no_deps,
+            with_dependents=args.dependents,
+            **build_arguments,
         )
     except KeyboardInterrupt:
+        if args.watch:
+            print_info("Stopped watching.")
+            exit(0)
         print_error("Build interrupted!")
         exit(1)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# PYTHON_ARGCOMPLETE_OK
+import argcomplete
+import argparse
+import os
+import subprocess
+import sys
+import time
+from tuda_workspace_scripts.completion_server import (
+    get_completion_socket_path,
+    is_server_running,
+    send_request,
+)
+from tuda_workspace_scripts.print import *
+
+
+def start(idle_timeout: float | None) -> int:
+    if is_server_running():
+        print_info("Completion server is already running.")
+        return 0
+    command = [sys.executable, "-m", "tuda_workspace_scripts.completion_server"]
+    if idle_timeout is not None:
+        command += ["--idle-timeout", str(idle_timeout * 60)]
+    subprocess.Popen(
+        command,
+        cwd="/",
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    # Wait for the server to warm up
+    for _ in range(100):
+        if is_server_running():
+            print_success(
+                f"Completion server started on {get_completion_socket_path()}"
+            )
+            return 0
+        time.sleep(0.1)
+    print_error("Failed to start completion server!")
+    return 1
+
+
+def stop() -> int:
+    if not is_server_running():
+        print_info("Completion server is not running.")
+        return 0
+    send_request({"command": "stop"})
+    print_success("Completion server stopped.")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Manage the completion server which keeps all modules and indexes required for completing "
+        "commands loaded to make TAB completion fast. The completion is used automatically while it is running."
+    )
+    sub_parsers = parser.add_subparsers(dest="command", help="The command to execute.")
+    start_parser = sub_parsers.add_parser("start", help="Start the completion server.")
+    start_parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=None,
+        help="Stop the server after it was not used for the given number of minutes.",
+    )
+    sub_parsers.add_parser("stop", help="Stop the completion server.")
+    restart_parser = sub_parsers.add_parser(
+        "restart",
+        help="Restart the completion server, e.g., after updating the workspace scripts.",
+    )
+    restart_parser.add_argument("--idle-timeout", type=float, default=None)
+    sub_parsers.add_parser(
+        "status", help="Show whether the completion server is running."
+    )
+    argcomplete.autocomplete(parser)
+    args = parser.parse_args()
+
+    if args.command == "start":
+        return start(args.idle_timeout)
+    if args.command == "stop":
+        return stop()
+    if args.command == "restart":
+        stop()
+        return start(args.idle_timeout)
+    if is_server_running():
+        print_info(f"Completion server is running on {get_completion_socket_path()}")
+    else:
+        print_info("Completion server is not running.")
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        exit(main())
+    except KeyboardInterrupt:
+        exit(0)
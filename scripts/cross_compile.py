@@ -1,13 +1,12 @@
 #!/usr/bin/env python3
 import argcomplete
 import argparse
-from tuda_workspace_scripts.build import cross_compile
-from tuda_workspace_scripts.print import print_workspace_error
+from tuda_workspace_scripts.build import cross_compile, stop_cross_compile_containers
+from tuda_workspace_scripts.print import print_error, print_info, print_workspace_error
 from tuda_workspace_scripts.workspace import PackageChoicesCompleter, get_workspace_root
 from os import getenv
 import os.path
 
-
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Builds the given packages for the given platform/architecture in a docker image."
@@ -42,8 +41,36 @@ if __name__ == "__main__":
         help="Clean build folders before building.",
     )
     parser.add_argument(
-        "--platform", choices=["linux/arm64", "linux/amd64"], required=True
+        "--compiler-cache",
+        default=None,
+        choices=["none", "ccache", "sccache"],
+        help="Use the given compiler cache in the container with a cache directory in the workspace. Defaults to the compiler_cache config variable.",
+    )
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=None,
+        help="Minutes after the build after which the build container is stopped if it is not used again. Defaults to the cross_compile_idle_timeout config variable, 0 stops it immediately.",
+    )
+    parser.add_argument(
+        "--checksum",
+        default=False,
+        action="store_true",
+        help="Compare the content of output files whose modification time changed instead of copying them.",
     )
+    parser.add_argument(
+        "--hardlink",
+        default=False,
+        action="store_true",
+        help="Hardlink the output files instead of copying them if the output directory is on the same file system as the build directory in /tmp. The output files are modified by later builds.",
+    )
+    parser.add_argument(
+        "--stop",
+        default=False,
+        action="store_true",
+        help="Stop the running build containers (only the one for --platform if given) and exit.",
+    )
+    parser.add_argument("--platform", choices=["linux/arm64", "linux/amd64"])
     parser.add_argument(
         "--ros-distro",
         choices=["foxy", "galactic", "humble", "iron", "jazzy", "rolling"],
@@ -72,6 +99,16 @@ if __name__ == "__main__":
         print_workspace_error()
         exit(1)
 
+    if args.stop:
+        stopped = stop_cross_compile_containers(
+            args.ros_distro, args.platform, args.base_image
+        )
+        print_info(f"Stopped {len(stopped)} containers.")
+        exit(0)
+    if args.platform is None:
+        print_error("--platform is required!")
+        exit(1)
+
     try:
         if not cross_compile(
             packages=args.PACKAGE,
@@ -84,6 +121,10 @@ if __name__ == "__main__":
             output_dir=args.output_dir,
             base_image=args.base_image,
             pull=args.pull,
+            compiler_cache=args.compiler_cache,
+            idle_timeout=args.idle_timeout,
+            compare_hashes=args.checksum,
+            hardlink=args.hardlink,
         ):
             exit(1)
     except KeyboardInterrupt:
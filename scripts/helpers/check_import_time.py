@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Import time regression check for the tuda_workspace_scripts python module.
+Imports each module in a fresh interpreter using python -X importtime and fails if
+a heavy dependency is imported eagerly or if the cumulative import time exceeds the budget.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+# Modules that are only imported when the functionality that needs them is used
+HEAVY_MODULES = [
+    "ament_index_python",
+    "colcon_core",
+    "colcon_override_check",
+    "dateutil",
+    "docker",
+    "git",
+    "jinja2",
+    "libtmux",
+]
+# Modules of this package and which heavy dependencies they may import at import time
+CHECKED_MODULES = {
+    "tuda_workspace_scripts": [],
+    "tuda_workspace_scripts.artifact_cache": [],
+    "tuda_workspace_scripts.build": [],
+    "tuda_workspace_scripts.build_history": [],
+    "tuda_workspace_scripts.build_monitor": [],
+    "tuda_workspace_scripts.build_output": [],
+    "tuda_workspace_scripts.build_parallelism": [],
+    "tuda_workspace_scripts.compiler_cache": [],
+    "tuda_workspace_scripts.config": [],
+    "tuda_workspace_scripts.cross_compile_dependencies": [],
+    "tuda_workspace_scripts.cross_compile_worker": [],
+    "tuda_workspace_scripts.disk_usage": [],
+    "tuda_workspace_scripts.git_status": [],
+    "tuda_workspace_scripts.log_retention": [],
+    "tuda_workspace_scripts.manifest": [],
+    "tuda_workspace_scripts.package_index": [],
+    "tuda_workspace_scripts.print": [],
+    "tuda_workspace_scripts.robots": [],
+    "tuda_workspace_scripts.scheduling": [],
+    "tuda_workspace_scripts.scripts": [],
+    "tuda_workspace_scripts.sync": [],
+    "tuda_workspace_scripts.test_cache": [],
+    "tuda_workspace_scripts.test_history": [],
+    "tuda_workspace_scripts.test_results": [],
+    "tuda_workspace_scripts.testing": [],
+    "tuda_workspace_scripts.tmux": [],
+    "tuda_workspace_scripts.trash": [],
+    "tuda_workspace_scripts.watch": [],
+    "tuda_workspace_scripts.workspace": [],
+}
+
+
+def measure(module: str) -> tuple[int, set[str]]:
+    """
+    :return: The cumulative import time of the module in microseconds and the names of all imported top level modules.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        env=os.environ,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to import {module}:\n{result.stderr}")
+    cumulative = 0
+    imported = set()
+    for line in result.stderr.splitlines():
+        # Format: import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:") :].split("|")
+        name = parts[2].strip()
+        imported.add(name.split(".")[0])
+        if name == module:
+            cumulative = int(parts[1])
+    return cumulative, imported
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=float(os.environ.get("TUDA_WSS_IMPORT_BUDGET_MS", 150)),
+        help="Maximum cumulative import time per module in milliseconds.",
+    )
+    args = parser.parse_args()
+
+    failed = False
+    for module, allowed in CHECKED_MODULES.items():
+        cumulative, imported = measure(module)
+        heavy = sorted(m for m in HEAVY_MODULES if m in imported and m not in allowed)
+        status = "OK"
+        if heavy:
+            status = f"FAILED (imports {', '.join(heavy)})"
+            failed = True
+        elif cumulative / 1000 > args.budget_ms:
+            status = f"FAILED (budget {args.budget_ms:.0f}ms)"
+            failed = True
+        print(f"{module}: {cumulative / 1000:.1f}ms {status}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# Client for the completion server (see tuda_wss completion_server).
+# Only uses the standard library, so it can be run with python3 -I -S to keep the start up time low.
+# Prints the completions of the given script and exits with 111 if the server is not available.
+import json
+import os
+import socket
+import sys
+
+UNAVAILABLE = 111
+
+
+def main() -> int:
+    socket_path, script = sys.argv[1], sys.argv[2]
+    try:
+        # Only talk to a server started by the current user
+        if os.stat(socket_path).st_uid != os.getuid():
+            return UNAVAILABLE
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(15)
+            sock.connect(socket_path)
+            request = {
+                "command": "complete",
+                "script": os.path.abspath(script),
+                "cwd": os.getcwd(),
+                "environment": dict(os.environ),
+            }
+            sock.sendall(json.dumps(request).encode())
+            sock.shutdown(socket.SHUT_WR)
+            chunks = []
+            while chunk := sock.recv(65536):
+                chunks.append(chunk)
+    except OSError:
+        return UNAVAILABLE
+    header, _, output = b"".join(chunks).partition(b"\n")
+    try:
+        code = int(header)
+    except ValueError:
+        return UNAVAILABLE
+    if code == UNAVAILABLE:
+        return UNAVAILABLE
+    sys.stdout.buffer.write(output)
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
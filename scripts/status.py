@@ -1,143 +1,203 @@
 #!/usr/bin/env python3
 # PYTHON_ARGCOMPLETE_OK
+import argcomplete
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from tuda_workspace_scripts.git_status import (
+    get_repository_fingerprint,
+    get_repository_status,
+    load_status_cache,
+    save_status_cache,
+)
 from tuda_workspace_scripts.print import *
-from tuda_workspace_scripts.workspace import get_workspace_root
+from tuda_workspace_scripts.workspace import find_git_repositories, get_workspace_root
 
-try:
-    import git
-except ImportError:
-    print(
-        "GitPython is required! Install using 'pip3 install --user gitpython' or 'apt install python3-git'"
-    )
-    raise
 import os
 
 
-def print_changes(path):
-    try:
-        repo = git.Repo(path, search_parent_directories=True)
-    except git.exc.InvalidGitRepositoryError:
-        print_error("Failed to obtain git info for: {}".format(path))
-        return
-    stash = repo.git.stash("list")
-    changes = repo.index.diff(None)
+def collect_changes(path) -> list[tuple[str | None, str]]:
+    """
+    Collects the changes of the repository at path without printing them, so repositories can be inspected concurrently.
+    :return: The lines of the report as tuples of color (None for uncolored) and message.
+    """
+    lines = []
     try:
-        # Need to reverse using R=True, otherwise we get the diff from tree to HEAD meaning deleted files are added and vice versa
-        changes += repo.index.diff("HEAD", R=True)
-    except git.BadName as e:
-        pass # Repo has no HEAD which means it probably also has no branches yet and was just initialized
+        status = get_repository_status(path)
+    except (RuntimeError, OSError):
+        lines.append((Colors.Error, "Failed to obtain git info for: {}".format(path)))
+        return lines
 
     # Check branches for uncommited commits and pure local branches
-    uncommited_commits = []
-    local_branches = []
-    deleted_branches = []
-    for branch in repo.branches:
-        if branch.tracking_branch() is None:
-            local_branches.append(branch)
-            continue
-        if not branch.tracking_branch().is_valid():
-            deleted_branches.append(branch)
-            continue
-        try:
-            if any(
-                True for _ in repo.iter_commits("{0}@{{u}}..{0}".format(branch.name))
-            ):
-                uncommited_commits.append(branch)
-        except (git.exc.GitCommandError, Exception) as e:
-            print_error(
-                "{} has error on branch {}: {}".format(path, branch.name, e.message)
-            )
+    uncommited_commits = [
+        b.name for b in status.branches if b.upstream is not None and b.ahead > 0
+    ]
+    local_branches = [b.name for b in status.branches if b.upstream is None]
+    deleted_branches = [b.name for b in status.branches if b.upstream_gone]
+    changes = status.changes
 
     if (
-        any(repo.untracked_files)
-        or any(stash)
+        status.untracked_count > 0
+        or status.has_stash
         or any(uncommited_commits)
         or any(local_branches)
         or any(changes)
     ):
-        print_info(f"{path} {Colors.LPURPLE}({repo.head.ref.name})")
-        if len(repo.branches) == 0:
-            print_color(Colors.LRED, "  No branches configured upstream.")
+        head = status.head
+        if head is None:
+            head = "detached at {}".format((status.head_commit or "")[:7])
+        lines.append((Colors.Info, f"{path} {Colors.LPURPLE}({head})"))
+        if len(status.branches) == 0:
+            lines.append((Colors.LRED, "  No branches configured upstream."))
         for branch in uncommited_commits:
-            print_color(Colors.RED, "  Unpushed commits on branch {}!".format(branch))
+            lines.append(
+                (Colors.RED, "  Unpushed commits on branch {}!".format(branch))
+            )
         for branch in local_branches:
-            print_color(
-                Colors.LRED, "  Local branch with no remote set up: {}".format(branch)
+            lines.append(
+                (Colors.LRED, "  Local branch with no remote set up: {}".format(branch))
             )
         for branch in deleted_branches:
-            print_color(
-                Colors.LRED,
-                "  Local branch for which remote was deleted: {}".format(branch),
+            lines.append(
+                (
+                    Colors.LRED,
+                    "  Local branch for which remote was deleted: {}".format(branch),
+                )
             )
-        if any(stash):
-            print_color(Colors.LCYAN, "  Stashed changes")
+        if status.has_stash:
+            lines.append((Colors.LCYAN, "  Stashed changes"))
         for item in changes:
-            if item.change_type.startswith("M"):
-                print_color(Colors.ORANGE, "  Modified: {}".format(item.a_path))
-            elif item.change_type.startswith("D"):
-                print_color(Colors.RED, "  Deleted: {}".format(item.a_path))
-            elif item.change_type.startswith("R"):
-                print_color(
-                    Colors.GREEN, "  Renamed: {} -> {}".format(item.a_path, item.b_path)
+            if item.change_type == "M":
+                lines.append((Colors.ORANGE, "  Modified: {}".format(item.path)))
+            elif item.change_type == "D":
+                lines.append((Colors.RED, "  Deleted: {}".format(item.path)))
+            elif item.change_type == "R":
+                lines.append(
+                    (
+                        Colors.GREEN,
+                        "  Renamed: {} -> {}".format(item.original_path, item.path),
+                    )
                 )
-            elif item.change_type.startswith("A"):
-                print_color(Colors.GREEN, "  Added: {}".format(item.a_path))
-            elif item.change_type.startswith("U"):
-                print_error("  Unmerged: {}".format(item.a_path))
-            elif item.change_type.startswith("C"):
-                print_color(
-                    Colors.GREEN, "  Copied: {} -> {}".format(item.a_path, item.b_path)
+            elif item.change_type == "A":
+                lines.append((Colors.GREEN, "  Added: {}".format(item.path)))
+            elif item.change_type == "U":
+                lines.append((Colors.Error, "  Unmerged: {}".format(item.path)))
+            elif item.change_type == "C":
+                lines.append(
+                    (
+                        Colors.GREEN,
+                        "  Copied: {} -> {}".format(item.original_path, item.path),
+                    )
                 )
-            elif item.change_type.startswith("T"):
-                print_color(Colors.ORANGE, "  Type changed: {}".format(item.a_path))
+            elif item.change_type == "T":
+                lines.append((Colors.ORANGE, "  Type changed: {}".format(item.path)))
             else:
-                print_color(
-                    Colors.RED,
-                    "  Unhandled change type '{}': {}".format(
-                        item.change_type, item.a_path
-                    ),
+                lines.append(
+                    (
+                        Colors.RED,
+                        "  Unhandled change type '{}': {}".format(
+                            item.change_type, item.path
+                        ),
+                    )
                 )
-        if len(repo.untracked_files) < 10:
-            for file in repo.untracked_files:
-                print_color(Colors.DGRAY, "  Untracked: {}".format(file))
+        if status.untracked_count < 10:
+            for file in status.untracked_paths:
+                lines.append((Colors.DGRAY, "  Untracked: {}".format(file)))
         else:
-            print_color(
-                Colors.DGRAY, "  {} untracked files.".format(len(repo.untracked_files))
+            lines.append(
+                (
+                    Colors.DGRAY,
+                    "  {} untracked files.".format(status.untracked_count),
+                )
             )
-        print("")
-    elif repo.is_dirty():
-        print_info(path)
-        print_error("  Dirty but I don't know why")
-        print("")
+        lines.append((None, ""))
+    elif status.is_dirty():
+        lines.append((Colors.Info, path))
+        lines.append((Colors.Error, "  Dirty but I don't know why"))
+        lines.append((None, ""))
+    return lines
+
+
+def collect_changes_cached(
+    path, cached_fingerprint: str | None
+) -> tuple[list[tuple[str | None, str]], str | None]:
+    """
+    Skips the repository if its fingerprint matches the cached fingerprint of its last clean status.
+    :return: The lines of the report and the fingerprint of the repository if it is clean, otherwise None.
+    """
+    fingerprint = get_repository_fingerprint(path)
+    if fingerprint is not None and fingerprint == cached_fingerprint:
+        return [], fingerprint
+    lines = collect_changes(path)
+    return lines, fingerprint if not lines else None
+
+
+def print_lines(lines: list[tuple[str | None, str]]) -> None:
+    for color, message in lines:
+        if color is None:
+            print(message)
+        else:
+            print_color(color, message)
 
 
 def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Prints any changes in the git repositories in the workspace."
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of repositories that are inspected in parallel. Defaults to the number of CPUs.",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Inspect all repositories, including those whose HEAD, index and refs did not change since they were last found to be clean. Use this to detect files that were edited but not staged since.",
+    )
+    argcomplete.autocomplete(parser)
+    args = parser.parse_args()
+
     ws_root_path = get_workspace_root()
     if ws_root_path is None:
         print_workspace_error()
         return 1
-    os.chdir(os.path.join(ws_root_path, "src"))
-    if os.path.isdir(os.path.join(ws_root_path, ".git")):
-        print_color(Colors.GREEN, "Looking for changes in {}...".format(ws_root_path))
-        print_changes(ws_root_path)
-
-    def scan_workspace(path):
-        if not os.path.isdir(path):
-            return
-        try:
-            subdirs = os.listdir(path)
-        except Exception as e:
-            print_error("Error while scanning '{}'!\nMessage: {}".format(path, str(e)))
-            return
-        if ".git" in subdirs:
-            print_changes(path)
-
-        for subdir in sorted(subdirs):
-            scan_workspace(os.path.join(path, subdir))
-
     ws_src_path = os.path.join(ws_root_path, "src")
-    print_color(Colors.GREEN, "Looking for changes in {}...".format(ws_src_path))
-    scan_workspace(ws_src_path)
+    os.chdir(ws_src_path)
+    # Find all repositories first, then inspect them concurrently and print the results in order
+    repositories = find_git_repositories(ws_src_path)
+    # Repositories that were clean and did not change since are skipped.
+    # The workspace root repository is always inspected since its work tree contains the build folders.
+    cache = {} if args.full else load_status_cache(ws_root_path)
+    executor = ThreadPoolExecutor(max_workers=max(1, args.jobs))
+    try:
+        if os.path.isdir(os.path.join(ws_root_path, ".git")):
+            root_result = executor.submit(collect_changes, ws_root_path)
+        else:
+            root_result = None
+        results = [
+            executor.submit(collect_changes_cached, path, cache.get(path, None))
+            for path in repositories
+        ]
+        if root_result is not None:
+            print_color(
+                Colors.GREEN, "Looking for changes in {}...".format(ws_root_path)
+            )
+            print_lines(root_result.result())
+        print_color(Colors.GREEN, "Looking for changes in {}...".format(ws_src_path))
+        fingerprints = {}
+        for path, result in zip(repositories, results):
+            lines, fingerprint = result.result()
+            print_lines(lines)
+            if fingerprint is not None:
+                fingerprints[path] = fingerprint
+        try:
+            save_status_cache(ws_root_path, fingerprints)
+        except OSError:
+            pass  # Workspace not writable, the next run will inspect all repositories
+    finally:
+        # Do not wait for pending repositories if interrupted
+        executor.shutdown(wait=False, cancel_futures=True)
     return 0
 
 
@@ -1,19 +1,95 @@
 #!/usr/bin/env python3
-from tuda_workspace_scripts.build import build_packages, clean_packages
+from tuda_workspace_scripts.build import build_packages
+from tuda_workspace_scripts.log_retention import start_log_retention
+from tuda_workspace_scripts.package_index import load_package_index
 from tuda_workspace_scripts.print import *
+from tuda_workspace_scripts.test_results import (
+    collect_test_results,
+    has_failures,
+    print_test_results,
+)
+from tuda_workspace_scripts.testing import (
+    find_affected_packages,
+    load_shard_durations,
+    run_tests,
+    save_shard_durations,
+    select_shard,
+)
 from tuda_workspace_scripts.workspace import *
 import argcomplete
 import argparse
 import os
-import subprocess
 import sys
 
+
+def parse_shard(value) -> tuple[int, int]:
+    try:
+        shard, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("Expected I/N, e.g., 1/4.")
+    if count < 1 or not 1 <= shard <= count:
+        raise argparse.ArgumentTypeError("Expected 1 <= I <= N.")
+    return shard, count
+
+
 if __name__ == "__main__":
     workspace_root = get_workspace_root()
     parser = argparse.ArgumentParser()
-    packages_arg = parser.add_argument('packages', nargs='*', help='If specified only these packages are built.')
+    packages_arg = parser.add_argument(
+        "packages", nargs="*", help="If specified only these packages are built."
+    )
     packages_arg.completer = PackageChoicesCompleter(workspace_root)
-    parser.add_argument('--this', default=False, action='store_true', help='Test the packages in the current directory.')
+    parser.add_argument(
+        "--this",
+        default=False,
+        action="store_true",
+        help="Test the packages in the current directory.",
+    )
+    parser.add_argument(
+        "--affected",
+        default=False,
+        action="store_true",
+        help="Only test the packages containing changed files in src and the packages depending on them.",
+    )
+    parser.add_argument(
+        "--since",
+        default=None,
+        metavar="REV",
+        help="With --affected, also include the changes committed since the given revision, e.g., origin/main.",
+    )
+    parser.add_argument(
+        "--no-cache",
+        default=False,
+        action="store_true",
+        help="Run all tests even if the results of packages whose install tree, sources and dependencies did not change are cached.",
+    )
+    parser.add_argument(
+        "--parallel-workers",
+        type=int,
+        default=None,
+        help="The maximum number of packages tested in parallel.",
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        default=None,
+        metavar="I/N",
+        help="Split the packages into N shards and only build and test shard I. Shards share the dependencies they "
+        "build, so do not run several shards in the same workspace at the same time.",
+    )
+    parser.add_argument(
+        "--shard-durations",
+        default=None,
+        metavar="FILE",
+        help="With --shard, split the packages into shards with similar expected test durations from the given file. "
+        "Every shard has to use the same file.",
+    )
+    parser.add_argument(
+        "--save-shard-durations",
+        default=None,
+        metavar="FILE",
+        help="Save the expected test durations of the packages from the test history to the given file and exit.",
+    )
 
     argcomplete.autocomplete(parser)
     args = parser.parse_args()
@@ -33,30 +109,68 @@ if __name__ == "__main__":
             print_error("No package found in the current directory!")
             exit(1)
 
+    if args.save_shard_durations:
+        durations = save_shard_durations(workspace_root, args.save_shard_durations)
+        print_info(
+            f"Saved the expected test durations of {len(durations)} packages to {args.save_shard_durations}."
+        )
+        exit(0)
+    if args.shard_durations and not args.shard:
+        print_error("--shard-durations can only be used with --shard!")
+        exit(1)
+    if args.since and not args.affected:
+        print_error("--since can only be used with --affected!")
+        exit(1)
+    if args.affected:
+        if len(packages) > 0:
+            print_error("--affected can not be combined with packages or --this!")
+            exit(1)
+        changed, dependents = find_affected_packages(workspace_root, args.since)
+        if len(changed) == 0:
+            print_info("No packages affected by the changes.")
+            exit(0)
+        print_info(f">>> Changed packages: {' '.join(sorted(changed))}")
+        if dependents:
+            print_info(f">>> Depending packages: {' '.join(sorted(dependents))}")
+        packages = sorted(changed | dependents)
+
     os.chdir(workspace_root)
-    print_info('>>> Building packages')
-    if len(packages) > 0:
-        returncode = build_packages(workspace_root, packages, build_tests=True)
-        if returncode != 0:
-            print_error('>>> Failed to build packages')
-            exit(returncode)
-        print_info('>>> Running tests')
-        command = subprocess.run('colcon test --packages-select ' + ' '.join(packages),
-                                 stdout=sys.stdout, stderr=sys.stderr, shell=True)
-        returncode = command.returncode
-        for package in packages:
-            print_info(f'>>> {package}')
-            command = subprocess.run(f'colcon test-result --verbose --test-result-base build/{package}',
-                                     stdout=sys.stdout, stderr=sys.stderr, shell=True)
-            returncode |= command.returncode
-    else:
-        returncode = build_packages(workspace_root, build_tests=True)
-        if returncode != 0:
-            print_error('>>> Failed to build packages')
-            exit(returncode)
-        print_info('>>> Running tests')
-        command = subprocess.run('colcon test', stdout=sys.stdout, stderr=sys.stderr, shell=True)
-        returncode = command.returncode
-        command = subprocess.run('colcon test-result --verbose', stdout=sys.stdout, stderr=sys.stderr, shell=True)
-        returncode |= command.returncode
+    if args.shard:
+        shard, count = args.shard
+        durations = None
+        if args.shard_durations:
+            try:
+                durations = load_shard_durations(args.shard_durations)
+            except (OSError, ValueError) as e:
+                print_error(f"Failed to load the shard durations: {e}")
+                exit(1)
+        packages = select_shard(
+            packages or list(load_package_index(workspace_root).packages.keys()),
+            shard,
+            count,
+            durations,
+        )
+        if len(packages) == 0:
+            print_info(f"No packages in shard {shard}/{count}.")
+            exit(0)
+        print_info(f">>> Shard {shard}/{count}: {' '.join(packages)}")
+    print_info(">>> Building packages")
+    returncode = build_packages(workspace_root, packages, build_tests=True)
+    if returncode != 0:
+        print_error(">>> Failed to build packages")
+        exit(returncode)
+    print_info(">>> Running tests")
+    returncode = run_tests(
+        workspace_root,
+        packages,
+        args.parallel_workers,
+        use_cache=not args.no_cache,
+    )
+    results = collect_test_results(
+        os.path.join(workspace_root, "build"), packages or None
+    )
+    print_test_results(results)
+    if has_failures(results):
+        returncode |= 1
+    start_log_retention(workspace_root)
     sys.exit(returncode)
@@ -0,0 +1,178 @@
+from tuda_workspace_scripts.cross_compile_worker import (
+    WORKER_LABEL,
+    CrossCompileWorker,
+    stop_workers,
+)
+import pytest
+
+
+class StubAPIError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+class StubContainer:
+    def __init__(self, client, name, labels):
+        self._client = client
+        self.id = f"{name}-{len(client.containers.started)}"
+        self.name = name
+        self.labels = labels
+        self.status = "running"
+        self.stopped = False
+
+    def remove(self, force=False):
+        if self not in self._client.containers.items:
+            raise StubAPIError(404)
+        self._client.containers.items.remove(self)
+
+    def exit_idle(self, removed=True):
+        """
+        Simulate the keepalive loop exiting. The container is removed by docker (auto_remove) unless removed is False.
+        The status is not updated since the listed containers are snapshots.
+        """
+        self.stopped = True
+        if removed:
+            self._client.containers.items.remove(self)
+
+
+class StubContainers:
+    def __init__(self, client):
+        self._client = client
+        self.items = []
+        self.started = []
+
+    def list(self, all=False, filters=None):
+        filters = filters or {}
+        return [
+            c
+            for c in self.items
+            if filters.get("label") in c.labels and filters.get("name", "") in c.name
+        ]
+
+    def run(self, image, name, labels, **kwargs):
+        assert kwargs["detach"] and kwargs["auto_remove"]
+        container = StubContainer(self._client, name, labels)
+        self.items.append(container)
+        self.started.append(container)
+        return container
+
+
+class StubImage:
+    def __init__(self, id):
+        self.id = id
+
+
+class StubImages:
+    def __init__(self):
+        self.ids = {}
+
+    def get(self, tag):
+        return StubImage(self.ids.get(tag, f"sha256:{tag}"))
+
+
+class StubApi:
+    def __init__(self, client):
+        self._client = client
+        self._execs = {}
+        self.commands = []
+        self.output = [b"line1\nli", b"ne2\n", b"tail"]
+        self.exit_code = 0
+
+    def exec_create(self, container_id, command, environment=None):
+        container = next(
+            (c for c in self._client.containers.items if c.id == container_id), None
+        )
+        if container is None:
+            raise StubAPIError(404)
+        if container.stopped:
+            raise StubAPIError(409)
+        exec_id = f"exec-{len(self._execs)}"
+        self._execs[exec_id] = command
+        self.commands.append((container_id, command))
+        return {"Id": exec_id}
+
+    def exec_start(self, exec_id, stream=False):
+        if self._execs[exec_id][0] == "touch":
+            return b""
+        return iter(self.output)
+
+    def exec_inspect(self, exec_id):
+        return {"ExitCode": 0 if self._execs[exec_id][0] == "touch" else self.exit_code}
+
+
+class StubDockerClient:
+    def __init__(self):
+        self.containers = StubContainers(self)
+        self.images = StubImages()
+        self.api = StubApi(self)
+
+
+@pytest.fixture
+def client():
+    return StubDockerClient()
+
+
+def create_worker(client, tag="image", volumes=None):
+    return CrossCompileWorker(
+        client, tag, "linux/arm64", volumes or {"/src": {"bind": "/workspace"}}, 1
+    )
+
+
+def test_run_streams_output_lines(client):
+    worker = create_worker(client)
+    assert not worker.start()
+    client.api.exit_code = 3
+    lines = []
+    assert worker.run(["cross_compile", "a"], {"X": "1"}, lines.append) == 3
+    assert lines == ["line1", "line2", "tail"]
+    assert client.api.commands[-1][1][-2:] == ["cross_compile", "a"]
+
+
+def test_reuses_running_worker(client):
+    first = create_worker(client)
+    assert not first.start()
+    second = create_worker(client)
+    assert second.start()
+    assert len(client.containers.started) == 1
+    # The reused worker is marked as used, so it does not stop before the build starts
+    assert client.api.commands[-1][1][0] == "touch"
+
+
+def test_replaces_worker_on_configuration_change(client):
+    create_worker(client).start()
+    worker = create_worker(client, volumes={"/other": {"bind": "/workspace"}})
+    assert not worker.start()
+    assert client.containers.items == [client.containers.started[-1]]
+    # A rebuilt image also replaces the worker
+    client.images.ids["image"] = "sha256:rebuilt"
+    assert not create_worker(client).start()
+    assert len(client.containers.started) == 3
+    assert len(client.containers.items) == 1
+
+
+def test_restarts_worker_that_stopped_while_idle(client):
+    worker = create_worker(client)
+    worker.start()
+    client.containers.started[0].exit_idle()
+    assert worker.run(["cross_compile"], {}, lambda line: None) == 0
+    assert len(client.containers.started) == 2
+    assert client.api.commands[-1][0] == client.containers.started[1].id
+
+
+def test_replaces_worker_that_stops_while_reused(client):
+    create_worker(client).start()
+    client.containers.started[0].exit_idle(removed=False)
+    worker = create_worker(client)
+    assert not worker.start()
+    assert client.containers.items == [client.containers.started[1]]
+
+
+def test_stop_workers(client):
+    create_worker(client, "image").start()
+    create_worker(client, "image-2").start()
+    assert stop_workers(client, "image") == ["tuda_wss-worker-image"]
+    assert [c.name for c in client.containers.items] == ["tuda_wss-worker-image-2"]
+    assert stop_workers(client) == ["tuda_wss-worker-image-2"]
+    assert client.containers.items == []
+    assert WORKER_LABEL in client.containers.started[0].labels
@@ -1,5 +1,65 @@
-from .build import *
-from .config import CONFIG_FILE_PATH, Config, load_config, load_variable, load_variables, Variable
-from .print import *
-from .scripts import *
-from .workspace import *
+import importlib
+
+# The submodules are only imported when one of their attributes is accessed for the first time.
+# This keeps the start up time of commands low since most of them only need a small part of this package.
+_LAZY_ATTRIBUTES = {
+    "build": ["build_packages", "clean_logs", "clean_packages", "cross_compile"],
+    "config": [
+        "CONFIG_FILE_PATH",
+        "Config",
+        "load_config",
+        "load_variable",
+        "load_variables",
+        "Variable",
+    ],
+    "print": [
+        "Colors",
+        "Style",
+        "print_color",
+        "print_header",
+        "print_info",
+        "print_success",
+        "print_warn",
+        "print_error",
+        "confirm",
+        "print_workspace_error",
+        "StatusOutput",
+        "TableOutput",
+    ],
+    "scripts": ["get_scripts_dirs", "get_hook_dirs", "get_hooks_for_command"],
+    "workspace": [
+        "get_workspace_root",
+        "get_cache_directory",
+        "find_packages_in_directory",
+        "find_package_containing",
+        "get_packages_in_workspace",
+        "get_package_path",
+        "find_git_repositories",
+        "get_ament_prefix_path_without_packages",
+        "get_ament_prefix_path_without_workspace",
+        "get_cmake_prefix_path_without_packages",
+        "get_cmake_prefix_path_without_workspace",
+        "PackageChoicesCompleter",
+        "load_package_index",
+        "PackageIndex",
+    ],
+}
+_ATTRIBUTE_MODULES = {
+    name: module for module, names in _LAZY_ATTRIBUTES.items() for name in names
+}
+__all__ = list(_ATTRIBUTE_MODULES.keys())
+
+
+def __getattr__(name):
+    if name not in _ATTRIBUTE_MODULES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module = importlib.import_module(f".{_ATTRIBUTE_MODULES[name]}", __name__)
+    value = getattr(module, name)
+    # The config file path depends on the working directory and is resolved on every access
+    if name != "CONFIG_FILE_PATH":
+        globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals().keys()) | set(__all__))
@@ -0,0 +1,300 @@
+"""
+Local content-addressed cache of the install trees of packages.
+The key of a package is a hash of its sources, build type, the build arguments, the install trees of the workspace
+packages it depends on and the underlay prefixes. If a package with the same key was built before, its install tree is
+restored from the cache instead of building it again, e.g., after switching back to a branch or cleaning the workspace.
+Since the key depends on the install trees of the dependencies, it is only known once they are built or restored.
+Changes of the underlay that do not change its prefixes, e.g., updated system packages, are not detected.
+"""
+
+from .manifest import MANIFEST_VERSION, scan_packages, tree_digest
+from .sync import clone_file
+from .workspace import (
+    get_ament_prefix_path_without_workspace,
+    get_cache_directory,
+    get_cmake_prefix_path_without_workspace,
+)
+import hashlib
+import json
+import os
+import shutil
+import time
+
+# Version of the cache layout and keys. Bump if the structure of the cache or the inputs of the keys change.
+ARTIFACT_CACHE_VERSION = 2
+# Default size limit of the cache in GB
+DEFAULT_MAX_CACHE_SIZE = 10
+# Environment variables that change the build output of a package
+KEY_ENVIRONMENT_VARIABLES = ["ROS_DISTRO", "CC", "CXX", "CFLAGS", "CXXFLAGS"]
+
+
+def get_artifact_cache_path(workspace_root) -> str:
+    return os.path.join(workspace_root, ".cache", "artifacts")
+
+
+class ArtifactCache:
+    """
+    The cache consists of a directory per key containing the install tree of the package and a meta.json with its
+    size. The modification time of the directory is the time it was last used and determines the eviction order.
+    """
+
+    def __init__(self, workspace_root) -> None:
+        self._workspace_root = workspace_root
+        self.path = get_artifact_cache_path(workspace_root)
+        self._entries_path = os.path.join(self.path, "entries")
+        self._state_path = os.path.join(self.path, "state.json")
+        self._state = None
+        # Digests of the install trees by package name, computed at most once until a tree changes
+        self._install_digests = {}
+
+    def compute_keys(
+        self, index, names, arguments: list[str], install_base: str
+    ) -> dict[str, str]:
+        """
+        The workspace packages the packages depend on have to be built or restored before.
+        :param index: The package index of the workspace.
+        :param names: The packages for which the keys are computed.
+        :param arguments: The arguments that change the build output, e.g., cmake arguments and mixins.
+        :param install_base: The install base the packages are installed to.
+        :return: The key of every package by name.
+        """
+        names = set(names)
+        dependencies = {
+            name: index.get_dependencies([name]) & set(index.packages.keys())
+            for name in names
+        }
+        state = self._load_state()
+        manifests = scan_packages(
+            {name: index.packages[name].path for name in names},
+            state["manifests"],
+        )
+        state["manifests"].update(manifests)
+        install_digests = self._get_install_digests(
+            set().union(*dependencies.values()), install_base
+        )
+        common = {
+            "version": ARTIFACT_CACHE_VERSION,
+            "arguments": arguments,
+            "install_base": os.path.abspath(install_base),
+            "environment": {
+                name: os.environ.get(name, None) for name in KEY_ENVIRONMENT_VARIABLES
+            },
+            "underlay": [
+                get_ament_prefix_path_without_workspace(self._workspace_root),
+                get_cmake_prefix_path_without_workspace(self._workspace_root),
+            ],
+        }
+        keys = {}
+        for name in names:
+            package = index.packages[name]
+            data = dict(common)
+            data["package"] = name
+            data["build_type"] = package.build_type
+            data["sources"] = tree_digest(manifests[name]["files"])
+            data["dependencies"] = {
+                d: install_digests[d] for d in sorted(dependencies[name])
+            }
+            keys[name] = hashlib.sha1(
+                json.dumps(data, sort_keys=True).encode()
+            ).hexdigest()
+        return keys
+
+    def _get_install_digests(self, names, install_base) -> dict[str, str | None]:
+        """
+        :return: The digest of the install tree of every package or None if it is not installed.
+        """
+        missing = {
+            name: os.path.join(os.path.abspath(install_base), name)
+            for name in names
+            if name not in self._install_digests
+        }
+        state = self._load_state()
+        installs = scan_packages(
+            {name: path for name, path in missing.items() if os.path.isdir(path)},
+            state["installs"],
+        )
+        state["installs"].update(installs)
+        for name in missing:
+            self._install_digests[name] = (
+                tree_digest(installs[name]["files"]) if name in installs else None
+            )
+        return {name: self._install_digests[name] for name in names}
+
+    def is_installed(self, name, key, install_base) -> bool:
+        """
+        :return: Whether the install tree of the package was restored from or stored with this key and not rebuilt since.
+        """
+        return self._load_state()["installed"].get(name, None) == key and os.path.isdir(
+            os.path.join(install_base, name)
+        )
+
+    def restore(self, name, key, install_base) -> bool:
+        """
+        Replace the install tree of the package with the cached install tree if there is one for the key.
+        :return: True if the install tree was restored, False if the key is not in the cache.
+        """
+        entry = os.path.join(self._entries_path, key)
+        if not os.path.isdir(os.path.join(entry, "install")):
+            return False
+        destination = os.path.join(install_base, name)
+        tmp_destination = f"{destination}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_destination, ignore_errors=True)
+        _clone_tree(os.path.join(entry, "install"), tmp_destination)
+        shutil.rmtree(destination, ignore_errors=True)
+        os.replace(tmp_destination, destination)
+        os.utime(entry)
+        self._load_state()["installed"][name] = key
+        self._install_digests.pop(name, None)
+        return True
+
+    def store(self, name, key, install_base, build_base) -> bool:
+        """
+        Store the install tree of a successfully built package in the cache.
+        :return: False if the package can not be cached because its install tree links into the build base,
+            e.g., for symlink installs.
+        """
+        source = os.path.join(install_base, name)
+        if not os.path.isdir(source) or _links_into(source, build_base):
+            return False
+        self._load_state()["installed"][name] = key
+        entry = os.path.join(self._entries_path, key)
+        if os.path.isdir(entry):
+            os.utime(entry)
+            return True
+        self._ensure_directory()
+        tmp_entry = f"{entry}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+        size = _clone_tree(source, os.path.join(tmp_entry, "install"))
+        with open(os.path.join(tmp_entry, "meta.json"), "w") as f:
+            json.dump({"package": name, "size": size, "time": time.time()}, f)
+        try:
+            os.rename(tmp_entry, entry)
+        except OSError:
+            # Stored by another build in the meantime
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+        return True
+
+    def forget_installed(self, names) -> None:
+        """
+        Mark the install trees of the packages as unknown, e.g., because they were built (without the cache).
+        """
+        installed = self._load_state()["installed"]
+        for name in names:
+            installed.pop(name, None)
+            self._install_digests.pop(name, None)
+
+    def evict(self, max_size: int) -> int:
+        """
+        Remove the least recently used entries until the cache is not larger than max_size bytes.
+        :return: The number of removed entries.
+        """
+        entries = sorted(self._get_entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for path, size, _ in entries:
+            if total <= max_size:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            removed += 1
+        return removed
+
+    def save(self) -> None:
+        """
+        Save the source and install manifests and installed keys. Has to be called after modifying the cache.
+        """
+        if self._state is None:
+            return
+        self._ensure_directory()
+        tmp_path = f"{self._state_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    "version": ARTIFACT_CACHE_VERSION,
+                    "manifest_version": MANIFEST_VERSION,
+                    **self._state,
+                },
+                f,
+            )
+        os.replace(tmp_path, self._state_path)
+
+    def _load_state(self) -> dict:
+        if self._state is not None:
+            return self._state
+        self._state = {"manifests": {}, "installs": {}, "installed": {}}
+        try:
+            with open(self._state_path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return self._state
+        if (
+            isinstance(data, dict)
+            and data.get("version") == ARTIFACT_CACHE_VERSION
+            and data.get("manifest_version") == MANIFEST_VERSION
+        ):
+            self._state["manifests"] = data.get("manifests", {})
+            self._state["installs"] = data.get("installs", {})
+            self._state["installed"] = data.get("installed", {})
+        return self._state
+
+    def _ensure_directory(self) -> None:
+        get_cache_directory(self._workspace_root, "artifacts")
+        os.makedirs(self._entries_path, exist_ok=True)
+
+    def _get_entries(self) -> list[tuple[str, int, float]]:
+        """
+        :return: The path, size and last use of every entry.
+        """
+        result = []
+        try:
+            with os.scandir(self._entries_path) as it:
+                for entry in it:
+                    if not entry.is_dir() or entry.name.endswith(".tmp"):
+                        continue
+                    try:
+                        with open(os.path.join(entry.path, "meta.json"), "r") as f:
+                            size = json.load(f)["size"]
+                        result.append((entry.path, size, entry.stat().st_mtime))
+                    except (OSError, ValueError, KeyError):
+                        # Incomplete entry, remove it on the next eviction
+                        result.append((entry.path, 0, 0.0))
+        except OSError:
+            pass
+        return result
+
+
+def _clone_tree(source, destination) -> int:
+    """
+    Copy a directory tree preserving symlinks.
+    Hardlinks are not used since colcon and cmake overwrite installed files in place which would modify the cache.
+    :return: The total size of the copied files in bytes.
+    """
+    size = 0
+    for directory, directories, files in os.walk(source):
+        target_directory = os.path.join(destination, os.path.relpath(directory, source))
+        os.makedirs(target_directory, exist_ok=True)
+        for name in files + [
+            d for d in directories if os.path.islink(os.path.join(directory, d))
+        ]:
+            path = os.path.join(directory, name)
+            target = os.path.join(target_directory, name)
+            if os.path.islink(path):
+                os.symlink(os.readlink(path), target)
+            else:
+                clone_file(path, target)
+                size += os.path.getsize(target)
+        shutil.copystat(directory, target_directory)
+    return size
+
+
+def _links_into(path, directory) -> bool:
+    """
+    :return: Whether any symlink in the tree at path points into the given directory.
+    """
+    directory = os.path.join(os.path.realpath(directory), "")
+    for root, directories, files in os.walk(path):
+        for name in files + directories:
+            entry = os.path.join(root, name)
+            if os.path.islink(entry) and os.path.realpath(entry).startswith(directory):
+                return True
+    return False
@@ -1,19 +1,76 @@
+from .artifact_cache import ArtifactCache, DEFAULT_MAX_CACHE_SIZE
+from .build_history import (
+    format_size,
+    get_expected_durations,
+    load_build_history,
+    parse_colcon_events,
+    record_build,
+)
+from .build_monitor import BuildMonitor
+from .build_output import BuildProgress, stream_build_output
+from .build_parallelism import (
+    estimate_parallelism,
+    get_available_memory,
+    get_job_memory,
+    MemoryWatchdog,
+)
+from .compiler_cache import (
+    COMPILER_CACHES,
+    CompilerCache,
+    DEFAULT_COMPILER_CACHE_SIZE,
+    format_compiler_cache_statistics,
+    get_compiler_cache_path,
+)
 from .config import load_config
-from .print import confirm, print_error, print_info, StatusOutput
+from .cross_compile_dependencies import (
+    BASE_IMAGE_LABEL,
+    CONTENT_HASH_LABEL,
+    create_dependency_image_context,
+    get_dependency_image_tag,
+    get_image_content_hash,
+    get_system_dependencies,
+    get_target_environment,
+    remove_stale_dependency_images,
+)
+from .cross_compile_worker import (
+    CrossCompileWorker,
+    DEFAULT_IDLE_TIMEOUT,
+    stop_workers,
+)
+from .disk_usage import ARTIFACT_DIRECTORIES, find_stale_directories
+from .log_retention import start_log_retention
+from .manifest import (
+    find_changed_packages,
+    load_source_manifests,
+    save_source_manifests,
+    scan_packages,
+)
+from .package_index import load_package_index
+from .print import (
+    confirm,
+    print_error,
+    print_header,
+    print_info,
+    print_warn,
+    StatusOutput,
+)
+from .scheduling import (
+    DURATIONS_ENVIRONMENT_VARIABLE,
+    get_topological_order,
+    print_schedule_report,
+)
+from .sync import sync_tree
+from .trash import move_to_trash, start_reaper
+from .watch import PackageWatcher
 from .workspace import *
-from ament_index_python import get_package_share_path
-from datetime import datetime, timezone
-from dateutil.parser import parse as parse_date
+import importlib.util
+import json
 import os
 import shlex
 import shutil
 import subprocess
 import sys
-
-try:
-    import colcon_override_check
-except ImportError:
-    colcon_override_check = None
+import time
 
 
 def build_packages(
@@ -28,14 +85,65 @@ def build_packages(
     verbose: bool = False,
     build_base: str | None = None,
     install_base: str | None = None,
+    changed_only: bool = False,
+    memory_aware: bool = False,
+    critical_path: bool = False,
+    use_cache: bool = False,
+    compiler_cache: str | None = None,
 ) -> int:
+    """
+    Build the given packages (and their dependencies unless no_deps is set) or all packages using colcon.
+    If stdout is a terminal and verbose is not set, a compact live view of the build is shown and the full output is
+    written to console.log in colcon's log directory of the build.
+    :param changed_only: Only build packages whose sources changed since their last build with changed_only,
+        that were not built yet, and the packages depending on them.
+        If packages are given, only they and their dependencies are considered.
+    :param memory_aware: Choose the number of parallel workers and make jobs based on the available memory and the
+        peak memory of previous builds and pause jobs while the memory usage is high.
+    :param critical_path: Start the packages with the longest remaining critical path based on the durations of
+        previous builds first instead of the packages with the most dependents.
+    :param use_cache: Restore the install trees of packages whose sources, build arguments and dependencies did not
+        change from the artifact cache instead of building them and store the newly built packages in the cache.
+    :param compiler_cache: The compiler cache (ccache or sccache) used as compiler launcher or "none".
+        Defaults to the compiler_cache config variable.
+    :return: The return code of colcon.
+    """
     os.chdir(workspace_root)
+    source_manifests = None
+    if changed_only:
+        packages, source_manifests = _select_changed_packages(
+            workspace_root, packages, no_deps, build_base
+        )
+        if len(packages) == 0:
+            print_info("No packages changed since the last build.")
+            return 0
+        no_deps = True
+    cache = None
+    cache_packages = []
+    key_arguments = [build_type, build_tests, sorted(mixin or [])]
+    if use_cache:
+        cache = ArtifactCache(workspace_root)
+        packages = cache_packages = _restore_cached_packages(
+            cache,
+            workspace_root,
+            packages,
+            no_deps,
+            key_arguments,
+            install_base or "install",
+        )
+        if len(packages) == 0:
+            print_info("All packages are up to date or were restored from the cache.")
+            return _create_install_setup_files(
+                workspace_root, build_base, install_base or "install", env
+            )
+        no_deps = True
     arguments = []
     if build_base is not None:
         arguments += ["--build-base", build_base]
     if install_base is not None:
         arguments += ["--install-base", install_base]
-    if colcon_override_check is not None and any(packages):
+    # Only check whether colcon_override_check is installed, importing it is not necessary
+    if importlib.util.find_spec("colcon_override_check") is not None and any(packages):
         arguments += ["--allow-overriding"] + packages
     if continue_on_error:
         arguments += ["--continue-on-error"]
@@ -45,10 +153,14 @@ def build_packages(
         cmake_arguments.append(f"-DCMAKE_BUILD_TYPE={build_type}")
     if build_tests:
         cmake_arguments.append("-DBUILD_TESTING=ON")
+    launcher = _get_compiler_cache(workspace_root, compiler_cache)
+    if launcher is not None:
+        cmake_arguments += launcher.get_cmake_arguments()
+        env = dict(env if env is not None else os.environ)
+        env.update(launcher.get_environment())
     if any(cmake_arguments):
-        arguments += ["--cmake-args"] + list(
-            map(lambda x: f"' {shlex.quote(x)}'", cmake_arguments)
-        )
+        # The leading space prevents colcon from interpreting the arguments as its own
+        arguments += ["--cmake-args"] + [f" {x}" for x in cmake_arguments]
     if mixin and len(mixin) > 0:
         arguments += ["--mixin"] + mixin
 
@@ -56,20 +168,435 @@ def build_packages(
         arguments += ["--packages-up-to"] if not no_deps else ["--packages-select"]
         arguments += packages
 
+    parallel_jobs = None
+    if memory_aware:
+        env = dict(env if env is not None else os.environ)
+        workers, parallel_jobs = _choose_parallelism(workspace_root, packages)
+        arguments += ["--parallel-workers", str(workers)]
+        env["MAKEFLAGS"] = f"-j{parallel_jobs}"
+        env["CMAKE_BUILD_PARALLEL_LEVEL"] = str(parallel_jobs)
+
+    colcon = ["colcon"]
+    durations = get_expected_durations(load_build_history(workspace_root))
+    if critical_path:
+        env = dict(env if env is not None else os.environ)
+        env[DURATIONS_ENVIRONMENT_VARIABLE] = json.dumps(durations)
+        colcon = [sys.executable, "-m", "tuda_workspace_scripts.scheduling"]
+
     print_info("Command:")
-    print(f"colcon build {' '.join(arguments)}")
+    print(shlex.join(colcon + ["build"] + arguments))
     print_info(f">>> Running in {workspace_root}")
     if verbose:
-        os.environ["VERBOSE"] = "1"
+        env = dict(env if env is not None else os.environ)
+        env["VERBOSE"] = "1"
         arguments += ["--event-handlers", "console_cohesion+", "console_direct+"]
-    command = subprocess.run(
-        f'colcon build {" ".join(arguments)}',
-        stdout=sys.stdout,
-        stderr=sys.stderr,
-        shell=True,
+    # Show a compact live view unless the full output was requested or nobody is watching
+    live_view = not verbose and sys.stdout.isatty()
+    progress = None
+    log_file = None
+    if live_view:
+        index = load_package_index(workspace_root)
+        names = _get_packages_to_build(index, packages, no_deps)
+        progress = BuildProgress(
+            len(names),
+            durations,
+            {n: index.get_dependencies([n], ["build", "run"]) & names for n in names},
+            _get_parallel_workers(arguments),
+        )
+        # colcon creates its log directory for this build only after starting, move the log there afterwards
+        os.makedirs(os.path.join(workspace_root, "log"), exist_ok=True)
+        log_path = os.path.join(workspace_root, "log", f".console_{os.getpid()}.log")
+        log_file = open(log_path, "wb")
+    launcher_statistics = launcher.get_statistics() if launcher is not None else None
+    started = time.time()
+    process = subprocess.Popen(
+        colcon + ["build"] + arguments,
+        stdout=subprocess.PIPE if live_view else sys.stdout,
+        stderr=subprocess.STDOUT if live_view else sys.stderr,
         env=env,
     )
-    return command.returncode
+    monitor = BuildMonitor(process.pid, build_base or "build")
+    monitor.start()
+    watchdog = None
+    if memory_aware:
+        watchdog = MemoryWatchdog(process.pid, build_base or "build")
+        if not watchdog.start():
+            print_warn(
+                "psutil is not installed! Jobs are not paused on high memory usage."
+            )
+    try:
+        if progress is not None:
+            stream_build_output(process.stdout, log_file, progress)
+        returncode = process.wait()
+    except KeyboardInterrupt:
+        process.kill()
+        process.wait()
+        raise
+    finally:
+        usage = monitor.stop()
+        if watchdog is not None:
+            watchdog.stop()
+        if log_file is not None:
+            log_file.close()
+            log_path = _move_console_log(workspace_root, log_path, started)
+    if progress is not None:
+        _print_build_result(progress, log_path)
+    if launcher is not None:
+        statistics = format_compiler_cache_statistics(
+            launcher.tool, launcher_statistics, launcher.get_statistics()
+        )
+        if statistics is not None:
+            print_info(statistics)
+    if watchdog is not None and watchdog.paused_count > 0:
+        print_warn(
+            f"Paused jobs {watchdog.paused_count} times due to high memory usage."
+        )
+    built = _record_build(
+        workspace_root,
+        started,
+        returncode,
+        usage,
+        parallel_jobs,
+        progress.results if progress is not None else None,
+    )
+    _update_artifact_cache(
+        workspace_root,
+        cache,
+        cache_packages,
+        key_arguments,
+        built,
+        returncode,
+        install_base or "install",
+        build_base or "build",
+    )
+    if returncode == 0 and source_manifests is not None:
+        manifests = load_source_manifests(workspace_root)
+        manifests.update(source_manifests)
+        try:
+            save_source_manifests(workspace_root, manifests)
+        except OSError:
+            pass  # Workspace not writable, the packages will be considered changed next time
+    start_log_retention(workspace_root)
+    return returncode
+
+
+def watch_and_build(
+    workspace_root: str,
+    packages: list[str] | None = None,
+    no_deps: bool = False,
+    with_dependents: bool = False,
+    debounce: float = 0.5,
+    **kwargs,
+) -> None:
+    """
+    Watch the sources of the given packages (and their dependencies unless no_deps is set) or all packages and
+    rebuild the changed packages until interrupted.
+    :param with_dependents: Also rebuild the watched packages depending on the changed packages.
+    :param debounce: The time in seconds without further changes before a build is started.
+    :param kwargs: Further arguments passed to build_packages.
+    """
+    index = load_package_index(workspace_root)
+    names = _get_packages_to_build(index, packages, no_deps)
+    watcher = PackageWatcher({name: index.packages[name].path for name in names})
+    if watcher.is_polling:
+        print_warn("inotify is not available! Polling for changes instead.")
+    try:
+        while True:
+            print_info(
+                f">>> Watching {len(names)} packages for changes. Press Ctrl+C to stop."
+            )
+            changed = watcher.wait_for_changes(debounce)
+            selected = set(changed)
+            if with_dependents:
+                selected |= index.get_dependents(changed, ["build", "run"]) & names
+            print_info(f">>> Changed: {', '.join(sorted(changed))}")
+            build_packages(workspace_root, sorted(selected), no_deps=True, **kwargs)
+    finally:
+        watcher.close()
+
+
+def print_build_schedule(
+    workspace_root: str,
+    packages: list[str] | None = None,
+    no_deps: bool = False,
+    workers: int | None = None,
+) -> None:
+    """
+    Print the predicted wall time of building the given packages (or all packages) with colcon's order and with
+    the critical path order based on the durations of previous builds.
+    """
+    index = load_package_index(workspace_root)
+    names = _get_packages_to_build(index, packages, no_deps)
+    dependencies = {
+        name: index.get_dependencies([name], ["build", "run"]) & names for name in names
+    }
+    durations = get_expected_durations(load_build_history(workspace_root))
+    print_schedule_report(dependencies, durations, workers or os.cpu_count() or 1)
+
+
+def _get_packages_to_build(index, packages, no_deps) -> set[str]:
+    """
+    :return: The names of the packages colcon builds for the given packages, i.e., the packages and their
+        dependencies unless no_deps is set, or all packages in the workspace if no packages are given.
+    """
+    if not packages:
+        return set(index.packages.keys())
+    names = set(packages)
+    if not no_deps:
+        names |= index.get_dependencies(packages, ["build", "run"])
+    return names & set(index.packages.keys())
+
+
+def _get_parallel_workers(arguments) -> int:
+    if "--parallel-workers" in arguments:
+        return int(arguments[arguments.index("--parallel-workers") + 1])
+    return os.cpu_count() or 1
+
+
+def _move_console_log(workspace_root, log_path, started) -> str:
+    """
+    Move the console log into the log directory colcon created for the build.
+    :return: The new path of the console log or the old path if colcon did not create a log directory.
+    """
+    latest_build = os.path.join(workspace_root, "log", "latest_build")
+    try:
+        if os.stat(latest_build).st_mtime >= started:
+            new_path = os.path.join(os.path.realpath(latest_build), "console.log")
+            os.replace(log_path, new_path)
+            return new_path
+    except OSError:
+        pass
+    return log_path
+
+
+def _print_build_result(progress: BuildProgress, log_path) -> None:
+    failed = [
+        name for name, result in progress.results.items() if result["returncode"] != 0
+    ]
+    for name in failed:
+        if not progress.stderr.get(name, None):
+            continue
+        print_header(f"stderr of {name}")
+        print("\n".join(progress.stderr[name]))
+    for line in progress.summary:
+        print(line)
+    print_info(f"Full output: {log_path}")
+
+
+def _get_compiler_cache(workspace_root, tool) -> CompilerCache | None:
+    """
+    :param tool: The compiler cache or None to use the compiler_cache config variable.
+    :return: The workspace-local compiler cache or None if it is disabled or not installed.
+    """
+    config = load_config()
+    if tool is None:
+        tool = config.variables["compiler_cache"]
+    if not tool or tool == "none":
+        return None
+    if tool not in COMPILER_CACHES:
+        print_warn(f"Unknown compiler cache {tool}! Building without compiler cache.")
+        return None
+    launcher = CompilerCache(
+        tool,
+        get_compiler_cache_path(workspace_root, tool),
+        float(config.variables["compiler_cache_size"] or DEFAULT_COMPILER_CACHE_SIZE),
+        base_dir=workspace_root,
+    )
+    if not launcher.is_available():
+        print_warn(f"{tool} is not installed! Building without compiler cache.")
+        return None
+    return launcher
+
+
+def _choose_parallelism(workspace_root, packages) -> tuple[int, int]:
+    """
+    :return: The number of parallel workers and make jobs per worker for the available memory.
+    """
+    job_memory = get_job_memory(load_build_history(workspace_root), packages or None)
+    available_memory = get_available_memory()
+    if available_memory is None:
+        print_warn("Could not determine the available memory!")
+        cpu_count = os.cpu_count() or 1
+        return cpu_count, 1
+    workers, jobs = estimate_parallelism(available_memory, job_memory)
+    print_info(
+        f"Using {workers} parallel workers with {jobs} jobs each for {available_memory / (1 << 30):.1f} GB available"
+        f" memory and up to {job_memory / (1 << 30):.1f} GB per job."
+    )
+    return workers, jobs
+
+
+def _record_build(
+    workspace_root, started, returncode, usage, parallel_jobs=None, results=None
+) -> dict[str, dict]:
+    """
+    Record the duration, CPU time, peak memory and result of every package built by the last colcon invocation
+    in the build history. Durations and results are taken from colcon's event log if available, otherwise from
+    the results parsed from the console output.
+    :return: The recorded packages by name.
+    """
+    events_path = os.path.join(workspace_root, "log", "latest_build", "events.log")
+    events = results or {}
+    try:
+        if os.stat(events_path).st_mtime >= started:
+            events = parse_colcon_events(events_path)
+    except OSError:
+        pass
+    packages = {}
+    for name in set(events.keys()) | set(usage.keys()):
+        event = events.get(name, {})
+        package_usage = usage.get(name, None)
+        duration = event.get("duration", None)
+        if duration is None and package_usage is not None:
+            duration = package_usage.end - package_usage.start
+        if event.get("returncode", None) is not None:
+            success = event["returncode"] == 0
+        else:
+            success = returncode == 0
+        packages[name] = {
+            "duration": duration,
+            "cpu_time": package_usage.cpu_time if package_usage else None,
+            "peak_rss": package_usage.peak_rss if package_usage else None,
+            "success": success,
+        }
+    try:
+        record_build(
+            workspace_root,
+            {
+                "time": started,
+                "duration": time.time() - started,
+                "returncode": returncode,
+                "parallel_jobs": parallel_jobs,
+                "packages": packages,
+            },
+        )
+    except OSError:
+        pass  # Workspace not writable, the build is just not recorded
+    return packages
+
+
+def _restore_cached_packages(
+    cache: ArtifactCache, workspace_root, packages, no_deps, key_arguments, install_base
+) -> list[str]:
+    """
+    Restore the install trees of the packages that are in the artifact cache.
+    The packages are processed in topological order since their keys depend on the install trees of their
+    dependencies. Packages depending on a package that has to be built are built as well.
+    :return: The names of the packages that still need to be built.
+    """
+    index = load_package_index(workspace_root)
+    names = _get_packages_to_build(index, packages, no_deps)
+    dependencies = {name: index.get_dependencies([name]) & names for name in names}
+    remaining = []
+    restored = []
+    for name in get_topological_order(dependencies):
+        if dependencies[name] & set(remaining):
+            remaining.append(name)
+            continue
+        key = cache.compute_keys(index, [name], key_arguments, install_base)[name]
+        if cache.is_installed(name, key, install_base):
+            continue
+        try:
+            if cache.restore(name, key, install_base):
+                restored.append(name)
+                continue
+        except OSError as e:
+            print_warn(f"Failed to restore {name} from the cache: {e}")
+        remaining.append(name)
+    try:
+        cache.save()
+    except OSError:
+        pass  # Workspace not writable, the keys are computed from scratch next time
+    if any(restored):
+        print_info(
+            f"Restored {len(restored)} packages from the cache: {', '.join(restored)}"
+        )
+    return sorted(remaining)
+
+
+def _create_install_setup_files(workspace_root, build_base, install_base, env) -> int:
+    """
+    Create the setup files of the install base (setup.bash, local_setup.*, ...) if they are missing, e.g., because
+    all packages were restored from the artifact cache after cleaning the workspace.
+    They are created by colcon even if all packages are skipped.
+    :return: The return code of colcon or 0 if the files exist.
+    """
+    if os.path.isfile(
+        os.path.join(install_base, ".colcon_install_layout")
+    ) and os.path.isfile(os.path.join(install_base, "local_setup.sh")):
+        return 0
+    command = ["colcon", "build", "--install-base", install_base]
+    if build_base is not None:
+        command += ["--build-base", build_base]
+    command += ["--packages-skip"] + get_packages_in_workspace(workspace_root)
+    print_info("Creating the setup files of the workspace.")
+    return subprocess.run(
+        command, cwd=workspace_root, env=env, stdout=subprocess.DEVNULL
+    ).returncode
+
+
+def _update_artifact_cache(
+    workspace_root,
+    cache,
+    packages,
+    key_arguments,
+    built,
+    returncode,
+    install_base,
+    build_base,
+) -> None:
+    """
+    Store the successfully built packages in the artifact cache and evict the least recently used entries.
+    Without cache, only forget the cache keys of the built packages since their install trees changed.
+    :param packages: The packages that were built with the cache.
+    """
+    if cache is None:
+        cache = ArtifactCache(workspace_root)
+        if not os.path.isdir(cache.path):
+            return
+    cache.forget_installed(set(built.keys()) | set(packages))
+    successful = [
+        name
+        for name in packages
+        if (built[name]["success"] if name in built else returncode == 0)
+    ]
+    if any(successful):
+        # The keys are computed now since they depend on the install trees of the dependencies built with them
+        index = load_package_index(workspace_root)
+        keys = cache.compute_keys(index, successful, key_arguments, install_base)
+        for name, key in keys.items():
+            try:
+                cache.store(name, key, install_base, build_base)
+            except OSError as e:
+                print_warn(f"Failed to store {name} in the cache: {e}")
+        max_size = load_config().variables["artifact_cache_size"]
+        cache.evict(int(float(max_size or DEFAULT_MAX_CACHE_SIZE) * (1 << 30)))
+    try:
+        cache.save()
+    except OSError:
+        pass  # Workspace not writable
+
+
+def _select_changed_packages(
+    workspace_root, packages, no_deps, build_base
+) -> tuple[list[str], dict[str, dict]]:
+    """
+    :return: The names of the packages that need to be built and the source manifests of these packages.
+    """
+    index = load_package_index(workspace_root)
+    candidates = _get_packages_to_build(index, packages, no_deps)
+    previous = load_source_manifests(workspace_root)
+    current = scan_packages(
+        {name: index.packages[name].path for name in candidates}, previous
+    )
+    changed = find_changed_packages(previous, current)
+    # Packages that were never built, e.g., after cleaning them, have to be built as well
+    build_base = os.path.join(workspace_root, build_base or "build")
+    changed |= {
+        name for name in candidates if not os.path.isdir(os.path.join(build_base, name))
+    }
+    selected = changed | (index.get_dependents(changed, ["build", "run"]) & candidates)
+    return sorted(selected), {name: current[name] for name in selected}
 
 
 def clean_logs(workspace_root, packages=None, force=False):
@@ -81,7 +608,8 @@ def clean_logs(workspace_root, packages=None, force=False):
         return 1
     print("  {}/log".format(os.getcwd()))
     if force or confirm("Continue?"):
-        shutil.rmtree("log", ignore_errors=True)
+        move_to_trash(workspace_root, "log")
+        start_reaper(workspace_root)
     else:
         print_info("Not deleted.")
 
@@ -107,19 +635,21 @@ def clean_packages(workspace_root, packages, force=False) -> bool:
 
         if any(packages):
             for package in packages:
-                shutil.rmtree(f"build/{package}", ignore_errors=True)
-                shutil.rmtree(f"install/{package}", ignore_errors=True)
+                move_to_trash(workspace_root, f"build/{package}")
+                move_to_trash(workspace_root, f"install/{package}")
             ament_prefix_path = get_ament_prefix_path_without_packages(packages)
             cmake_prefix_path = get_cmake_prefix_path_without_packages(packages)
             print_info(f">>> {len(packages)} package cleaned.")
         else:
-            shutil.rmtree("build", ignore_errors=True)
-            shutil.rmtree("install", ignore_errors=True)
-            shutil.rmtree("log", ignore_errors=True)
+            move_to_trash(workspace_root, "build")
+            move_to_trash(workspace_root, "install")
+            move_to_trash(workspace_root, "log")
             ament_prefix_path = get_ament_prefix_path_without_workspace(workspace_root)
             cmake_prefix_path = get_cmake_prefix_path_without_workspace(workspace_root)
             print_info(f">>> All packages cleaned.")
 
+        # Delete the moved directories in the background
+        start_reaper(workspace_root)
         if ament_prefix_path is not None:
             os.environ["AMENT_PREFIX_PATH"] = ament_prefix_path
         if cmake_prefix_path is not None:
@@ -130,9 +660,66 @@ def clean_packages(workspace_root, packages, force=False) -> bool:
         os.chdir(original_path)
 
 
+def clean_stale(workspace_root, force=False) -> bool:
+    """
+    Remove the build, install and log directories of packages that no longer exist in the workspace.
+    :return: False if the user declined.
+    """
+    index = load_package_index(workspace_root)
+    stale = find_stale_directories(workspace_root, index.packages.keys())
+    if len(stale) == 0:
+        print_info("No stale packages found.")
+        return True
+    print("I will delete the directories of these packages:")
+    for name in sorted(stale.keys()):
+        kinds = {os.path.basename(os.path.dirname(path)) for path in stale[name]}
+        kinds = sorted({k if k in ARTIFACT_DIRECTORIES else "log" for k in kinds})
+        print(f"  {name} ({', '.join(kinds)})")
+    if not force and not confirm("Continue?"):
+        print_info("Not deleted.")
+        return False
+    for paths in stale.values():
+        for path in paths:
+            move_to_trash(workspace_root, path)
+    start_reaper(workspace_root)
+    print_info(f">>> {len(stale)} stale packages cleaned.")
+    return True
+
+
 # docker run --rm -it -v ~/workspaces/noetic/src:/workspace/src:ro -v /tmp/install:/workspace/install:rw --env ROS_DISTRO=noetic --platform arm64 cross-compile-arm64 workspace_scripts
 
 
+def get_cross_compile_tag(
+    ros_distro: str, platform: str, base_image: str | None = None
+) -> str:
+    """
+    :return: The tag of the cross-compile image for the ROS distro (or base image) and platform.
+    """
+    platform_cleaned = platform.replace(":", "_").replace("/", "_")
+    if base_image is None:
+        return f"cross-compile-{ros_distro}-{platform_cleaned}"
+    base_image_cleaned = base_image.replace(":", "_").replace("/", "_")
+    return f"cross-compile-{base_image_cleaned}-{platform_cleaned}"
+
+
+def stop_cross_compile_containers(
+    ros_distro: str | None = None,
+    platform: str | None = None,
+    base_image: str | None = None,
+) -> list[str]:
+    """
+    Stop the cross-compile containers kept running for subsequent builds.
+    :param platform: If given, only the container for this platform and ROS distro (or base image) is stopped.
+    :return: The names of the stopped containers.
+    """
+    import docker
+
+    tag = None
+    if platform is not None:
+        tag = get_cross_compile_tag(ros_distro, platform, base_image)
+    return stop_workers(docker.from_env(), tag)
+
+
 def cross_compile(
     packages: str | list[str],
     ros_distro: str,
@@ -145,8 +732,25 @@ def cross_compile(
     rebuild: bool = False,
     pull: bool = False,
     base_image: str | None = None,
+    compiler_cache: str | None = None,
+    idle_timeout: float | None = None,
+    compare_hashes: bool = False,
+    hardlink: bool = False,
 ) -> bool:
+    """
+    Build the given packages for another platform in a docker container.
+    The container is kept running as worker for subsequent builds with the same image, see CrossCompileWorker.
+    :param compiler_cache: The compiler cache (ccache or sccache) used in the container or "none".
+        Defaults to the compiler_cache config variable. The cache is kept in the .cache folder of the workspace.
+    :param idle_timeout: Minutes after the build after which the container is stopped if it is not used again.
+        Defaults to the cross_compile_idle_timeout config variable. If 0, the container is stopped after the build.
+    :param compare_hashes: Whether to compare the content of output files whose modification time changed instead of
+        copying them.
+    :param hardlink: Whether to hardlink the output files instead of copying them if possible, see sync_tree.
+    :return: True if the packages were built successfully.
+    """
     import docker
+    from ament_index_python import get_package_share_path
 
     # if packages is iterable, join them
     if isinstance(packages, list):
@@ -156,32 +760,31 @@ def cross_compile(
         output_dir = output_base_dir
         output_dir = os.path.join(output_dir, ros_distro, platform_cleaned)
     os.makedirs(output_dir, exist_ok=True)
+    tag = get_cross_compile_tag(ros_distro, platform, base_image)
     if base_image is None:
-        tag = f"cross-compile-{ros_distro}-{platform_cleaned}"
         print_info(f">>> Obtain image for {ros_distro} on {platform}")
     else:
-        base_image_cleaned = base_image.replace(":", "_").replace("/", "_")
-        tag = f"cross-compile-{base_image_cleaned}-{platform_cleaned}"
         print_info(f">>> Obtain image based on {base_image} for {platform}")
     docker_client = docker.from_env()
+    path = get_package_share_path("tuda_workspace_scripts") / "docker/cross_compile"
+    if not os.path.isfile(path / "Dockerfile"):
+        raise RuntimeError(f"Could not find Dockerfile in {path}")
+    buildargs = {
+        "BASE_IMAGE": base_image,
+        "ROS_DISTRO": ros_distro,
+        "USER_ID": f"{os.getuid()}",
+        "GROUP_ID": f"{os.getgid()}",
+    }
+    content_hash = get_image_content_hash(path, buildargs)
     if not rebuild:
         try:
             image = docker_client.images.get(tag)
-            created = (
-                datetime.now(timezone.utc)
-                if "Created" not in image.attrs
-                else parse_date(image.attrs["Created"])
-            )
-            if (datetime.now(timezone.utc) - created).days > 14:
-                print("Container might be outdated. Rebuilding without cache...")
+            if image.labels.get(CONTENT_HASH_LABEL) != content_hash:
+                print("Image is outdated. Rebuilding...")
                 rebuild = True
-                no_cache = True
         except docker.errors.ImageNotFound:
             rebuild = True
     if rebuild:
-        path = get_package_share_path("tuda_workspace_scripts") / "docker/cross_compile"
-        if not os.path.isfile(path / "Dockerfile"):
-            raise RuntimeError(f"Could not find Dockerfile in {path}")
         if base_image is not None:
             print_info(f">>> Pulling {base_image}")
             result = docker_client.api.pull(
@@ -222,12 +825,8 @@ def cross_compile(
             decode=True,
             path=path.as_posix(),
             tag=tag,
-            buildargs={
-                "BASE_IMAGE": base_image,
-                "ROS_DISTRO": ros_distro,
-                "USER_ID": f"{os.getuid()}",
-                "GROUP_ID": f"{os.getgid()}",
-            },
+            buildargs=buildargs,
+            labels={CONTENT_HASH_LABEL: content_hash},
             platform=platform,
             pull=pull,
             rm=True,
@@ -235,27 +834,19 @@ def cross_compile(
             nocache=no_cache,
             use_config_proxy=True,
         )
-
-        output = StatusOutput(12)
-        full_log = ""
-        for item in result:
-            if "stream" in item:
-                text = item["stream"].strip()
-                if text:
-                    full_log += text + "\n"
-                    output.status(text)
-            if "errorDetail" in item:
-                output.clear()
-                print(full_log)
-                print_error(item["errorDetail"]["message"])
-                return False
-        output.clear()
+        if not _print_docker_build(result):
+            return False
         print(f"Done. Built image as {tag}")
     else:
         print(f"Using existing image {tag}")
+    image = _get_dependency_image(
+        docker_client, tag, packages.split(), ros_distro, platform, no_cache
+    )
+    if image is None:
+        return False
     print_info(f">>> Cross-compiling {packages}")
     output = StatusOutput(10)
-    container = None
+    worker = None
     try:
         tmp_path = f"/tmp/tudawss/{tag}"
         if clean:
@@ -273,67 +864,175 @@ def cross_compile(
         os.makedirs(f"{tmp_path}/devel", exist_ok=True)
         os.makedirs(f"{tmp_path}/install", exist_ok=True)
         os.makedirs(f"{tmp_path}/log", exist_ok=True)
-        container = docker_client.containers.run(
-            tag,
-            command=f"{packages}",
-            volumes={
-                os.path.join(get_workspace_root(), "src"): {
-                    "bind": "/workspace/src",
-                    "mode": "ro",
-                },
-                f"{tmp_path}/build": {
-                    "bind": "/workspace/build",
-                    "mode": "rw",
-                },
-                f"{tmp_path}/devel": {
-                    "bind": "/workspace/devel",
-                    "mode": "rw",
-                },
-                f"{tmp_path}/install": {
-                    "bind": "/workspace/install",
-                    "mode": "rw",
-                },
-                f"{tmp_path}/log": {
-                    "bind": "/workspace/log",
-                    "mode": "rw",
-                },
-                f"{tmp_path}/log": {
-                    "bind": "/workspace/logs",
-                    "mode": "rw",
-                },
+        # The dependencies are already installed in the image
+        environment = {"BUILD_TYPE": build_type, "SKIP_ROSDEP": "1"}
+        volumes = {}
+        if compiler_cache is None:
+            compiler_cache = load_config().variables["compiler_cache"]
+        if compiler_cache in COMPILER_CACHES:
+            # Separate cache per image since the compilers and cache versions differ
+            cache_path = (
+                f"{get_compiler_cache_path(get_workspace_root(), compiler_cache)}_{tag}"
+            )
+            os.makedirs(cache_path, exist_ok=True)
+            volumes[cache_path] = {"bind": "/compiler_cache", "mode": "rw"}
+            launcher = CompilerCache(
+                compiler_cache,
+                "/compiler_cache",
+                float(
+                    load_config().variables["compiler_cache_size"]
+                    or DEFAULT_COMPILER_CACHE_SIZE
+                ),
+                base_dir="/workspace",
+            )
+            environment.update(launcher.get_environment())
+            environment["COMPILER_CACHE"] = compiler_cache
+        volumes = {
+            os.path.join(get_workspace_root(), "src"): {
+                "bind": "/workspace/src",
+                "mode": "ro",
             },
-            environment={"BUILD_TYPE": build_type},
-            platform=platform,
-            detach=True,
-            stdout=True,
-            stderr=True,
+            f"{tmp_path}/build": {
+                "bind": "/workspace/build",
+                "mode": "rw",
+            },
+            f"{tmp_path}/devel": {
+                "bind": "/workspace/devel",
+                "mode": "rw",
+            },
+            f"{tmp_path}/install": {
+                "bind": "/workspace/install",
+                "mode": "rw",
+            },
+            f"{tmp_path}/log": {
+                "bind": "/workspace/log",
+                "mode": "rw",
+            },
+            f"{tmp_path}/log": {
+                "bind": "/workspace/logs",
+                "mode": "rw",
+            },
+            **volumes,
+        }
+        if idle_timeout is None:
+            idle_timeout = load_config().variables["cross_compile_idle_timeout"]
+            idle_timeout = (
+                DEFAULT_IDLE_TIMEOUT if idle_timeout is None else float(idle_timeout)
+            )
+        worker = CrossCompileWorker(
+            docker_client, tag, platform, volumes, idle_timeout, image=image
         )
-        for line in container.logs(stream=True):
-            text: str = line.decode("utf-8").strip()
+        if worker.start():
+            output.status(f"Reusing running container {worker.name}")
+        else:
+            output.status(f"Started container {worker.name}")
+
+        def on_output(text: str):
+            text = text.strip()
             if ">>> Building workspace" in text:
                 output.clear()
                 output.disable_overwrite()
             if text:
                 output.status(text)
-        result = container.wait()
-        if result["StatusCode"] != 0:
-            print_error(
-                f"Cross-compilation failed with exit code {result['StatusCode']}"
-            )
+
+        returncode = worker.run(
+            ["/usr/bin/cross_compile"] + packages.split(), environment, on_output
+        )
+        if returncode != 0:
+            print_error(f"Cross-compilation failed with exit code {returncode}")
             return False
         print_info(f">>> Copying results")
-        # Copy install folder to workspace
-        shutil.copytree(f"{tmp_path}/install", output_dir, dirs_exist_ok=True)
-        print(f"Copied build results to {output_dir}")
-    except docker.errors.ContainerError as e:
-        print_error(f"Failed to cross-compile {packages}:")
-        print(e.stderr.decode("utf-8"), file=sys.stderr)
+        # Only copy the files that changed since the last cross-compilation
+        sync_result = sync_tree(
+            f"{tmp_path}/install",
+            output_dir,
+            compare_hashes=compare_hashes,
+            hardlink=hardlink,
+        )
+        print(
+            f"Copied build results to {output_dir}: {sync_result.copied} files copied "
+            f"({format_size(sync_result.copied_bytes)}), {sync_result.deleted} deleted, "
+            f"{sync_result.unchanged} unchanged."
+        )
+    except docker.errors.APIError as e:
+        print_error(f"Failed to cross-compile {packages}: {e}")
+        return False
+    except FileExistsError as e:
+        print_error(f"Failed to copy the build results to {output_dir}: {e}")
         return False
     except KeyboardInterrupt:
-        if container is not None:
-            container.kill()
+        if worker is not None:
+            worker.stop()
             print_info("Container killed.")
     finally:
-        if container is not None:
-            container.remove()
+        if worker is not None and idle_timeout == 0:
+            worker.stop()
+    return True
+
+
+def _get_dependency_image(
+    docker_client, tag, packages: list[str], ros_distro, platform, no_cache=False
+) -> str | None:
+    """
+    Get the cross-compile image with the system dependencies of the packages installed and build it if necessary.
+    :return: The tag of the image or None if building the image failed.
+    """
+    import docker
+
+    index = load_package_index(get_workspace_root())
+    base_image = docker_client.images.get(tag)
+    dependencies = get_system_dependencies(
+        index,
+        packages or list(index.packages.keys()),
+        get_target_environment(base_image, ros_distro),
+    )
+    if not dependencies:
+        return tag
+    base_image_id = base_image.id
+    image = get_dependency_image_tag(tag, base_image_id, dependencies)
+    try:
+        docker_client.images.get(image)
+        print(f"Using existing image {image} with {len(dependencies)} dependencies")
+        return image
+    except docker.errors.ImageNotFound:
+        pass
+    print_info(f">>> Installing {len(dependencies)} dependencies into {image}")
+    result = docker_client.api.build(
+        decode=True,
+        fileobj=create_dependency_image_context(tag, dependencies),
+        custom_context=True,
+        tag=image,
+        labels={BASE_IMAGE_LABEL: base_image_id},
+        platform=platform,
+        rm=True,
+        forcerm=True,
+        nocache=no_cache,
+        use_config_proxy=True,
+    )
+    if not _print_docker_build(result):
+        return None
+    print(f"Done. Built image as {image}")
+    remove_stale_dependency_images(docker_client, tag, base_image_id)
+    return image
+
+
+def _print_docker_build(result) -> bool:
+    """
+    Show the output of a docker build as status and print it completely if the build fails.
+    :return: True if the build succeeded.
+    """
+    output = StatusOutput(12)
+    full_log = ""
+    for item in result:
+        if "stream" in item:
+            text = item["stream"].strip()
+            if text:
+                full_log += text + "\n"
+                output.status(text)
+        if "errorDetail" in item:
+            output.clear()
+            print(full_log)
+            print_error(item["errorDetail"]["message"])
+            return False
+    output.clear()
     return True
@@ -0,0 +1,239 @@
+"""
+History of the builds in a workspace with the wall time, CPU time, peak memory usage and result of every package.
+"""
+
+from .print import Colors, print_color, print_header, print_success, TableOutput
+from datetime import datetime
+import json
+import os
+import re
+import statistics
+
+# Version of the on-disk format. Bump if the structure of the history changes.
+BUILD_HISTORY_VERSION = 1
+# Number of builds that are kept in the history
+MAX_BUILD_HISTORY = 100
+# A package regressed if its last build took REGRESSION_FACTOR times as long as the median of the previous builds
+# and at least REGRESSION_MIN_SECONDS longer
+REGRESSION_FACTOR = 1.5
+REGRESSION_MIN_SECONDS = 5.0
+
+# Line format of colcon's events.log: [<seconds since start>] (<package>) <event type>: <event data>
+_EVENT_PATTERN = re.compile(
+    r"^\[(\d+(?:\.\d+)?)\] \((.+?)\) (JobStarted|JobEnded): (.*)$"
+)
+_RETURN_CODE_PATTERN = re.compile(r"'rc': (-?\d+)")
+
+
+def get_build_history_path(workspace_root) -> str:
+    return os.path.join(workspace_root, ".config", "build_history.json")
+
+
+def load_build_history(workspace_root) -> list[dict]:
+    """
+    :return: The recorded builds, oldest first. Each build is a dict with the start time (seconds since epoch),
+        duration, return code and a dict of packages with their duration, cpu_time, peak_rss and success.
+        cpu_time and peak_rss are None if they were not measured.
+    """
+    try:
+        with open(get_build_history_path(workspace_root), "r") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return []
+    if not isinstance(data, dict) or data.get("version") != BUILD_HISTORY_VERSION:
+        return []
+    return data.get("builds", [])
+
+
+def record_build(workspace_root, build: dict) -> None:
+    """
+    Append a build to the history. Only the last MAX_BUILD_HISTORY builds are kept.
+    """
+    history = load_build_history(workspace_root) + [build]
+    path = get_build_history_path(workspace_root)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(
+            {
+                "version": BUILD_HISTORY_VERSION,
+                "builds": history[-MAX_BUILD_HISTORY:],
+            },
+            f,
+        )
+    os.replace(tmp_path, path)
+
+
+def parse_colcon_events(path) -> dict[str, dict]:
+    """
+    Parse the events.log of a colcon invocation.
+    :return: The duration in seconds and return code (None if the job did not finish) of every package job.
+    """
+    started = {}
+    result = {}
+    try:
+        with open(path, "r", errors="replace") as f:
+            for line in f:
+                match = _EVENT_PATTERN.match(line)
+                if match is None:
+                    continue
+                timestamp, package, event, data = match.groups()
+                if event == "JobStarted":
+                    started[package] = float(timestamp)
+                    result[package] = {"duration": None, "returncode": None}
+                elif package in started:
+                    return_code = _RETURN_CODE_PATTERN.search(data)
+                    result[package] = {
+                        "duration": float(timestamp) - started[package],
+                        "returncode": (
+                            int(return_code.group(1)) if return_code else None
+                        ),
+                    }
+    except OSError:
+        pass
+    return result
+
+
+def get_package_durations(
+    history: list[dict], last_n: int | None = None, successful_only=True
+) -> dict[str, list[float]]:
+    """
+    :param last_n: Only consider the last n builds. If None, all builds are considered.
+    :return: The durations of the builds of every package, oldest first.
+    """
+    result = {}
+    for build in history[-last_n:] if last_n else history:
+        for name, package in build["packages"].items():
+            if package["duration"] is None:
+                continue
+            if successful_only and not package["success"]:
+                continue
+            result.setdefault(name, []).append(package["duration"])
+    return result
+
+
+def get_expected_durations(history: list[dict], last_n: int = 10) -> dict[str, float]:
+    """
+    :return: The median duration of the last successful builds of every package in seconds.
+    """
+    return {
+        name: statistics.median(durations)
+        for name, durations in get_package_durations(history, last_n).items()
+    }
+
+
+def find_regressions(
+    history: list[dict], last_n: int | None = None
+) -> dict[str, tuple[float, float]]:
+    """
+    :return: The packages whose last successful build took considerably longer than the median of the previous ones
+        with their last duration and the median of the previous durations.
+    """
+    result = {}
+    for name, durations in get_package_durations(history, last_n).items():
+        if len(durations) < 3:
+            continue
+        median = statistics.median(durations[:-1])
+        last = durations[-1]
+        if last > median * REGRESSION_FACTOR and last - median > REGRESSION_MIN_SECONDS:
+            result[name] = (last, median)
+    return result
+
+
+def format_duration(seconds: float | None) -> str:
+    if seconds is None:
+        return "-"
+    if seconds < 60:
+        return f"{seconds:.1f}s"
+    minutes, seconds = divmod(int(seconds), 60)
+    if minutes < 60:
+        return f"{minutes}m {seconds:02d}s"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m"
+
+
+def format_size(size: int | None) -> str:
+    if size is None:
+        return "-"
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def print_build_stats(workspace_root, last_n: int = 10, max_packages: int = 20) -> None:
+    """
+    Print the slowest packages, the trend of the last builds and packages whose build time regressed.
+    :param last_n: The number of builds that are considered.
+    :param max_packages: The maximum number of packages that are listed.
+    """
+    history = load_build_history(workspace_root)
+    if len(history) == 0:
+        print_color(Colors.ORANGE, "No builds recorded yet.")
+        return
+    builds = history[-last_n:]
+
+    print_header(f"Slowest packages in the last {len(builds)} builds")
+    durations = get_package_durations(builds)
+    slowest = sorted(durations.keys(), key=lambda n: -statistics.mean(durations[n]))
+    table = TableOutput(
+        ["Package", "Last", "Average", "Trend", "CPU time", "Peak memory", "Failures"]
+    )
+    for name in slowest[:max_packages]:
+        last = next(
+            b["packages"][name]
+            for b in reversed(builds)
+            if name in b["packages"] and b["packages"][name]["success"]
+        )
+        average = statistics.mean(durations[name])
+        trend = "-"
+        if len(durations[name]) > 1:
+            previous = statistics.mean(durations[name][:-1])
+            if previous > 0:
+                trend = f"{(durations[name][-1] - previous) / previous * 100:+.0f}%"
+        failures = sum(
+            1
+            for b in builds
+            if name in b["packages"] and not b["packages"][name]["success"]
+        )
+        table.add_row(
+            [
+                name,
+                format_duration(last["duration"]),
+                format_duration(average),
+                trend,
+                format_duration(last.get("cpu_time")),
+                format_size(last.get("peak_rss")),
+                str(failures),
+            ]
+        )
+    table.print()
+    print()
+
+    print_header("Last builds")
+    table = TableOutput(["Date", "Duration", "Packages", "Failed"])
+    for build in builds:
+        failed = [n for n, p in build["packages"].items() if not p["success"]]
+        table.add_row(
+            [
+                datetime.fromtimestamp(build["time"]).strftime("%Y-%m-%d %H:%M"),
+                format_duration(build["duration"]),
+                str(len(build["packages"])),
+                ", ".join(sorted(failed)) if failed else "-",
+            ]
+        )
+    table.print()
+    print()
+
+    print_header("Regressions")
+    regressions = find_regressions(builds)
+    if len(regressions) == 0:
+        print_success("No regressions.")
+    for name, (last, median) in sorted(
+        regressions.items(), key=lambda item: item[1][1] - item[1][0]
+    ):
+        print_color(
+            Colors.ORANGE,
+            f"{name}: {format_duration(last)} (median {format_duration(median)})",
+        )
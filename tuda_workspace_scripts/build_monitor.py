@@ -0,0 +1,133 @@
+"""
+Samples the processes of a running colcon build to measure the CPU time and memory usage of each package.
+Uses psutil if it is available, otherwise nothing is measured.
+"""
+
+import os
+import threading
+import time
+
+
+class PackageUsage:
+    # Wall clock times (seconds since epoch) at which processes of the package were first and last seen
+    start: float
+    end: float
+    # CPU time in seconds including all (already reaped) child processes
+    cpu_time: float
+    # Peak of the summed resident set size of all processes of the package in bytes
+    peak_rss: int
+
+    def __init__(self, start) -> None:
+        self.start = start
+        self.end = start
+        self.cpu_time = 0.0
+        self.peak_rss = 0
+
+
+class BuildMonitor:
+    """
+    Periodically samples the process tree of a colcon build and attributes the processes to packages based on their
+    working directory, which for all processes building a package is inside BUILD_BASE/PACKAGE_NAME.
+    """
+
+    def __init__(self, pid: int, build_base: str, interval: float = 0.5) -> None:
+        self._pid = pid
+        self._build_base = os.path.join(os.path.abspath(build_base), "")
+        self._interval = interval
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._usage: dict[str, PackageUsage] = {}
+        # pid -> (package, cpu time including reaped children) of the processes seen in the last sample
+        self._alive: dict[int, tuple[str, float]] = {}
+        self._parents: dict[int, int] = {}
+        # Accumulated CPU time of processes that ended and whose parent is not part of the same package
+        self._finished_cpu_time: dict[str, float] = {}
+
+    def start(self) -> bool:
+        """
+        Start sampling in a background thread.
+        :return: False if psutil is not available and nothing is measured.
+        """
+        try:
+            import psutil
+        except ImportError:
+            return False
+        self._thread = threading.Thread(target=self._run, args=(psutil,), daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self) -> dict[str, PackageUsage]:
+        """
+        Stop sampling.
+        :return: The measured usage by package name.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self._usage
+
+    def _run(self, psutil) -> None:
+        while not self._stop_event.wait(self._interval):
+            self._sample(psutil)
+
+    def _get_package(self, cwd: str) -> str | None:
+        if not cwd.startswith(self._build_base):
+            return None
+        package = cwd[len(self._build_base) :].split(os.sep, 1)[0]
+        return package or None
+
+    def _sample(self, psutil) -> None:
+        try:
+            root = psutil.Process(self._pid)
+            processes = [root] + root.children(recursive=True)
+        except psutil.Error:
+            return
+        now = time.time()
+        sample: dict[int, tuple[str, int, float, int]] = {}
+        for process in processes:
+            try:
+                with process.oneshot():
+                    package = self._get_package(process.cwd())
+                    if package is None:
+                        continue
+                    cpu = process.cpu_times()
+                    sample[process.pid] = (
+                        package,
+                        process.ppid(),
+                        cpu.user + cpu.system + cpu.children_user + cpu.children_system,
+                        process.memory_info().rss,
+                    )
+            except psutil.Error:
+                continue  # Ended in the meantime
+
+        # Processes that ended are accounted for in the CPU time of their parent once it reaps them.
+        # Only if the parent is not part of the package (e.g. colcon itself), their last CPU time is kept.
+        for pid, (package, process_cpu_time) in self._alive.items():
+            if pid in sample:
+                continue
+            parent = self._parents.get(pid, None)
+            if parent in sample and sample[parent][0] == package:
+                continue
+            self._finished_cpu_time[package] = (
+                self._finished_cpu_time.get(package, 0.0) + process_cpu_time
+            )
+
+        rss: dict[str, int] = {}
+        cpu_time: dict[str, float] = dict(self._finished_cpu_time)
+        for pid, (package, _, process_cpu_time, process_rss) in sample.items():
+            rss[package] = rss.get(package, 0) + process_rss
+            cpu_time[package] = cpu_time.get(package, 0.0) + process_cpu_time
+        for package in rss.keys():
+            usage = self._usage.get(package, None)
+            if usage is None:
+                usage = self._usage[package] = PackageUsage(now)
+            usage.end = now
+            usage.peak_rss = max(usage.peak_rss, rss[package])
+        for package, value in cpu_time.items():
+            if package in self._usage:
+                # Only grows, processes that were reaped between samples might be missing for one sample
+                self._usage[package].cpu_time = max(
+                    self._usage[package].cpu_time, value
+                )
+        self._alive = {pid: (entry[0], entry[2]) for pid, entry in sample.items()}
+        self._parents = {pid: entry[1] for pid, entry in sample.items()}
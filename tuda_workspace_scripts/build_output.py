@@ -0,0 +1,186 @@
+"""
+Compact live view of a colcon build.
+The console output of colcon is written to a log file and parsed to show the active packages, the progress and
+the estimated remaining time in a bounded status output instead of flooding the terminal.
+"""
+
+from .build_history import format_duration
+from .print import Colors, print_color, StatusOutput
+from .scheduling import compute_critical_path_weights, get_default_duration
+import queue
+import re
+import threading
+import time
+
+# Console output of colcon's console_start_end, console_stderr and summary event handlers
+_STARTED_PATTERN = re.compile(r"^Starting >>> (\S+)")
+_ENDED_PATTERN = re.compile(
+    r"^(Finished|Failed|Aborted)\s+<<< (\S+)(?: \[([\d.]+)s(?:, exited with code (-?\d+))?)?"
+)
+_STDERR_START_PATTERN = re.compile(r"^--- stderr: (\S+)")
+_STDERR_END = "---"
+_SUMMARY_START = "Summary:"
+
+
+class BuildProgress:
+    """
+    Keeps track of the state of a colcon build from its console output.
+    """
+
+    def __init__(
+        self,
+        total: int,
+        durations: dict[str, float] | None = None,
+        dependencies: dict[str, set[str]] | None = None,
+        workers: int = 1,
+    ) -> None:
+        """
+        :param total: The number of packages that are expected to be built.
+        :param durations: The expected durations of the packages used to estimate the remaining time.
+        :param dependencies: The dependencies of the packages that are built used to estimate the remaining time.
+        :param workers: The number of parallel workers.
+        """
+        self.total = total
+        self.started = time.monotonic()
+        # Start time of the active packages
+        self.active: dict[str, float] = {}
+        # Duration and return code of the finished packages
+        self.results: dict[str, dict] = {}
+        # stderr output of the packages
+        self.stderr: dict[str, list[str]] = {}
+        self.summary: list[str] = []
+        self._durations = durations or {}
+        self._default_duration = get_default_duration(self._durations)
+        self._weights = compute_critical_path_weights(
+            dependencies or {}, self._durations
+        )
+        self._workers = max(1, workers)
+        self._stderr_package = None
+        self._in_summary = False
+
+    def process_line(self, line: str) -> tuple[str, str] | None:
+        """
+        Update the state with a line of colcon's console output.
+        :return: The color and message that should be printed permanently or None.
+        """
+        if self._in_summary:
+            self.summary.append(line)
+            return None
+        if self._stderr_package is not None:
+            if line == _STDERR_END:
+                self._stderr_package = None
+            else:
+                self.stderr[self._stderr_package].append(line)
+            return None
+        match = _STARTED_PATTERN.match(line)
+        if match:
+            self.active[match.group(1)] = time.monotonic()
+            return None
+        match = _ENDED_PATTERN.match(line)
+        if match:
+            result, package, duration, returncode = match.groups()
+            started = self.active.pop(package, None)
+            if duration is None and started is not None:
+                duration = time.monotonic() - started
+            self.results[package] = {
+                "duration": float(duration) if duration is not None else None,
+                "returncode": (0 if result == "Finished" else int(returncode or 1)),
+            }
+            if result == "Finished":
+                return Colors.GREEN, line
+            return Colors.RED, line
+        match = _STDERR_START_PATTERN.match(line)
+        if match:
+            self._stderr_package = match.group(1)
+            self.stderr.setdefault(self._stderr_package, [])
+            return None
+        if line.startswith(_SUMMARY_START):
+            self._in_summary = True
+            self.summary.append(line)
+        return None
+
+    def get_eta(self) -> float | None:
+        """
+        :return: The estimated remaining time in seconds or None if nothing is known about the packages.
+        """
+        if not self._durations:
+            return None
+        now = time.monotonic()
+        remaining_work = 0.0
+        longest_path = 0.0
+        for package, weight in self._weights.items():
+            if package in self.results:
+                continue
+            duration = self._durations.get(package, self._default_duration)
+            remaining = duration
+            if package in self.active:
+                remaining = max(0.0, duration - (now - self.active[package]))
+            remaining_work += remaining
+            longest_path = max(longest_path, weight - duration + remaining)
+        return max(longest_path, remaining_work / self._workers)
+
+    def get_status_lines(self) -> list[str]:
+        now = time.monotonic()
+        done = len(self.results)
+        total = max(self.total, done + len(self.active))
+        failed = sum(1 for r in self.results.values() if r["returncode"] != 0)
+        status = f"[{done}/{total} done"
+        if failed:
+            status += f", {failed} failed"
+        status += f"] {format_duration(now - self.started)}"
+        eta = self.get_eta()
+        if eta is not None:
+            status += f", ETA {format_duration(eta)}"
+        lines = [status]
+        for package, started in sorted(self.active.items(), key=lambda item: item[1]):
+            lines.append(f"  {package} ({format_duration(now - started)})")
+        return lines
+
+
+def stream_build_output(
+    stream, log_file, progress: BuildProgress, max_active_lines: int = 10
+) -> None:
+    """
+    Write the output of colcon to the log file and show the progress in a bounded status output until the
+    stream is closed. Finished and failed packages are printed permanently above the status output.
+    :param stream: The binary stdout pipe of colcon.
+    :param log_file: A binary file the full output is written to.
+    """
+    lines = queue.Queue()
+
+    def read():
+        # Read in a thread so the elapsed time is updated while colcon is silent
+        for line in stream:
+            lines.put(line)
+        lines.put(None)
+
+    threading.Thread(target=read, daemon=True).start()
+    output = StatusOutput(max_active_lines + 1)
+
+    def render():
+        output.clear()
+        output.status("\n".join(progress.get_status_lines()[: max_active_lines + 1]))
+
+    try:
+        render()
+        while True:
+            try:
+                line = lines.get(timeout=1)
+            except queue.Empty:
+                render()
+                continue
+            if line is None:
+                break
+            log_file.write(line)
+            # colcon's status event handler rewrites lines using carriage returns
+            text = line.decode(errors="replace").rstrip("\n").split("\r")[-1]
+            message = progress.process_line(text)
+            if message is not None:
+                output.clear()
+                print_color(*message)
+            # Render at most once per batch of lines to keep up with fast output
+            if lines.empty():
+                render()
+    finally:
+        output.clear()
+        log_file.flush()
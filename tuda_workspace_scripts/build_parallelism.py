@@ -0,0 +1,172 @@
+"""
+Chooses the number of parallel colcon workers and make jobs from the available memory and the memory usage of
+previous builds and pauses compile jobs while the memory pressure is high to avoid swapping.
+"""
+
+import math
+import os
+import threading
+
+# Memory assumed for a compile job if there is no history for any of the packages
+DEFAULT_JOB_MEMORY = 1 << 30
+# Fraction of the available memory that the build may use
+MEMORY_BUDGET = 0.8
+# The watchdog pauses jobs if the used memory is above PAUSE_THRESHOLD and resumes them below RESUME_THRESHOLD
+PAUSE_THRESHOLD = 0.9
+RESUME_THRESHOLD = 0.8
+
+
+def get_available_memory() -> int | None:
+    """
+    :return: The memory available for new processes without swapping in bytes or None if it can not be determined.
+    """
+    try:
+        import psutil
+
+        return psutil.virtual_memory().available
+    except ImportError:
+        pass
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def get_job_memory(history: list[dict], packages=None, last_n: int = 10) -> int:
+    """
+    Estimate the peak memory of a single compile job from the peak memory of the packages in the last builds.
+    :param packages: The packages that will be built. If None, all packages in the history are considered.
+    :return: The largest peak memory per job in bytes or DEFAULT_JOB_MEMORY if nothing is known.
+    """
+    result = 0
+    for build in history[-last_n:]:
+        jobs = build.get("parallel_jobs", None) or os.cpu_count() or 1
+        for name, package in build["packages"].items():
+            if packages is not None and name not in packages:
+                continue
+            if package.get("peak_rss"):
+                result = max(result, package["peak_rss"] // jobs)
+    return result or DEFAULT_JOB_MEMORY
+
+
+def estimate_parallelism(
+    available_memory: int, job_memory: int, cpu_count: int | None = None
+) -> tuple[int, int]:
+    """
+    Choose the number of parallel colcon workers and the number of jobs for each worker such that
+    the total number of jobs neither exceeds the number of CPUs nor the memory budget.
+    :return: The number of workers and the number of jobs per worker.
+    """
+    cpu_count = cpu_count or os.cpu_count() or 1
+    total_jobs = int(available_memory * MEMORY_BUDGET // max(1, job_memory))
+    total_jobs = max(1, min(cpu_count, total_jobs))
+    # Workers only help if packages can be built concurrently while jobs help within a package, so split evenly
+    workers = max(1, math.ceil(math.sqrt(total_jobs)))
+    return workers, max(1, total_jobs // workers)
+
+
+class MemoryWatchdog:
+    """
+    Pauses (SIGSTOP) the youngest compile jobs of a build while the memory usage is above PAUSE_THRESHOLD
+    and resumes them once it fell below RESUME_THRESHOLD. At least one job is always kept running.
+    Compile jobs are the processes without children in the build base.
+    """
+
+    def __init__(self, pid: int, build_base: str, interval: float = 0.5) -> None:
+        self._pid = pid
+        self._build_base = os.path.join(os.path.abspath(build_base), "")
+        self._interval = interval
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._paused = []
+        self.paused_count = 0
+
+    def start(self) -> bool:
+        """
+        Start the watchdog in a background thread.
+        :return: False if psutil is not available.
+        """
+        try:
+            import psutil
+        except ImportError:
+            return False
+        self._thread = threading.Thread(target=self._run, args=(psutil,), daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self) -> None:
+        """
+        Stop the watchdog and resume all paused jobs.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self, psutil) -> None:
+        try:
+            while not self._stop_event.wait(self._interval):
+                self._check(psutil)
+        finally:
+            for process in self._paused:
+                try:
+                    process.resume()
+                except psutil.Error:
+                    pass
+            self._paused = []
+
+    def _get_jobs(self, psutil) -> list[tuple[float, object]]:
+        """
+        :return: The creation time and process of all compile jobs.
+        """
+        try:
+            processes = psutil.Process(self._pid).children(recursive=True)
+        except psutil.Error:
+            return []
+        parents = set()
+        candidates = []
+        for process in processes:
+            try:
+                parents.add(process.ppid())
+                if process.cwd().startswith(self._build_base):
+                    candidates.append((process.create_time(), process))
+            except psutil.Error:
+                continue
+        return [(t, p) for t, p in candidates if p.pid not in parents]
+
+    def _check(self, psutil) -> None:
+        self._paused = [p for p in self._paused if p.is_running()]
+        used = psutil.virtual_memory().percent / 100
+        if not self._paused and used <= PAUSE_THRESHOLD:
+            return
+        paused_pids = {p.pid for p in self._paused}
+        running = [
+            job for job in self._get_jobs(psutil) if job[1].pid not in paused_pids
+        ]
+        if len(running) == 0 and self._paused:
+            # Everything else finished, never keep all jobs paused whatever the memory usage. Paused jobs keep
+            # their memory, so it would not fall below RESUME_THRESHOLD and the build would hang.
+            self._resume_next(psutil)
+            return
+        if used > PAUSE_THRESHOLD:
+            if len(running) <= 1:
+                return
+            _, youngest = max(running, key=lambda job: job[0])
+            try:
+                youngest.suspend()
+                self._paused.append(youngest)
+                self.paused_count += 1
+            except psutil.Error:
+                pass
+        elif used < RESUME_THRESHOLD and self._paused:
+            self._resume_next(psutil)
+
+    def _resume_next(self, psutil) -> None:
+        # Resume jobs in the order they were paused
+        try:
+            self._paused.pop(0).resume()
+        except psutil.Error:
+            pass
@@ -0,0 +1,117 @@
+"""
+Compiler caches (ccache or sccache) used as compiler launcher for all packages of a build with a workspace-local
+cache directory and size limit.
+"""
+
+import json
+import os
+import shutil
+import subprocess
+
+COMPILER_CACHES = ["ccache", "sccache"]
+# Default size limit of the compiler cache in GB
+DEFAULT_COMPILER_CACHE_SIZE = 5
+
+
+def get_compiler_cache_path(workspace_root, tool: str) -> str:
+    return os.path.join(workspace_root, ".cache", tool)
+
+
+class CompilerCache:
+    def __init__(self, tool: str, path: str, max_size: float, base_dir=None) -> None:
+        """
+        :param tool: The compiler cache, one of COMPILER_CACHES.
+        :param path: The directory of the cache.
+        :param max_size: The size limit of the cache in GB.
+        :param base_dir: Paths below this directory are rewritten to relative paths to share cache entries between
+            different locations of the same sources (only supported by ccache).
+        """
+        if tool not in COMPILER_CACHES:
+            raise ValueError(f"Unknown compiler cache {tool}!")
+        self.tool = tool
+        self.path = path
+        self.max_size = max_size
+        self.base_dir = base_dir
+
+    def is_available(self) -> bool:
+        return shutil.which(self.tool) is not None
+
+    def get_environment(self) -> dict[str, str]:
+        """
+        :return: The environment variables that configure the cache directory and size limit.
+        """
+        if self.tool == "ccache":
+            env = {"CCACHE_DIR": self.path, "CCACHE_MAXSIZE": self._get_size()}
+            if self.base_dir is not None:
+                env["CCACHE_BASEDIR"] = self.base_dir
+            return env
+        return {"SCCACHE_DIR": self.path, "SCCACHE_CACHE_SIZE": self._get_size()}
+
+    def get_cmake_arguments(self) -> list[str]:
+        return [
+            f"-DCMAKE_C_COMPILER_LAUNCHER={self.tool}",
+            f"-DCMAKE_CXX_COMPILER_LAUNCHER={self.tool}",
+        ]
+
+    def get_statistics(self) -> tuple[int, int] | None:
+        """
+        :return: The total number of cache hits and misses since the statistics were last zeroed or None if the
+            statistics could not be obtained.
+        """
+        if self.tool == "ccache":
+            output = self._run(["--print-stats"])
+            if output is None:
+                return None
+            stats = {}
+            for line in output.splitlines():
+                key, _, value = line.partition("\t")
+                if value.isdigit():
+                    stats[key] = int(value)
+            return (
+                stats.get("direct_cache_hit", 0)
+                + stats.get("preprocessed_cache_hit", 0),
+                stats.get("cache_miss", 0),
+            )
+        output = self._run(["--show-stats", "--stats-format", "json"])
+        if output is None:
+            return None
+        try:
+            stats = json.loads(output)["stats"]
+            return (
+                sum(stats["cache_hits"]["counts"].values()),
+                sum(stats["cache_misses"]["counts"].values()),
+            )
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return None
+
+    def _get_size(self) -> str:
+        # Both caches only reliably parse integral sizes
+        return f"{int(self.max_size * 1024)}M"
+
+    def _run(self, arguments) -> str | None:
+        try:
+            result = subprocess.run(
+                [self.tool] + arguments,
+                env={**os.environ, **self.get_environment()},
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                text=True,
+            )
+        except OSError:
+            return None
+        return result.stdout if result.returncode == 0 else None
+
+
+def format_compiler_cache_statistics(
+    tool: str, before: tuple[int, int] | None, after: tuple[int, int] | None
+) -> str | None:
+    """
+    :return: A summary of the hits and misses between the two statistics or None if they are not known.
+    """
+    if before is None or after is None:
+        return None
+    hits = max(0, after[0] - before[0])
+    misses = max(0, after[1] - before[1])
+    if hits + misses == 0:
+        return f"{tool}: No cacheable compiler calls."
+    return f"{tool}: {hits} hits, {misses} misses ({hits / (hits + misses) * 100:.0f}% hit rate)"
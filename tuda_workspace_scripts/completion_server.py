@@ -0,0 +1,243 @@
+"""
+Resident completion server.
+Keeps the modules required for completing the tuda_wss commands as well as the package and robot indexes loaded
+and completes a command by forking itself and running the command's script in the child.
+This avoids starting a new python interpreter and importing everything on every TAB.
+"""
+
+import importlib
+import json
+import os
+import runpy
+import select
+import socket
+import struct
+import sys
+import time
+
+# Exit code used by the client if the server is not available. The caller should fall back to running the script.
+UNAVAILABLE = 111
+# Modules that are imported on start up to keep them warm. Missing modules are ignored.
+WARM_MODULES = [
+    "argcomplete",
+    "argparse",
+    "yaml",
+    "colcon_core.package_identification",
+    "ament_index_python",
+    "jinja2",
+    "libtmux",
+    "tuda_workspace_scripts",
+    "tuda_workspace_scripts.build",
+    "tuda_workspace_scripts.completion",
+    "tuda_workspace_scripts.config",
+    "tuda_workspace_scripts.robots",
+    "tuda_workspace_scripts.tmux",
+    "tuda_workspace_scripts.workspace",
+]
+COMPLETION_TIMEOUT = 10
+
+
+def get_completion_socket_path() -> str:
+    """
+    :return: The path of the completion server socket. Can be overwritten with the TUDA_WSS_COMPLETION_SOCKET
+        environment variable. Has to match the path used in the bash completion functions.
+    """
+    path = os.environ.get("TUDA_WSS_COMPLETION_SOCKET", None)
+    if path:
+        return path
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR", None) or "/tmp"
+    return os.path.join(runtime_dir, f"tuda_wss_completion_{os.getuid()}.sock")
+
+
+def send_request(request: dict, socket_path: str | None = None, timeout=5) -> bytes:
+    """
+    Send a request to the completion server and return the raw response.
+    @raises OSError if the server is not running.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path or get_completion_socket_path())
+        sock.sendall(json.dumps(request).encode())
+        sock.shutdown(socket.SHUT_WR)
+        chunks = []
+        while chunk := sock.recv(65536):
+            chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def is_server_running(socket_path: str | None = None) -> bool:
+    try:
+        return send_request({"command": "ping"}, socket_path) == b"0\n"
+    except OSError:
+        return False
+
+
+def _warm_up():
+    for module in WARM_MODULES:
+        try:
+            importlib.import_module(module)
+        except Exception:
+            pass
+    try:
+        try:
+            from colcon_core.plugin_system import get_package_identification_extensions
+        except ImportError:
+            from colcon_core.package_identification import (
+                get_package_identification_extensions,
+            )
+        get_package_identification_extensions()
+    except Exception:
+        pass
+
+
+def _refresh_workspace_state(cwd: str) -> None:
+    """
+    Load the package and robot indexes for the working directory and environment of the caller
+    so that forked children inherit them.
+    """
+    from .package_index import load_package_index
+    from .robots import load_robots
+    from .workspace import get_workspace_root
+
+    workspace_root = get_workspace_root(cwd)
+    if workspace_root is not None:
+        load_package_index(workspace_root)
+    load_robots()
+
+
+def _run_completion(script: str, output_fd: int) -> None:
+    """
+    Runs in the forked child. Executes the script like the completion functions do and never returns.
+    argcomplete writes the completions to fd 8 and debug output to fd 9.
+    """
+    code = 1
+    try:
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in (0, 1, 2, 9):
+            os.dup2(devnull, fd)
+        os.dup2(output_fd, 8)
+        sys.argv = [script]
+        sys.path.insert(0, os.path.dirname(script))
+        runpy.run_path(script, run_name="__main__")
+        code = 0
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else 1
+    except BaseException:
+        code = 1
+    finally:
+        os._exit(code)
+
+
+def _complete(request: dict, server_socket: socket.socket) -> bytes:
+    script = request["script"]
+    cwd = request["cwd"]
+    os.environ.clear()
+    os.environ.update(request["environment"])
+    os.chdir(cwd)
+    try:
+        _refresh_workspace_state(cwd)
+    except Exception:
+        pass  # The child will try again and report errors like the script would
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        server_socket.close()
+        os.close(read_fd)
+        _run_completion(script, write_fd)
+    os.close(write_fd)
+    output = b""
+    deadline = time.monotonic() + COMPLETION_TIMEOUT
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                os.kill(pid, 9)
+                break
+            ready, _, _ = select.select([read_fd], [], [], remaining)
+            if not ready:
+                continue
+            chunk = os.read(read_fd, 65536)
+            if not chunk:
+                break
+            output += chunk
+    finally:
+        os.close(read_fd)
+        _, status = os.waitpid(pid, 0)
+    code = os.waitstatus_to_exitcode(status)
+    return f"{code if code >= 0 else 1}\n".encode() + output
+
+
+def _get_peer_uid(connection: socket.socket) -> int:
+    credentials = connection.getsockopt(
+        socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")
+    )
+    _, uid, _ = struct.unpack("3i", credentials)
+    return uid
+
+
+def serve(socket_path: str | None = None, idle_timeout: float | None = None) -> None:
+    """
+    Run the completion server until it receives a stop request or was idle for idle_timeout seconds.
+    """
+    socket_path = socket_path or get_completion_socket_path()
+    if is_server_running(socket_path):
+        return
+    _warm_up()
+    try:
+        os.unlink(socket_path)
+    except FileNotFoundError:
+        pass
+    server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o177)
+    try:
+        server_socket.bind(socket_path)
+    finally:
+        os.umask(old_umask)
+    socket_inode = os.stat(socket_path).st_ino
+    server_socket.listen(8)
+    server_socket.settimeout(idle_timeout)
+    try:
+        while True:
+            try:
+                connection, _ = server_socket.accept()
+            except socket.timeout:
+                return
+            with connection:
+                connection.settimeout(COMPLETION_TIMEOUT)
+                if _get_peer_uid(connection) != os.getuid():
+                    continue
+                try:
+                    chunks = []
+                    while chunk := connection.recv(65536):
+                        chunks.append(chunk)
+                    request = json.loads(b"".join(chunks))
+                    if request["command"] == "stop":
+                        connection.sendall(b"0\n")
+                        return
+                    if request["command"] == "ping":
+                        connection.sendall(b"0\n")
+                        continue
+                    connection.sendall(_complete(request, server_socket))
+                except Exception:
+                    try:
+                        connection.sendall(f"{UNAVAILABLE}\n".encode())
+                    except OSError:
+                        pass
+    finally:
+        server_socket.close()
+        # Only remove the socket if it was not replaced by another server in the meantime
+        try:
+            if os.stat(socket_path).st_ino == socket_inode:
+                os.unlink(socket_path)
+        except OSError:
+            pass
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--socket", default=None)
+    parser.add_argument("--idle-timeout", type=float, default=None)
+    args = parser.parse_args()
+    serve(args.socket, args.idle_timeout)
@@ -4,13 +4,24 @@ import os
 from typing import Any, Iterator
 import yaml
 
-# Use the environment variable TUDA_WSS_CONFIG to specify a config file.
-# If not specified, default to WORKSPACE_ROOT/.config/tuda_workspace_scripts.yaml
-CONFIG_FILE_PATH = os.getenv("TUDA_WSS_CONFIG", None)
-if CONFIG_FILE_PATH is None:
-    CONFIG_FILE_PATH = get_workspace_root()
-    if CONFIG_FILE_PATH is not None:
-        CONFIG_FILE_PATH += "/.config/tuda_workspace_scripts.yaml"
+
+def get_config_file_path() -> str | None:
+    # Use the environment variable TUDA_WSS_CONFIG to specify a config file.
+    # If not specified, default to WORKSPACE_ROOT/.config/tuda_workspace_scripts.yaml
+    path = os.getenv("TUDA_WSS_CONFIG", None)
+    if path is None:
+        path = get_workspace_root()
+        if path is not None:
+            path += "/.config/tuda_workspace_scripts.yaml"
+    return path
+
+
+def __getattr__(name):
+    # CONFIG_FILE_PATH is resolved on access since looking up the workspace root at import time is slow
+    # and would not follow changes of the working directory.
+    if name == "CONFIG_FILE_PATH":
+        return get_config_file_path()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class Variable:
@@ -50,7 +61,9 @@ class Config(object):
             self._config = None
         if self._config is None:
             self._config = {}
-        self.variables = _ConfigVariables(self._config["variables"] if 'variables' in self._config else {})
+        self.variables = _ConfigVariables(
+            self._config["variables"] if "variables" in self._config else {}
+        )
 
     def save(self) -> None:
         os.makedirs(os.path.dirname(self._path), exist_ok=True)
@@ -61,7 +74,7 @@ class Config(object):
 
 
 def load_config() -> Config:
-    return Config(CONFIG_FILE_PATH)
+    return Config(get_config_file_path())
 
 
 def load_variables() -> Iterator[Variable]:
@@ -0,0 +1,168 @@
+"""
+Images for cross-compilation with the system dependencies of the cross-compiled packages already installed.
+The dependencies are collected from the package.xml files of the packages and installed with rosdep into an image
+derived from the cross-compile image. The tag of the derived image is a hash of the dependencies and the base image,
+so rosdep only runs again if the dependencies or the base image change.
+"""
+
+from .package_index import read_package_dependencies
+import hashlib
+import io
+import json
+import os
+import tarfile
+
+# Label of the cross-compile image with the hash of the files and arguments it was built from
+CONTENT_HASH_LABEL = "tuda_wss.content_hash"
+# Label of the derived images with the id of the image they are based on
+BASE_IMAGE_LABEL = "tuda_wss.base_image"
+# Tag prefix of the derived images. The repository is the one of the cross-compile image.
+DEPENDENCY_TAG_PREFIX = "deps-"
+_DOCKERFILE = """FROM {image}
+COPY package.xml install_dependencies.sh /tmp/tuda_wss_dependencies/
+RUN /bin/bash /tmp/tuda_wss_dependencies/install_dependencies.sh
+"""
+# Keys that can not be resolved for the distro are skipped. rosdep runs without -r, so failed installations fail the
+# build and the image is not tagged. Otherwise, transient failures would be baked into the image.
+_INSTALL_SCRIPT = """set -e
+sudo apt-get update
+rosdep update --rosdistro "$ROS_DISTRO"
+skip_keys=()
+for key in {keys}; do
+  if ! rosdep resolve --rosdistro "$ROS_DISTRO" "$key" > /dev/null 2>&1; then
+    echo "Skipping $key which can not be resolved for $ROS_DISTRO."
+    skip_keys+=("$key")
+  fi
+done
+rosdep install -i -y --rosdistro "$ROS_DISTRO" --from-paths /tmp/tuda_wss_dependencies \\
+  --skip-keys "${{skip_keys[*]}}"
+sudo rm -rf /var/lib/apt/lists/*
+"""
+_PACKAGE_XML = """<?xml version="1.0"?>
+<package format="3">
+  <name>tuda_wss_cross_compile_dependencies</name>
+  <version>0.0.0</version>
+  <description>System dependencies of the cross-compiled packages</description>
+  <maintainer email="none@example.com">none</maintainer>
+  <license>none</license>
+{dependencies}
+</package>
+"""
+
+
+def get_image_content_hash(path, buildargs: dict) -> str:
+    """
+    :param path: The directory with the Dockerfile of the cross-compile image.
+    :return: A hash of the files in the directory and the build arguments of the image.
+    """
+    h = hashlib.sha1(json.dumps(buildargs, sort_keys=True).encode())
+    for name in sorted(os.listdir(path)):
+        file_path = os.path.join(path, name)
+        if os.path.isfile(file_path):
+            with open(file_path, "rb") as f:
+                h.update(f"{name}\0".encode() + f.read() + b"\0")
+    return h.hexdigest()
+
+
+def get_target_environment(image, ros_distro) -> dict[str, str]:
+    """
+    :param image: The cross-compile image.
+    :return: The variables used to evaluate the conditions in the package.xml files for the target, i.e., the
+        environment of the image with the ROS_DISTRO of the target. ROS_VERSION defaults to 2 if the image does not
+        set it.
+    """
+    variables = (image.attrs.get("Config") or {}).get("Env") or []
+    environment = dict(variable.partition("=")[::2] for variable in variables)
+    environment["ROS_DISTRO"] = ros_distro
+    environment.setdefault("ROS_VERSION", "2")
+    return environment
+
+
+def get_system_dependencies(index, packages, environment: dict[str, str]) -> list[str]:
+    """
+    The dependencies in the package index were evaluated for the host, so the package.xml files are read again to
+    evaluate their conditions for the target.
+    :param index: The package index of the workspace.
+    :param packages: The cross-compiled packages.
+    :param environment: The variables of the target used in the conditions, see get_target_environment.
+    :return: The rosdep keys of the dependencies of the packages and of the workspace packages they depend on that
+        are not packages in the workspace.
+    """
+    names = set(packages) & set(index.packages.keys())
+    queue = list(names)
+    dependencies = set()
+    while queue:
+        package = index.packages[queue.pop()]
+        categories = read_package_dependencies(
+            os.path.join(package.path, "package.xml"), environment
+        )
+        for dependency in set().union(*categories.values()):
+            dependencies.add(dependency)
+            if dependency in index.packages and dependency not in names:
+                names.add(dependency)
+                queue.append(dependency)
+    return sorted(dependencies - set(index.packages.keys()))
+
+
+def get_dependency_image_tag(tag, base_image_id, dependencies: list[str]) -> str:
+    """
+    :param tag: The tag of the cross-compile image.
+    :param base_image_id: The id of the cross-compile image.
+    :return: The tag of the image with the dependencies installed.
+    """
+    # The install script is part of the hash, so images installed with an older version are not reused
+    h = hashlib.sha1(
+        json.dumps([base_image_id, sorted(dependencies), _INSTALL_SCRIPT]).encode()
+    )
+    return f"{tag}:{DEPENDENCY_TAG_PREFIX}{h.hexdigest()[:16]}"
+
+
+def create_dependency_image_context(tag, dependencies: list[str]) -> io.BytesIO:
+    """
+    :return: A tar archive with the Dockerfile of the image with the dependencies installed on top of the given image.
+    """
+    from xml.sax.saxutils import escape
+    import shlex
+
+    files = {
+        "Dockerfile": _DOCKERFILE.format(image=tag),
+        "install_dependencies.sh": _INSTALL_SCRIPT.format(
+            keys=" ".join(shlex.quote(name) for name in dependencies)
+        ),
+        "package.xml": _PACKAGE_XML.format(
+            dependencies="\n".join(
+                f"  <depend>{escape(name)}</depend>" for name in dependencies
+            )
+        ),
+    }
+    context = io.BytesIO()
+    with tarfile.open(fileobj=context, mode="w") as archive:
+        for name, content in files.items():
+            data = content.encode()
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    context.seek(0)
+    return context
+
+
+def remove_stale_dependency_images(docker_client, tag, base_image_id) -> int:
+    """
+    Remove the images with dependencies that are based on an outdated version of the cross-compile image.
+    Images that are still used by a container are kept.
+    :return: The number of removed images.
+    """
+    removed = 0
+    for image in docker_client.images.list(name=tag.split(":")[0]):
+        if image.labels.get(BASE_IMAGE_LABEL) in (None, base_image_id):
+            continue
+        for image_tag in image.tags:
+            if image_tag.split(":")[-1].startswith(DEPENDENCY_TAG_PREFIX):
+                try:
+                    docker_client.images.remove(image_tag)
+                    removed += 1
+                except Exception as e:
+                    # Conflict if still used by a container
+                    if getattr(e, "status_code", None) not in (404, 409):
+                        raise
+    return removed
@@ -0,0 +1,190 @@
+"""
+Persistent worker containers for cross-compilation.
+Starting a container (especially under QEMU emulation) is a large share of the time of small rebuilds, hence a worker
+container is kept running per image and builds are run in it using docker exec. The worker stops itself after it was
+idle for the configured time and is removed by docker.
+Only the containers, images and api attributes of the docker client are used, so the worker can be tested with a stub
+client.
+"""
+
+import hashlib
+import json
+
+# Label of all worker containers, the value is a hash of the configuration of the worker
+WORKER_LABEL = "tuda_wss.cross_compile_worker"
+# Default idle time in minutes after which a worker stops itself
+DEFAULT_IDLE_TIMEOUT = 30
+# Held (shared) by every build, the worker only stops if it can acquire it exclusively, i.e., no build is running
+_LOCK_PATH = "/tmp/tuda_wss_worker.lock"
+_LAST_USED_PATH = "/tmp/tuda_wss_worker.last_used"
+_KEEPALIVE_SCRIPT = f"""
+touch {_LAST_USED_PATH}
+while sleep 10; do
+  if ! flock -n {_LOCK_PATH} true; then
+    touch {_LAST_USED_PATH}
+  elif [ $(( $(date +%s) - $(stat -c %Y {_LAST_USED_PATH}) )) -ge "$IDLE_TIMEOUT" ]; then
+    exit 0
+  fi
+done
+"""
+
+
+def get_worker_name(tag) -> str:
+    return f"tuda_wss-worker-{tag}"
+
+
+class CrossCompileWorker:
+    def __init__(
+        self,
+        docker_client,
+        tag: str,
+        platform: str,
+        volumes: dict,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+        image: str | None = None,
+    ) -> None:
+        """
+        :param tag: The tag of the cross-compile image. There is at most one worker per tag.
+        :param volumes: The volumes of the worker in the format of docker's containers.run.
+        :param idle_timeout: The time in minutes after the last build after which the worker stops itself.
+        :param image: The image the worker is started from if it differs from the tag, e.g., an image derived from it.
+            A running worker with another image is replaced.
+        """
+        self._client = docker_client
+        self.image = image or tag
+        self.name = get_worker_name(tag)
+        self._platform = platform
+        self._volumes = volumes
+        self._idle_timeout = idle_timeout
+        self._container = None
+
+    def _get_configuration_hash(self) -> str:
+        image_id = self._client.images.get(self.image).id
+        data = {"image": image_id, "platform": self._platform, "volumes": self._volumes}
+        return hashlib.sha1(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+    def start(self) -> bool:
+        """
+        Start the worker or reuse the running worker if its image and volumes are unchanged.
+        :return: True if a running worker is reused, False if a new worker was started.
+        """
+        configuration = self._get_configuration_hash()
+        for container in _list_workers(self._client, self.name):
+            if (
+                container.status == "running"
+                and container.labels.get(WORKER_LABEL) == configuration
+                and self._touch(container)
+            ):
+                self._container = container
+                return True
+            _remove_container(container)
+        self._container = self._client.containers.run(
+            self.image,
+            name=self.name,
+            entrypoint=["/bin/bash", "-c", _KEEPALIVE_SCRIPT],
+            environment={"IDLE_TIMEOUT": str(int(self._idle_timeout * 60))},
+            volumes=self._volumes,
+            labels={WORKER_LABEL: configuration},
+            platform=self._platform,
+            detach=True,
+            auto_remove=True,
+        )
+        return False
+
+    def _touch(self, container) -> bool:
+        """
+        Mark the worker as used, so it does not stop itself before the build is started.
+        :return: False if the worker is no longer running.
+        """
+        try:
+            exec_id = self._client.api.exec_create(
+                container.id, ["touch", _LAST_USED_PATH]
+            )["Id"]
+            self._client.api.exec_start(exec_id)
+            return self._client.api.exec_inspect(exec_id)["ExitCode"] == 0
+        except Exception as e:
+            if getattr(e, "status_code", None) not in (404, 409):
+                raise
+            return False
+
+    def run(self, command: list[str], environment: dict, on_output) -> int:
+        """
+        Run the command in the worker.
+        If the worker stopped since it was started, e.g., because it was idle, a new worker is started.
+        :param on_output: Called with every line of the combined stdout and stderr of the command.
+        :return: The exit code of the command.
+        """
+        command = [
+            "flock",
+            "-s",
+            _LOCK_PATH,
+            "/bin/sh",
+            "-c",
+            f'touch {_LAST_USED_PATH} && exec "$@"',
+            "sh",
+            *command,
+        ]
+        try:
+            exec_id = self._client.api.exec_create(
+                self._container.id, command, environment=environment
+            )["Id"]
+        except Exception as e:
+            # Not found if already removed by auto_remove, conflict if it is no longer running
+            if getattr(e, "status_code", None) not in (404, 409):
+                raise
+            self._container = None
+            self.start()
+            exec_id = self._client.api.exec_create(
+                self._container.id, command, environment=environment
+            )["Id"]
+        buffer = b""
+        for chunk in self._client.api.exec_start(exec_id, stream=True):
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                on_output(line.decode("utf-8", errors="replace"))
+        if buffer:
+            on_output(buffer.decode("utf-8", errors="replace"))
+        return self._client.api.exec_inspect(exec_id)["ExitCode"]
+
+    def stop(self) -> None:
+        if self._container is not None:
+            _remove_container(self._container)
+            self._container = None
+
+
+def stop_workers(docker_client, tag: str | None = None) -> list[str]:
+    """
+    Stop all worker containers or the worker of the given image tag.
+    :return: The names of the stopped workers.
+    """
+    result = []
+    name = get_worker_name(tag) if tag is not None else None
+    for container in _list_workers(docker_client, name):
+        _remove_container(container)
+        result.append(container.name)
+    return result
+
+
+def _list_workers(docker_client, name=None) -> list:
+    """
+    :param name: Only return the worker with this name.
+    """
+    filters = {"label": WORKER_LABEL}
+    if name is not None:
+        filters["name"] = name
+    # The name filter also matches substrings
+    return [
+        container
+        for container in docker_client.containers.list(all=True, filters=filters)
+        if name is None or container.name == name
+    ]
+
+
+def _remove_container(container) -> None:
+    try:
+        container.remove(force=True)
+    except Exception as e:
+        # Not found if already removed by auto_remove, conflict if its removal is in progress
+        if getattr(e, "status_code", None) not in (404, 409):
+            raise
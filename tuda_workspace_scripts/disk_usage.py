@@ -0,0 +1,184 @@
+"""
+Disk usage of the build, install and log directories of the packages in a workspace and detection of stale
+directories of packages that no longer exist in the workspace.
+"""
+
+from .build_history import format_size
+from .print import Colors, print_color, print_header, TableOutput
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import os
+
+# Directories of colcon that contain a subdirectory per package
+ARTIFACT_DIRECTORIES = ["build", "install"]
+
+
+def get_tree_sizes(paths, workers: int | None = None) -> dict[str, int]:
+    """
+    Compute the disk usage of the given trees. Every directory is scanned as a separate task, so large trees are
+    scanned in parallel as well.
+    :return: The allocated size in bytes of every tree by path. Hardlinked files are counted for every link.
+    """
+    workers = workers or min(32, (os.cpu_count() or 1) * 4)
+    sizes = {path: 0 for path in paths}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        for path in paths:
+            try:
+                stat = os.lstat(path)
+            except OSError:
+                continue
+            sizes[path] += stat.st_blocks * 512
+            if os.path.isdir(path) and not os.path.islink(path):
+                pending[executor.submit(_scan_directory, path)] = path
+        while pending:
+            done, _ = wait(pending.keys(), return_when=FIRST_COMPLETED)
+            for future in done:
+                root = pending.pop(future)
+                size, directories = future.result()
+                sizes[root] += size
+                for directory in directories:
+                    pending[executor.submit(_scan_directory, directory)] = root
+    return sizes
+
+
+def _scan_directory(path) -> tuple[int, list[str]]:
+    """
+    :return: The allocated size of all entries in the directory and its subdirectories.
+    """
+    size = 0
+    directories = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    size += entry.stat(follow_symlinks=False).st_blocks * 512
+                    if entry.is_dir(follow_symlinks=False):
+                        directories.append(entry.path)
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return size, directories
+
+
+def get_log_directories(workspace_root) -> list[str]:
+    """
+    :return: The log directories of all colcon invocations in the workspace, e.g., log/build_<timestamp>.
+    """
+    log_path = os.path.join(workspace_root, "log")
+    try:
+        with os.scandir(log_path) as it:
+            return sorted(
+                entry.path
+                for entry in it
+                if entry.is_dir(follow_symlinks=False)
+                and not entry.name.startswith(".")
+            )
+    except OSError:
+        return []
+
+
+def get_cache_directories(workspace_root) -> list[str]:
+    """
+    :return: The directories in the .cache folder of the workspace, e.g., the artifact cache and the trash.
+    """
+    try:
+        with os.scandir(os.path.join(workspace_root, ".cache")) as it:
+            return [entry.path for entry in it if entry.is_dir(follow_symlinks=False)]
+    except OSError:
+        return []
+
+
+def get_package_directories(workspace_root) -> dict[str, list[str]]:
+    """
+    :return: The build, install and log directories of every package name found in the workspace.
+    """
+    result = {}
+    directories = [os.path.join(workspace_root, d) for d in ARTIFACT_DIRECTORIES]
+    if not _is_isolated_install(os.path.join(workspace_root, "install")):
+        directories.remove(os.path.join(workspace_root, "install"))
+    for directory in directories + get_log_directories(workspace_root):
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if entry.is_dir(
+                        follow_symlinks=False
+                    ) and not entry.name.startswith("."):
+                        result.setdefault(entry.name, []).append(entry.path)
+        except OSError:
+            continue
+    return result
+
+
+def find_stale_directories(workspace_root, packages) -> dict[str, list[str]]:
+    """
+    :param packages: The names of the packages in the workspace.
+    :return: The build, install and log directories of packages that are not in the workspace by package name.
+    """
+    return {
+        name: paths
+        for name, paths in get_package_directories(workspace_root).items()
+        if name not in packages
+    }
+
+
+def print_disk_usage(workspace_root, packages, max_packages: int = 30) -> None:
+    """
+    Print the disk usage of the build, install and log directories of the largest packages and of the caches.
+    :param packages: The names of the packages in the workspace. Other packages are marked as stale.
+    :param max_packages: The maximum number of packages that are listed.
+    """
+    directories = get_package_directories(workspace_root)
+    caches = get_cache_directories(workspace_root)
+    sizes = get_tree_sizes(
+        [path for paths in directories.values() for path in paths] + caches
+    )
+    usage = {}
+    for name, paths in directories.items():
+        usage[name] = {"build": 0, "install": 0, "log": 0}
+        for path in paths:
+            kind = os.path.basename(os.path.dirname(path))
+            usage[name][kind if kind in ARTIFACT_DIRECTORIES else "log"] += sizes[path]
+    totals = {name: sum(u.values()) for name, u in usage.items()}
+    largest = sorted(usage.keys(), key=lambda name: -totals[name])
+
+    print_header("Disk usage by package")
+    table = TableOutput(["Package", "Build", "Install", "Logs", "Total"])
+    for name in largest[:max_packages]:
+        table.add_row(
+            [
+                name if name in packages else f"{name} (stale)",
+                format_size(usage[name]["build"]),
+                format_size(usage[name]["install"]),
+                format_size(usage[name]["log"]),
+                format_size(totals[name]),
+            ]
+        )
+    table.print()
+    if len(largest) > max_packages:
+        print(f"... and {len(largest) - max_packages} more packages.")
+    stale = sum(size for name, size in totals.items() if name not in packages)
+    print(f"Total: {format_size(sum(totals.values()))}")
+    if stale > 0:
+        print_color(
+            Colors.ORANGE,
+            f"{format_size(stale)} used by stale packages. Run clean --stale to remove them.",
+        )
+    if any(caches):
+        print()
+        print_header("Disk usage by cache")
+        table = TableOutput(["Cache", "Size"])
+        for path in sorted(caches, key=lambda path: -sizes[path]):
+            table.add_row([os.path.basename(path), format_size(sizes[path])])
+        table.print()
+
+
+def _is_isolated_install(install_path) -> bool:
+    """
+    :return: Whether the install directory contains a subdirectory per package (colcon's default layout).
+    """
+    try:
+        with open(os.path.join(install_path, ".colcon_install_layout"), "r") as f:
+            return f.read().strip() == "isolated"
+    except OSError:
+        return True
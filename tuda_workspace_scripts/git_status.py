@@ -0,0 +1,359 @@
+import hashlib
+import json
+import os
+import subprocess
+import sys
+
+# Maximum number of untracked paths that are stored. Untracked paths beyond this are only counted.
+MAX_UNTRACKED_PATHS = 10
+# Version of the on-disk format of the status cache. Bump if the fingerprint or the structure of the cache changes.
+STATUS_CACHE_VERSION = 3
+
+
+class FileChange:
+    """
+    A change of a file in a git repository.
+    The change type is one of the git status letters: M, T, A, D, R, C or U.
+    """
+
+    change_type: str
+    path: str
+    original_path: str | None
+
+    def __init__(self, change_type, path, original_path=None) -> None:
+        self.change_type = change_type
+        self.path = path
+        self.original_path = original_path
+
+
+class BranchStatus:
+    name: str
+    upstream: str | None
+    upstream_gone: bool
+    ahead: int
+    behind: int
+
+    def __init__(
+        self, name, upstream=None, upstream_gone=False, ahead=0, behind=0
+    ) -> None:
+        self.name = name
+        self.upstream = upstream
+        self.upstream_gone = upstream_gone
+        self.ahead = ahead
+        self.behind = behind
+
+
+class RepositoryStatus:
+    path: str
+    # Name of the checked out branch or None if the HEAD is detached
+    head: str | None
+    # Commit of the HEAD or None if there are no commits yet
+    head_commit: str | None
+    has_stash: bool
+    unstaged_changes: list[FileChange]
+    staged_changes: list[FileChange]
+    # The first MAX_UNTRACKED_PATHS untracked paths, untracked_count is the total number.
+    # Directories that only contain untracked files are reported as a single path ending in / unless all untracked
+    # files were requested.
+    untracked_paths: list[str]
+    untracked_count: int
+    branches: list[BranchStatus]
+    # Lines of the git status output that could not be interpreted
+    unknown_changes: list[str]
+
+    def __init__(self, path) -> None:
+        self.path = path
+        self.head = None
+        self.head_commit = None
+        self.has_stash = False
+        self.unstaged_changes = []
+        self.staged_changes = []
+        self.untracked_paths = []
+        self.untracked_count = 0
+        self.branches = []
+        self.unknown_changes = []
+
+    @property
+    def changes(self) -> list[FileChange]:
+        return self.unstaged_changes + self.staged_changes
+
+    def is_dirty(self) -> bool:
+        """
+        :return: True if there are staged or unstaged changes. Untracked files are not considered.
+        """
+        return (
+            len(self.unstaged_changes) > 0
+            or len(self.staged_changes) > 0
+            or len(self.unknown_changes) > 0
+        )
+
+
+def _run_git(path, *args) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        ["git", *args],
+        cwd=path,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        # Do not let concurrent status calls fight over the index lock
+        env={**os.environ, "GIT_OPTIONAL_LOCKS": "0", "LC_ALL": "C"},
+    )
+
+
+def _parse_status(status: RepositoryStatus, output: bytes, max_untracked) -> None:
+    # With -z, all entries are separated by NUL and renamed entries are followed by the original path
+    entries = output.decode(errors="surrogateescape").split("\0")
+    i = 0
+    while i < len(entries):
+        entry = entries[i]
+        i += 1
+        if not entry:
+            continue
+        kind = entry[0]
+        if kind == "#":
+            _, _, header = entry.partition(" ")
+            key, _, value = header.partition(" ")
+            if key == "branch.oid":
+                status.head_commit = None if value == "(initial)" else value
+            elif key == "branch.head":
+                status.head = None if value == "(detached)" else value
+            elif key == "stash":
+                status.has_stash = int(value) > 0
+        elif kind == "1":
+            # 1 <XY> <sub> <mH> <mI> <mW> <hH> <hI> <path>
+            fields = entry.split(" ", 8)
+            _add_change(status, fields[1], fields[8])
+        elif kind == "2":
+            # 2 <XY> <sub> <mH> <mI> <mW> <hH> <hI> <X><score> <path> followed by <origPath>
+            fields = entry.split(" ", 9)
+            original_path = entries[i] if i < len(entries) else None
+            i += 1
+            _add_change(status, fields[1], fields[9], original_path)
+        elif kind == "u":
+            # u <XY> <sub> <m1> <m2> <m3> <mW> <h1> <h2> <h3> <path>
+            fields = entry.split(" ", 10)
+            status.unstaged_changes.append(FileChange("U", fields[10]))
+        elif kind == "?":
+            status.untracked_count += 1
+            if len(status.untracked_paths) < max_untracked:
+                status.untracked_paths.append(entry[2:])
+        elif kind != "!":
+            status.unknown_changes.append(entry)
+
+
+def _add_change(status: RepositoryStatus, xy: str, path, original_path=None) -> None:
+    # The rename or copy of a 2 record can be staged or, for files added with --intent-to-add, unstaged
+    staged, unstaged = xy[0], xy[1]
+    if unstaged != ".":
+        status.unstaged_changes.append(FileChange(unstaged, path, original_path))
+    if staged != ".":
+        status.staged_changes.append(FileChange(staged, path, original_path))
+
+
+def _parse_branches(status: RepositoryStatus, output: bytes) -> None:
+    for line in output.decode(errors="surrogateescape").splitlines():
+        name, upstream, track = (line.split("\0") + ["", ""])[:3]
+        branch = BranchStatus(name, upstream or None)
+        # Track is empty if up to date or no upstream, [gone] or e.g. [ahead 1, behind 2]
+        track = track.strip("[]")
+        if track == "gone":
+            branch.upstream_gone = True
+        else:
+            for part in filter(None, track.split(", ")):
+                direction, _, count = part.partition(" ")
+                if direction == "ahead":
+                    branch.ahead = int(count)
+                elif direction == "behind":
+                    branch.behind = int(count)
+        status.branches.append(branch)
+
+
+def get_repository_status(
+    path, max_untracked=MAX_UNTRACKED_PATHS, all_untracked_files: bool = False
+) -> RepositoryStatus:
+    """
+    Get the status of the git repository at path using a single git status and a single git for-each-ref call.
+    :param path: The path of the repository.
+    :param max_untracked: The maximum number of untracked paths that are stored. All untracked paths are counted.
+    :param all_untracked_files: Whether to report the individual files in untracked directories. This requires git to
+        walk the untracked directories, which is slow if they contain many files.
+    :return: The status of the repository.
+    @raises RuntimeError if git failed, e.g., because path is not a git repository.
+    """
+    status = RepositoryStatus(path)
+    untracked_files = "all" if all_untracked_files else "normal"
+    args = ["status", "--porcelain=v2", "--branch", "-z", f"-u{untracked_files}"]
+    result = _run_git(path, *args, "--show-stash")
+    if result.returncode != 0 and b"show-stash" in result.stderr:
+        # git < 2.35 does not support --show-stash
+        result = _run_git(path, *args)
+        if result.returncode == 0:
+            stash = _run_git(path, "rev-parse", "--verify", "-q", "refs/stash")
+            status.has_stash = stash.returncode == 0
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.decode(errors="replace").strip())
+    _parse_status(status, result.stdout, max_untracked)
+
+    result = _run_git(
+        path,
+        "for-each-ref",
+        "--format=%(refname:short)%00%(upstream:short)%00%(upstream:track)",
+        "refs/heads",
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.decode(errors="replace").strip())
+    _parse_branches(status, result.stdout)
+    return status
+
+
+def get_changed_files(path, since=None) -> list[str]:
+    """
+    Get the files that changed in the working tree of the repository, i.e., staged, unstaged and untracked files
+    and, if since is given, the files changed in the commits since the common ancestor of since and the HEAD.
+    Renamed files are reported with their new and original path.
+    :param path: The path of the repository.
+    :param since: A revision, e.g., a commit, tag or branch such as origin/main.
+    :return: The absolute paths of the changed files.
+    @raises RuntimeError if git failed, e.g., because since does not exist in the repository.
+    """
+    status = get_repository_status(
+        path, max_untracked=sys.maxsize, all_untracked_files=True
+    )
+    files = set(status.untracked_paths)
+    for change in status.changes:
+        files.add(change.path)
+        if change.original_path:
+            files.add(change.original_path)
+    if since is not None:
+        result = _run_git(path, "merge-base", since, "HEAD")
+        if result.returncode != 0:
+            raise RuntimeError(
+                result.stderr.decode(errors="replace").strip()
+                or f"{since} has no common ancestor with HEAD"
+            )
+        base = result.stdout.decode().strip()
+        result = _run_git(path, "diff", "--name-only", "-z", base, "HEAD")
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.decode(errors="replace").strip())
+        files.update(
+            filter(None, result.stdout.decode(errors="surrogateescape").split("\0"))
+        )
+    return sorted(os.path.join(path, file) for file in files)
+
+
+def _get_git_dirs(path) -> tuple[str, str] | None:
+    """
+    :return: The git directory of the repository at path and the common git directory which contains the refs and
+        config. They differ for worktrees. None if path is not a repository.
+    """
+    git_dir = os.path.join(path, ".git")
+    if os.path.isfile(git_dir):
+        # Submodules and worktrees use a file containing the path of the git directory
+        try:
+            with open(git_dir, "r") as f:
+                content = f.read().strip()
+        except OSError:
+            return None
+        if not content.startswith("gitdir:"):
+            return None
+        git_dir = os.path.join(path, content[len("gitdir:") :].strip())
+    elif not os.path.isdir(git_dir):
+        return None
+    common_dir = git_dir
+    try:
+        with open(os.path.join(git_dir, "commondir"), "r") as f:
+            common_dir = os.path.join(git_dir, f.read().strip())
+    except OSError:
+        pass
+    return os.path.normpath(git_dir), os.path.normpath(common_dir)
+
+
+def _stat_summary(path) -> tuple[int, int] | None:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, max(stat.st_mtime_ns, stat.st_ctime_ns)
+
+
+def _summarize_tree(path) -> tuple[int, int]:
+    """
+    :return: The latest modification (or status change) time in ns and the number of entries in the tree at path.
+    """
+    latest = 0
+    count = 0
+    stack = [path]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = list(it)
+            stat = os.stat(directory)
+        except OSError:
+            continue
+        latest = max(latest, stat.st_mtime_ns, stat.st_ctime_ns)
+        for entry in entries:
+            count += 1
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                    continue
+                stat = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            latest = max(latest, stat.st_mtime_ns, stat.st_ctime_ns)
+    return latest, count
+
+
+def get_repository_fingerprint(path) -> str | None:
+    """
+    Compute a fingerprint of the state of the repository at path that is much cheaper to obtain than its status.
+    It consists of the HEAD and the size and modification times of the index, config and refs. The work tree is not
+    scanned since stat'ing its files costs about as much as git status itself.
+    Staging, committing, checking out, fetching and stashing change the fingerprint. Editing, adding or removing files
+    in the work tree only changes it once git refreshes the index, e.g., on git add or a git status run elsewhere.
+    :return: The fingerprint or None if path is not a repository or the fingerprint cannot be computed.
+    """
+    git_dirs = _get_git_dirs(path)
+    if git_dirs is None:
+        return None
+    git_dir, common_dir = git_dirs
+    try:
+        with open(os.path.join(git_dir, "HEAD"), "r") as f:
+            head = f.read().strip()
+    except OSError:
+        return None
+    state = {
+        "head": head,
+        "index": _stat_summary(os.path.join(git_dir, "index")),
+        "config": _stat_summary(os.path.join(common_dir, "config")),
+        "packed_refs": _stat_summary(os.path.join(common_dir, "packed-refs")),
+        "refs": _summarize_tree(os.path.join(common_dir, "refs")),
+    }
+    return hashlib.sha1(json.dumps(state).encode()).hexdigest()
+
+
+def get_status_cache_path(workspace_root) -> str:
+    return os.path.join(workspace_root, ".config", "status_cache.json")
+
+
+def load_status_cache(workspace_root) -> dict[str, str]:
+    """
+    :return: The fingerprints of the repositories that were clean in the last status run by their path.
+    """
+    try:
+        with open(get_status_cache_path(workspace_root), "r") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get("version") != STATUS_CACHE_VERSION:
+        return {}
+    return data.get("repositories", {})
+
+
+def save_status_cache(workspace_root, fingerprints: dict[str, str]) -> None:
+    path = get_status_cache_path(workspace_root)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"version": STATUS_CACHE_VERSION, "repositories": fingerprints}, f)
+    os.replace(tmp_path, path)
@@ -0,0 +1,159 @@
+"""
+Retention of colcon's log directory.
+The last runs of every verb (build, test, ...) are kept as they are, older runs are compressed into one archive per
+run (log/<verb>_<timestamp>.tar.gz) which can still be read using read_log_file or tar.
+Compression runs in a detached low priority process with a time limit, so it never slows down the build it follows.
+
+Run as python3 -m tuda_workspace_scripts.log_retention <workspace root> <number of kept runs> to compress the logs.
+"""
+
+from .config import load_config
+from .trash import move_to_trash, start_low_priority_process, start_reaper
+import fcntl
+import os
+import re
+import sys
+import tarfile
+import time
+
+# Number of runs of every verb that are kept uncompressed
+DEFAULT_KEPT_LOG_RUNS = 10
+# Maximum time in seconds of a single retention run. Remaining runs are compressed by the next one.
+MAX_RETENTION_SECONDS = 60
+# Runs modified more recently might still be written by another colcon invocation
+MIN_RUN_AGE = 600
+ARCHIVE_SUFFIX = ".tar.gz"
+# Name of the log directory of a colcon invocation: <verb>_<timestamp>[_<n>]
+_RUN_PATTERN = re.compile(r"^(.+)_\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}(?:_\d+)?$")
+_LOCK_FILE = ".retention.lock"
+
+
+def get_log_runs(workspace_root) -> dict[str, list[str]]:
+    """
+    :return: The names of the uncompressed log directories of every verb, oldest first.
+    """
+    result = {}
+    try:
+        with os.scandir(os.path.join(workspace_root, "log")) as it:
+            for entry in it:
+                match = _RUN_PATTERN.match(entry.name)
+                if match and entry.is_dir(follow_symlinks=False):
+                    result.setdefault(match.group(1), []).append(entry.name)
+    except OSError:
+        pass
+    return {verb: sorted(runs) for verb, runs in result.items()}
+
+
+def find_runs_to_compress(workspace_root, keep: int) -> list[str]:
+    """
+    :param keep: The number of runs of every verb that are kept uncompressed.
+    :return: The paths of the log directories that should be compressed, oldest first.
+    """
+    log_path = os.path.join(workspace_root, "log")
+    # The latest runs are referenced by the latest* symlinks
+    latest = set()
+    try:
+        with os.scandir(log_path) as it:
+            for entry in it:
+                if entry.is_symlink() and entry.name.startswith("latest"):
+                    latest.add(os.path.basename(os.readlink(entry.path)))
+    except OSError:
+        return []
+    now = time.time()
+    result = []
+    for runs in get_log_runs(workspace_root).values():
+        for name in runs[: max(0, len(runs) - keep)]:
+            path = os.path.join(log_path, name)
+            try:
+                if name in latest or now - os.stat(path).st_mtime < MIN_RUN_AGE:
+                    continue
+            except OSError:
+                continue
+            result.append(path)
+    return sorted(result, key=os.path.basename)
+
+
+def compress_run(workspace_root, path) -> str:
+    """
+    Compress the log directory into an archive next to it and move the directory to the trash.
+    :return: The path of the archive.
+    """
+    archive_path = path + ARCHIVE_SUFFIX
+    tmp_path = f"{archive_path}.{os.getpid()}.tmp"
+    with tarfile.open(tmp_path, "w:gz") as archive:
+        archive.add(path, arcname=os.path.basename(path))
+    os.replace(tmp_path, archive_path)
+    move_to_trash(workspace_root, path)
+    return archive_path
+
+
+def apply_log_retention(
+    workspace_root, keep: int, time_limit: float = MAX_RETENTION_SECONDS
+) -> int:
+    """
+    Compress the log directories of all but the last keep runs of every verb until the time limit is reached.
+    Returns immediately if another process is already compressing the logs of the workspace.
+    :return: The number of compressed runs.
+    """
+    deadline = time.monotonic() + time_limit
+    try:
+        lock = open(os.path.join(workspace_root, "log", _LOCK_FILE), "w")
+    except OSError:
+        return 0
+    compressed = 0
+    with lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return 0
+        for path in find_runs_to_compress(workspace_root, keep):
+            if time.monotonic() > deadline:
+                break
+            try:
+                compress_run(workspace_root, path)
+                compressed += 1
+            except OSError:
+                continue
+    if compressed > 0:
+        start_reaper(workspace_root)
+    return compressed
+
+
+def start_log_retention(workspace_root, keep: int | None = None) -> None:
+    """
+    Compress old log directories in a detached low priority process if there are any.
+    :param keep: The number of runs of every verb that are kept uncompressed. Defaults to the log_retention_runs
+        config variable. Nothing is compressed if it is negative.
+    """
+    if keep is None:
+        keep = load_config().variables["log_retention_runs"]
+        keep = DEFAULT_KEPT_LOG_RUNS if keep is None else int(keep)
+    if keep < 0 or not any(find_runs_to_compress(workspace_root, keep)):
+        return
+    start_low_priority_process(
+        "tuda_workspace_scripts.log_retention", [workspace_root, str(keep)]
+    )
+
+
+def read_log_file(workspace_root, run, relative_path) -> str | None:
+    """
+    Read a log file of a run, e.g., read_log_file(root, "build_2024-01-01_12-00-00", "my_pkg/stdout.log").
+    :return: The content of the file from the log directory or the archive of the run or None if it does not exist.
+    """
+    path = os.path.join(workspace_root, "log", run, relative_path)
+    try:
+        with open(path, "r", errors="replace") as f:
+            return f.read()
+    except OSError:
+        pass
+    archive_path = os.path.join(workspace_root, "log", run + ARCHIVE_SUFFIX)
+    try:
+        with tarfile.open(archive_path, "r:gz") as archive:
+            member = archive.extractfile(f"{run}/{relative_path}")
+            return member.read().decode(errors="replace") if member else None
+    except (OSError, KeyError, tarfile.TarError):
+        return None
+
+
+if __name__ == "__main__":
+    apply_log_retention(sys.argv[1], int(sys.argv[2]))
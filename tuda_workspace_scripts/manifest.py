@@ -0,0 +1,165 @@
+"""
+Manifests of the files in a directory tree (size, modification time and content hash per file)
+which are used to find out what changed in the sources of a package since it was last built.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+
+# Version of the on-disk format. Bump if the structure of the manifests changes.
+MANIFEST_VERSION = 1
+# Directories that are never part of a manifest
+IGNORED_DIRECTORIES = {".git", "__pycache__"}
+
+
+def hash_file(path) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def scan_tree(path, previous: dict | None = None, hash_files=True) -> dict[str, list]:
+    """
+    Create a manifest of all files in the given directory tree.
+    :param path: The root of the tree.
+    :param previous: A previous manifest of the same tree. Hashes of files whose size and modification time did not
+        change are reused instead of hashing the file again.
+    :param hash_files: Whether to compute the content hashes. If false, the hash of every entry is None.
+    :return: The manifest mapping the path of every file relative to path to a list of size, modification time in ns
+        and hash. Symlinks are not followed, their hash is the link target.
+    """
+    previous = previous or {}
+    manifest = {}
+    stack = [path]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in IGNORED_DIRECTORIES:
+                        stack.append(entry.path)
+                    continue
+                stat = entry.stat(follow_symlinks=False)
+                relative_path = os.path.relpath(entry.path, path)
+                if entry.is_symlink():
+                    digest = "->" + os.readlink(entry.path)
+                elif not hash_files:
+                    digest = None
+                else:
+                    old = previous.get(relative_path, None)
+                    if (
+                        old is not None
+                        and old[0] == stat.st_size
+                        and old[1] == stat.st_mtime_ns
+                        and old[2] is not None
+                    ):
+                        digest = old[2]
+                    else:
+                        digest = hash_file(entry.path)
+            except OSError:
+                continue  # Removed while scanning
+            manifest[relative_path] = [stat.st_size, stat.st_mtime_ns, digest]
+    return manifest
+
+
+def tree_digest(manifest: dict[str, list]) -> str:
+    """
+    :return: A digest of the content of the tree described by the manifest. Modification times are not part of it.
+    """
+    h = hashlib.sha1()
+    for relative_path in sorted(manifest.keys()):
+        size, _, digest = manifest[relative_path]
+        h.update(
+            f"{relative_path}\0{size}\0{digest}\0".encode(errors="surrogateescape")
+        )
+    return h.hexdigest()
+
+
+def changed_paths(old: dict[str, list], new: dict[str, list]) -> set[str]:
+    """
+    :return: The relative paths of all files that were added, removed or whose content changed between the manifests.
+    """
+    result = set(old.keys()) ^ set(new.keys())
+    for relative_path in set(old.keys()) & set(new.keys()):
+        size, mtime, digest = new[relative_path]
+        old_size, old_mtime, old_digest = old[relative_path]
+        if digest is None or old_digest is None:
+            # Without hashes, the modification time is the best we have
+            if size != old_size or mtime != old_mtime:
+                result.add(relative_path)
+        elif size != old_size or digest != old_digest:
+            result.add(relative_path)
+    return result
+
+
+def get_source_manifests_path(workspace_root) -> str:
+    return os.path.join(workspace_root, ".config", "build_manifest.json")
+
+
+def load_source_manifests(workspace_root) -> dict[str, dict]:
+    """
+    :return: The source manifests of the packages from their last successful build by package name.
+        Each entry contains the path of the package and the manifest of its files.
+    """
+    try:
+        with open(get_source_manifests_path(workspace_root), "r") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get("version") != MANIFEST_VERSION:
+        return {}
+    return data.get("packages", {})
+
+
+def save_source_manifests(workspace_root, manifests: dict[str, dict]) -> None:
+    path = get_source_manifests_path(workspace_root)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"version": MANIFEST_VERSION, "packages": manifests}, f)
+    os.replace(tmp_path, path)
+
+
+def scan_packages(
+    packages: dict[str, str], previous: dict[str, dict] | None = None
+) -> dict[str, dict]:
+    """
+    Create the source manifests of the given packages in parallel.
+    :param packages: The paths of the packages by name.
+    :param previous: Previous source manifests by package name which are used to avoid hashing unchanged files.
+    :return: The source manifests by package name.
+    """
+    previous = previous or {}
+
+    def scan(name):
+        old = previous.get(name, None)
+        old_files = old["files"] if old and old.get("path") == packages[name] else None
+        return {"path": packages[name], "files": scan_tree(packages[name], old_files)}
+
+    with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) + 4)) as executor:
+        return dict(zip(packages.keys(), executor.map(scan, packages.keys())))
+
+
+def find_changed_packages(old: dict[str, dict], new: dict[str, dict]) -> set[str]:
+    """
+    :return: The names of the packages in new whose sources changed or moved compared to old or which are not in old.
+    """
+    result = set()
+    for name, manifest in new.items():
+        previous = old.get(name, None)
+        if (
+            previous is None
+            or previous.get("path") != manifest["path"]
+            or any(changed_paths(previous["files"], manifest["files"]))
+        ):
+            result.add(name)
+    return result
@@ -0,0 +1,343 @@
+import json
+import os
+import re
+import xml.etree.ElementTree as ET
+
+# Version of the on-disk format. Bump if the structure of the index changes.
+INDEX_VERSION = 1
+# Files that are used to identify a package. If one of them changes, the package has to be identified again.
+MANIFEST_FILES = (
+    "package.xml",
+    "setup.py",
+    "setup.cfg",
+    "pyproject.toml",
+    "CMakeLists.txt",
+)
+DEPENDENCY_CATEGORIES = {
+    "build": ("build_depend", "buildtool_depend", "depend"),
+    "run": (
+        "build_export_depend",
+        "buildtool_export_depend",
+        "exec_depend",
+        "run_depend",
+        "depend",
+    ),
+    "test": ("test_depend",),
+}
+
+__CACHE = {}
+
+
+class PackageInfo:
+    name: str
+    path: str
+    build_type: str | None
+    dependencies: dict[str, list[str]]
+
+    def __init__(self, name, path, build_type=None, dependencies=None) -> None:
+        self.name = name
+        self.path = path
+        self.build_type = build_type
+        self.dependencies = dependencies or {}
+
+    def get_dependencies(self, categories=None) -> set[str]:
+        """
+        :param categories: The dependency categories (build, run, test) to consider. If None, all are used.
+        :return: The names of all dependencies in the given categories.
+        """
+        result = set()
+        for category, names in self.dependencies.items():
+            if categories is None or category in categories:
+                result.update(names)
+        return result
+
+    def to_dict(self) -> dict:
+        return {
+            "path": self.path,
+            "build_type": self.build_type,
+            "dependencies": self.dependencies,
+        }
+
+    @staticmethod
+    def from_dict(name, data) -> "PackageInfo":
+        return PackageInfo(
+            name, data["path"], data.get("build_type"), data.get("dependencies")
+        )
+
+
+class PackageIndex:
+    """
+    Index of all packages in a directory (usually the src folder of a workspace).
+    The index remembers the modification times of all directories that were searched and of the manifests of all
+    packages, which makes it cheap to check whether the index is still up to date.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        packages: dict[str, PackageInfo],
+        mtimes: dict[str, int],
+    ) -> None:
+        self.directory = directory
+        self.packages = packages
+        self._mtimes = mtimes
+
+    def is_valid(self) -> bool:
+        """
+        :return: True if none of the searched directories and package manifests changed since the index was created.
+        """
+        for path, mtime in self._mtimes.items():
+            try:
+                if os.stat(path).st_mtime_ns != mtime:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def get_package(self, name) -> PackageInfo | None:
+        return self.packages.get(name, None)
+
+    def get_packages_in_directory(self, directory) -> list[PackageInfo]:
+        """
+        :return: All packages located in the given directory or one of its subdirectories.
+        """
+        directory = os.path.join(os.path.abspath(directory), "")
+        return [
+            package
+            for package in self.packages.values()
+            if os.path.join(package.path, "").startswith(directory)
+        ]
+
+    def find_package_containing(self, path) -> PackageInfo | None:
+        """
+        :return: The package that contains the given path or None if the path is not inside a known package.
+        """
+        path = os.path.join(os.path.abspath(path), "")
+        result = None
+        for package in self.packages.values():
+            package_path = os.path.join(package.path, "")
+            if path.startswith(package_path) and (
+                result is None or len(package_path) > len(result.path)
+            ):
+                result = package
+        return result
+
+    def get_dependencies(self, names, categories=None, recursive=True) -> set[str]:
+        """
+        :param names: The packages for which the dependencies are collected.
+        :param categories: The dependency categories (build, run, test) to consider. If None, all are used.
+        :param recursive: Whether to include dependencies of dependencies.
+        :return: The names of all packages in this index the given packages depend on (excluding the given packages).
+        """
+        result = set()
+        queue = list(names)
+        while queue:
+            package = self.packages.get(queue.pop(), None)
+            if package is None:
+                continue
+            for dependency in package.get_dependencies(categories):
+                if dependency in result or dependency not in self.packages:
+                    continue
+                result.add(dependency)
+                if recursive:
+                    queue.append(dependency)
+        return result - set(names)
+
+    def get_dependents(self, names, categories=None, recursive=True) -> set[str]:
+        """
+        :param names: The packages for which the dependents are collected.
+        :param categories: The dependency categories (build, run, test) to consider. If None, all are used.
+        :param recursive: Whether to include dependents of dependents.
+        :return: The names of all packages in this index that depend on the given packages (excluding the given packages).
+        """
+        dependents = {}
+        for package in self.packages.values():
+            for dependency in package.get_dependencies(categories):
+                dependents.setdefault(dependency, set()).add(package.name)
+        result = set()
+        queue = list(names)
+        while queue:
+            for dependent in dependents.get(queue.pop(), ()):
+                if dependent in result:
+                    continue
+                result.add(dependent)
+                if recursive:
+                    queue.append(dependent)
+        return result - set(names)
+
+    def save(self, path) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = {
+            "version": INDEX_VERSION,
+            "directory": self.directory,
+            "packages": {
+                name: package.to_dict() for name, package in self.packages.items()
+            },
+            "mtimes": self._mtimes,
+        }
+        # Write to a temporary file first to make sure concurrent readers never see a partial index
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path) -> "PackageIndex | None":
+        """
+        :return: The index stored at the given path or None if it does not exist or can not be read.
+        """
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(data, dict) or data.get("version") != INDEX_VERSION:
+            return None
+        packages = {
+            name: PackageInfo.from_dict(name, package)
+            for name, package in data["packages"].items()
+        }
+        return PackageIndex(data["directory"], packages, data["mtimes"])
+
+    @staticmethod
+    def scan(directory) -> "PackageIndex":
+        """
+        Search the given directory recursively for packages and create an index for them.
+        """
+        get_package_identification_extensions, identify, IgnoreLocationException = (
+            import_colcon_identification()
+        )
+        directory = os.path.abspath(directory)
+        packages = {}
+        mtimes = {}
+        identification_extensions = get_package_identification_extensions()
+        visited_paths = set()
+        for dirpath, dirnames, _ in os.walk(directory, followlinks=True):
+            real_dirpath = os.path.realpath(dirpath)
+            if real_dirpath in visited_paths:
+                del dirnames[:]
+                continue
+            visited_paths.add(real_dirpath)
+            try:
+                mtimes[dirpath] = os.stat(dirpath).st_mtime_ns
+            except OSError:
+                del dirnames[:]
+                continue
+            try:
+                result = identify(identification_extensions, dirpath)
+            except IgnoreLocationException:
+                del dirnames[:]
+                continue
+            if result:
+                for manifest in MANIFEST_FILES:
+                    manifest_path = os.path.join(dirpath, manifest)
+                    try:
+                        mtimes[manifest_path] = os.stat(manifest_path).st_mtime_ns
+                    except OSError:
+                        pass
+                packages[result.name] = PackageInfo(
+                    result.name,
+                    dirpath,
+                    result.type,
+                    read_package_dependencies(os.path.join(dirpath, "package.xml")),
+                )
+                del dirnames[:]
+                continue
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+        if not mtimes:
+            # The directory does not exist (yet). Its creation will change the modification time of the parent.
+            parent = os.path.dirname(directory)
+            try:
+                mtimes[parent] = os.stat(parent).st_mtime_ns
+            except OSError:
+                pass
+        return PackageIndex(directory, packages, mtimes)
+
+
+def import_colcon_identification():
+    """
+    Import colcon's package identification on demand since importing colcon is slow.
+    :return: The functions get_package_identification_extensions and identify and the IgnoreLocationException.
+    """
+    try:
+        from colcon_core.plugin_system import get_package_identification_extensions
+    except ImportError:
+        from colcon_core.package_identification import (
+            get_package_identification_extensions,
+        )
+    from colcon_core.package_identification import identify, IgnoreLocationException
+
+    return get_package_identification_extensions, identify, IgnoreLocationException
+
+
+def _evaluate_condition(condition: str | None, environment=None) -> bool:
+    """
+    Evaluates simple package.xml conditions such as $ROS_VERSION == 2.
+    Conditions that can not be evaluated are considered to be true.
+    :param environment: The variables used in the condition. Defaults to the environment of this process.
+    """
+    if not condition:
+        return True
+    if environment is None:
+        environment = os.environ
+    condition = re.sub(
+        r"\$([A-Za-z_][A-Za-z0-9_]*)",
+        lambda m: environment.get(m.group(1), ""),
+        condition,
+    )
+    match = re.fullmatch(r"\s*(\S*)\s*(==|!=)\s*(\S*)\s*", condition)
+    if match is None:
+        return True
+    lhs, operator, rhs = match.groups()
+    return (lhs == rhs) == (operator == "==")
+
+
+def read_package_dependencies(path, environment=None) -> dict[str, list[str]]:
+    """
+    :param path: The path of a package.xml.
+    :param environment: The variables used to evaluate the conditions of the dependencies, e.g., ROS_DISTRO and
+        ROS_VERSION. Defaults to the environment of this process.
+    :return: The names of the dependencies by category (build, run, test).
+    """
+    try:
+        root = ET.parse(path).getroot()
+    except (OSError, ET.ParseError):
+        return {}
+    dependencies = {}
+    for category, tags in DEPENDENCY_CATEGORIES.items():
+        names = set()
+        for tag in tags:
+            for element in root.findall(tag):
+                if element.text and _evaluate_condition(
+                    element.get("condition"), environment
+                ):
+                    names.add(element.text.strip())
+        dependencies[category] = sorted(names)
+    return dependencies
+
+
+def get_package_index_path(workspace_root) -> str:
+    return os.path.join(workspace_root, ".config", "package_index.json")
+
+
+def load_package_index(workspace_root) -> PackageIndex:
+    """
+    Get the index of the packages in the src folder of the given workspace.
+    The index is kept in memory and on disk in WORKSPACE_ROOT/.config/package_index.json and is only rebuilt
+    if a directory or package manifest in the src folder changed.
+    """
+    workspace_root = os.path.abspath(workspace_root)
+    index = __CACHE.get(workspace_root, None)
+    if index is not None and index.is_valid():
+        return index
+    src_path = os.path.join(workspace_root, "src")
+    path = get_package_index_path(workspace_root)
+    index = PackageIndex.load(path)
+    if index is None or index.directory != src_path or not index.is_valid():
+        index = PackageIndex.scan(src_path)
+        try:
+            index.save(path)
+        except OSError:
+            pass  # Workspace not writable, the index is still cached in memory
+    __CACHE[workspace_root] = index
+    return index
@@ -1,17 +1,27 @@
 from .workspace import get_workspace_root
 import os
-from jinja2 import Template
 from typing import Any, Generator
 import yaml
 
-# Use the environment variable TUDA_WSS_CONFIG to specify a config file or directory.
-# You can also specify multiple files and directories separated by the os path separator.
-# If not specified, default to WORKSPACE_ROOT/.config/tuda_workspace_scripts.yaml
-ROBOTS_CONFIG_FILE_PATH = os.getenv("TUDA_WSS_ROBOTS", None)
-if ROBOTS_CONFIG_FILE_PATH is None:
-    ROBOTS_CONFIG_FILE_PATH = get_workspace_root()
-    if ROBOTS_CONFIG_FILE_PATH is not None:
-        ROBOTS_CONFIG_FILE_PATH += "/.config/robots.yaml"
+
+def get_robots_config_file_path() -> str | None:
+    # Use the environment variable TUDA_WSS_CONFIG to specify a config file or directory.
+    # You can also specify multiple files and directories separated by the os path separator.
+    # If not specified, default to WORKSPACE_ROOT/.config/tuda_workspace_scripts.yaml
+    path = os.getenv("TUDA_WSS_ROBOTS", None)
+    if path is None:
+        path = get_workspace_root()
+        if path is not None:
+            path += "/.config/robots.yaml"
+    return path
+
+
+def __getattr__(name):
+    # ROBOTS_CONFIG_FILE_PATH is resolved on access since looking up the workspace root at import time is slow
+    # and would not follow changes of the working directory.
+    if name == "ROBOTS_CONFIG_FILE_PATH":
+        return get_robots_config_file_path()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 __CACHE = {}
@@ -30,6 +40,8 @@ class Command:
         self.delegate_to = delegate_to
 
     def render_command(self, vars: dict) -> RenderedCommand:
+        from jinja2 import Template
+
         return RenderedCommand(Template(self.command).render(vars), self.delegate_to)
 
 
@@ -122,7 +134,9 @@ class Robot:
 DEFAULT_COMMANDS = [
     Command("ssh", "ssh -p {{port}} {{user}}@{{hostname}}", delegate_to="localhost"),
     Command(
-        "ssh-copy-id", "ssh-copy-id -p {{port}} {{user}}@{{hostname}}", delegate_to="localhost"
+        "ssh-copy-id",
+        "ssh-copy-id -p {{port}} {{user}}@{{hostname}}",
+        delegate_to="localhost",
     ),
     Command("reboot", "sudo reboot now"),
     Command("shutdown", "sudo shutdown now"),
@@ -177,8 +191,10 @@ def _load_robot_from_yaml(name, config: dict[str, Any]) -> Robot:
 
 
 def _load_robot_config_from_file(path: str) -> dict[str, Robot]:
-    if path in __CACHE:
-        return __CACHE[path]
+    # Cache by modification time to pick up changes in long running processes such as the completion server
+    mtime = os.stat(path).st_mtime_ns
+    if path in __CACHE and __CACHE[path][0] == mtime:
+        return __CACHE[path][1]
     robots = {}
     with open(path, "r") as f:
         config = yaml.safe_load(f)
@@ -186,31 +202,32 @@ def _load_robot_config_from_file(path: str) -> dict[str, Robot]:
             # It's a robot
             filename = os.path.basename(path)
             name = os.path.splitext(filename)[0]
-            return {name: _load_robot_from_yaml(name, config)}
-        # It's multiple robots
-        for name in config:
-            robots[name] = _load_robot_from_yaml(name, config[name])
-    __CACHE[path] = robots
+            robots[name] = _load_robot_from_yaml(name, config)
+        else:
+            # It's multiple robots
+            for name in config:
+                robots[name] = _load_robot_from_yaml(name, config[name])
+    __CACHE[path] = (mtime, robots)
     return robots
 
 
 def _load_robots_from_dir(path: str) -> dict[str, Robot]:
-    if path in __CACHE:
-        return __CACHE[path]
     robots: dict = {}
     for root, _, files in os.walk(path):
         for file in files:
             if not file.endswith(".yaml"):
                 continue
             robots.update(_load_robot_config_from_file(os.path.join(root, file)))
-    __CACHE[path] = robots
     return robots
 
 
 def load_robots() -> dict[str, Robot]:
     robots = {}
+    config_file_path = get_robots_config_file_path()
+    if config_file_path is None:
+        return robots
     # Split the config file path by the os path separator
-    for path in ROBOTS_CONFIG_FILE_PATH.split(os.pathsep):
+    for path in config_file_path.split(os.pathsep):
         if not os.path.exists(path):
             continue
         if os.path.isdir(path):
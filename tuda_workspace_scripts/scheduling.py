@@ -0,0 +1,354 @@
+"""
+Critical path aware scheduling of colcon builds.
+colcon starts the ready package with the most dependents first. If the expected build durations are known, it is
+better to start the package with the longest remaining path of builds (its own duration plus the longest path
+through the packages depending on it) since that path determines the total build time.
+
+Run as python3 -m tuda_workspace_scripts.scheduling <colcon arguments> to run colcon with such a scheduler.
+The expected durations are read as JSON object from the TUDA_WSS_PACKAGE_DURATIONS environment variable.
+"""
+
+from .build_history import format_duration
+from .print import Colors, print_color, print_header
+import heapq
+import json
+import os
+import statistics
+import sys
+
+DURATIONS_ENVIRONMENT_VARIABLE = "TUDA_WSS_PACKAGE_DURATIONS"
+# Versions of colcon-parallel-executor whose _execute the critical path executor is a modified copy of.
+# For other versions, colcon runs with its own executor since the copy might diverge from it.
+SUPPORTED_PARALLEL_EXECUTOR_VERSIONS = ("0.4.0",)
+# Expected duration of a package in seconds if there is no history at all
+DEFAULT_DURATION = 10.0
+
+
+def get_default_duration(durations: dict[str, float]) -> float:
+    """
+    :return: The duration assumed for packages without history, i.e., the median of the known durations.
+    """
+    return statistics.median(durations.values()) if durations else DEFAULT_DURATION
+
+
+def compute_critical_path_weights(
+    dependencies: dict[str, set[str]], durations: dict[str, float]
+) -> dict[str, float]:
+    """
+    :param dependencies: The (direct or recursive) dependencies of every package. Dependencies that are not keys of
+        this dict are ignored.
+    :param durations: The expected duration of the packages. Packages without a duration use the median duration.
+    :return: The length of the longest path of builds that starts with the package for every package.
+    """
+    default_duration = get_default_duration(durations)
+    dependents = {name: set() for name in dependencies}
+    for name, package_dependencies in dependencies.items():
+        for dependency in package_dependencies:
+            if dependency != name and dependency in dependents:
+                dependents[dependency].add(name)
+    weights = {}
+    visiting = set()
+    # Iterative depth-first search so that long chains do not hit the recursion limit
+    for root in dependencies:
+        stack = [(root, False)]
+        while stack:
+            name, expanded = stack.pop()
+            if name in weights:
+                continue
+            if not expanded:
+                if name in visiting:
+                    continue  # Dependency cycle
+                visiting.add(name)
+                stack.append((name, True))
+                stack += [(d, False) for d in dependents[name] if d not in weights]
+                continue
+            weights[name] = durations.get(name, default_duration) + max(
+                (weights.get(d, 0.0) for d in dependents[name]), default=0.0
+            )
+    return weights
+
+
+def split_into_shards(
+    packages: list[str], durations: dict[str, float], count: int
+) -> list[list[str]]:
+    """
+    Split the packages into count shards with similar total durations by assigning the longest package to the shard
+    with the shortest total duration until all packages are assigned. The result only depends on the packages and
+    durations, so independent processes or machines obtain the same shards.
+    :param durations: The expected duration of the packages. Packages without a duration use the median duration.
+    :return: The packages of every shard sorted by name.
+    """
+    default_duration = get_default_duration(durations)
+    shards = [(0.0, i, []) for i in range(count)]
+    for name in sorted(
+        set(packages), key=lambda name: (-durations.get(name, default_duration), name)
+    ):
+        total, i, shard = heapq.heappop(shards)
+        shard.append(name)
+        heapq.heappush(
+            shards, (total + durations.get(name, default_duration), i, shard)
+        )
+    return [sorted(shard) for _, _, shard in sorted(shards, key=lambda s: s[1])]
+
+
+def simulate_build(
+    dependencies: dict[str, set[str]],
+    durations: dict[str, float],
+    workers: int,
+    priorities: dict[str, float],
+) -> float:
+    """
+    Simulate a build where every free worker starts the ready package with the highest priority.
+    Ties are broken by the order of the packages in dependencies.
+    :return: The predicted wall time of the build in seconds.
+    """
+    default_duration = get_default_duration(durations)
+    order = {name: i for i, name in enumerate(dependencies.keys())}
+    remaining = {
+        name: {d for d in deps if d != name and d in dependencies}
+        for name, deps in dependencies.items()
+    }
+    running = []
+    time = 0.0
+    while remaining or running:
+        ready = sorted(
+            (name for name, deps in remaining.items() if not deps),
+            key=lambda name: (-priorities.get(name, 0.0), order[name]),
+        )
+        for name in ready[: max(0, workers - len(running))]:
+            del remaining[name]
+            heapq.heappush(
+                running, (time + durations.get(name, default_duration), name)
+            )
+        if not running:
+            break  # Dependency cycle, colcon would refuse to build
+        time, finished = heapq.heappop(running)
+        for deps in remaining.values():
+            deps.discard(finished)
+    return time
+
+
+def get_colcon_priorities(dependencies: dict[str, set[str]]) -> dict[str, float]:
+    """
+    :return: The priorities colcon's parallel executor uses, i.e., the number of (recursive) dependents.
+    """
+    return {
+        name: sum(
+            1 for other, deps in dependencies.items() if other != name and name in deps
+        )
+        for name in dependencies
+    }
+
+
+def get_topological_order(dependencies: dict[str, set[str]]) -> list[str]:
+    """
+    :return: The packages in the order colcon processes them, i.e., dependencies first and otherwise by name.
+    """
+    remaining = {
+        name: {d for d in deps if d != name and d in dependencies}
+        for name, deps in dependencies.items()
+    }
+    result = []
+    while remaining:
+        ready = sorted(name for name, deps in remaining.items() if not deps)
+        if not ready:
+            ready = sorted(remaining.keys())  # Dependency cycle
+        for name in ready:
+            del remaining[name]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+        result += ready
+    return result
+
+
+def print_schedule_report(
+    dependencies: dict[str, set[str]], durations: dict[str, float], workers: int
+) -> None:
+    """
+    Print the predicted wall time of a build with colcon's order and with the critical path order.
+    :param dependencies: The recursive dependencies of the packages that are built.
+    :param durations: The expected durations of the packages.
+    :param workers: The number of parallel workers.
+    """
+    dependencies = {
+        name: dependencies[name] for name in get_topological_order(dependencies)
+    }
+    weights = compute_critical_path_weights(dependencies, durations)
+    colcon_time = simulate_build(
+        dependencies, durations, workers, get_colcon_priorities(dependencies)
+    )
+    critical_path_time = simulate_build(dependencies, durations, workers, weights)
+    unknown = [name for name in dependencies if name not in durations]
+
+    print_header(
+        f"Predicted build time of {len(dependencies)} packages with {workers} workers"
+    )
+    print(f"colcon order:        {format_duration(colcon_time)}")
+    change = ""
+    if colcon_time > 0:
+        change = f" ({(critical_path_time - colcon_time) / colcon_time * 100:+.0f}%)"
+    print(f"Critical path order: {format_duration(critical_path_time)}{change}")
+    if weights:
+        # Follow the heaviest dependent from the heaviest package to obtain the critical path
+        path = [max(weights.keys(), key=lambda name: weights[name])]
+        while True:
+            dependents = [
+                name
+                for name, deps in dependencies.items()
+                if path[-1] in deps and name != path[-1] and name not in path
+            ]
+            if not dependents:
+                break
+            path.append(max(dependents, key=lambda name: weights[name]))
+        print(
+            f"Critical path:       {format_duration(weights[path[0]])} ({' -> '.join(path)})"
+        )
+    if unknown:
+        print_color(
+            Colors.ORANGE,
+            f"No build history for {len(unknown)} packages, assuming {format_duration(get_default_duration(durations))} for each.",
+        )
+
+
+def _create_executor_extension_class():
+    import asyncio
+    from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED
+    from inspect import iscoroutinefunction
+    import signal
+    from colcon_core.executor import OnError
+    from colcon_core.subprocess import SIGINT_RESULT
+    from colcon_parallel_executor.event.executor import ParallelStatus
+    from colcon_parallel_executor.executor.parallel import ParallelExecutorExtension
+
+    class CriticalPathExecutorExtension(ParallelExecutorExtension):
+        """
+        Process multiple packages in parallel starting the packages with the longest remaining critical path first.
+        _execute is a copy of the one of colcon-parallel-executor (see SUPPORTED_PARALLEL_EXECUTOR_VERSIONS) that only
+        differs in the order of the ready jobs. Compare it with the new version before adding a version.
+        """
+
+        async def _execute(self, args, jobs, *, on_error):
+            durations = json.loads(os.environ.get(DURATIONS_ENVIRONMENT_VARIABLE, "{}"))
+            weights = compute_critical_path_weights(
+                {name: set(job.dependencies) for name, job in jobs.items()}, durations
+            )
+            futures = {}
+            finished_jobs = {}
+            rc = 0
+            jobs = jobs.copy()
+            while jobs or futures:
+                not_finished = set(jobs.keys()) | {
+                    f.identifier for f in futures.values()
+                }
+                ready_jobs = [
+                    (name, job)
+                    for name, job in jobs.items()
+                    if not (set(job.dependencies) - {name}) & not_finished
+                ]
+                # Longest remaining critical path first
+                ready_jobs.sort(key=lambda r: -weights[r[0]])
+
+                for name, job in ready_jobs:
+                    # don't schedule more jobs than workers to prevent starting further jobs when a job fails
+                    if args.parallel_workers and len(futures) >= args.parallel_workers:
+                        break
+                    del jobs[name]
+                    assert iscoroutinefunction(job.__call__), "Job is not a coroutine"
+                    futures[asyncio.ensure_future(job())] = job
+
+                assert futures, "No futures"
+                self._ongoing_jobs = futures.values()
+                done_futures, _ = await asyncio.wait(
+                    futures.keys(), timeout=30, return_when=FIRST_COMPLETED
+                )
+                if not done_futures:
+                    self.put_event_into_queue(
+                        ParallelStatus(tuple(f.identifier for f in futures.values()))
+                    )
+
+                for done_future in done_futures:
+                    job = futures.pop(done_future)
+                    if done_future.cancelled():
+                        result = signal.SIGINT
+                    elif done_future.exception():
+                        result = done_future.exception()
+                        if isinstance(result, KeyboardInterrupt):
+                            result = signal.SIGINT
+                    else:
+                        result = done_future.result()
+                        if result == SIGINT_RESULT:
+                            result = signal.SIGINT
+                    finished_jobs[job.identifier] = result
+                    if result is signal.SIGINT or result and not rc:
+                        rc = result
+                    if result:
+                        if on_error in (OnError.interrupt, OnError.skip_pending):
+                            jobs.clear()
+                        if on_error == OnError.skip_downstream:
+                            for pending_name, pending_job in list(jobs.items()):
+                                if job.identifier in pending_job.dependencies:
+                                    del jobs[pending_name]
+
+                if (rc and on_error == OnError.interrupt) or rc is signal.SIGINT:
+                    if futures:
+                        for future in futures.keys():
+                            if not future.done():
+                                future.cancel()
+                        await asyncio.wait(futures.keys(), return_when=ALL_COMPLETED)
+                        for future, job in futures.items():
+                            finished_jobs[job.identifier] = future.result()
+                    break
+
+            if any(finished_jobs.values()):
+                self._flush()
+            return rc
+
+    return ParallelExecutorExtension, CriticalPathExecutorExtension
+
+
+def get_parallel_executor_version() -> str | None:
+    """
+    :return: The installed version of colcon-parallel-executor or None if it is not installed.
+    """
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        return version("colcon-parallel-executor")
+    except PackageNotFoundError:
+        return None
+
+
+def main() -> int:
+    from colcon_core import executor
+    from colcon_core.command import main as colcon_main
+
+    parallel_executor_version = get_parallel_executor_version()
+    if parallel_executor_version not in SUPPORTED_PARALLEL_EXECUTOR_VERSIONS:
+        print_color(
+            Colors.ORANGE,
+            f"Critical path scheduling requires colcon-parallel-executor "
+            f"{' or '.join(SUPPORTED_PARALLEL_EXECUTOR_VERSIONS)} but found {parallel_executor_version or 'none'}, "
+            f"using colcon's default order.",
+        )
+        return colcon_main()
+
+    parallel_class, critical_path_class = _create_executor_extension_class()
+    get_executor_extensions = executor.get_executor_extensions
+
+    def get_critical_path_executor_extensions(*, group_name=None):
+        # Replace the parallel executor, keeping its name and priority so it is still the default
+        extensions = get_executor_extensions(group_name=group_name)
+        for group in extensions.values():
+            for name, extension in group.items():
+                if type(extension) is parallel_class:
+                    replacement = critical_path_class()
+                    replacement.EXECUTOR_NAME = extension.EXECUTOR_NAME
+                    group[name] = replacement
+        return extensions
+
+    executor.get_executor_extensions = get_critical_path_executor_extensions
+    return colcon_main()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,253 @@
+"""
+Incremental synchronization of directory trees.
+Only files whose size or modification time (or optionally content hash) differ are copied and symlinks are preserved.
+Files are copied in parallel using copy-on-write clones (reflinks) if the file system supports them.
+The entries copied into the destination are recorded in a manifest in the destination. Entries that no longer exist in
+the source are only deleted if they are in the manifest, other content of the destination is left untouched.
+"""
+
+from .manifest import hash_file
+from concurrent.futures import ThreadPoolExecutor
+import errno
+import json
+import os
+import shutil
+import stat
+
+# ioctl request to create a copy-on-write clone of a file (reflink)
+_FICLONE = 0x40049409
+# Names of the entry types of scan_entries for messages
+_KIND_NAMES = {"d": "Directory", "f": "File", "l": "Symlink"}
+# Name of the manifest of the synchronized entries in the destination
+SYNC_MANIFEST_NAME = ".tuda_wss_sync.json"
+# Version of the manifest. Bump if its structure changes.
+SYNC_MANIFEST_VERSION = 1
+
+
+class SyncResult:
+    # Number of copied files and symlinks
+    copied: int
+    # Number of deleted files, symlinks and directories
+    deleted: int
+    # Number of files and symlinks that were already up to date
+    unchanged: int
+    # Total size of the copied files in bytes
+    copied_bytes: int
+
+    def __init__(self) -> None:
+        self.copied = 0
+        self.deleted = 0
+        self.unchanged = 0
+        self.copied_bytes = 0
+
+
+def clone_file(source, destination) -> None:
+    """
+    Copy a file using a copy-on-write clone if the file system supports it.
+    """
+    import fcntl
+
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+        except OSError as e:
+            if e.errno not in (
+                errno.EOPNOTSUPP,
+                errno.EXDEV,
+                errno.EINVAL,
+                errno.ENOTTY,
+            ):
+                raise
+            shutil.copyfileobj(src, dst, 1 << 20)
+    shutil.copystat(source, destination)
+
+
+def scan_entries(path) -> dict[str, tuple]:
+    """
+    :return: The type ("d", "f" or "l"), size, modification time in ns and link target of every entry in the tree by
+        path relative to the root. Symlinks are not followed.
+    """
+    result = {}
+    stack = [path]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                info = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue  # Removed while scanning
+            relative_path = os.path.relpath(entry.path, path)
+            if stat.S_ISLNK(info.st_mode):
+                result[relative_path] = ("l", 0, 0, os.readlink(entry.path))
+            elif stat.S_ISDIR(info.st_mode):
+                result[relative_path] = ("d", 0, 0, None)
+                stack.append(entry.path)
+            else:
+                result[relative_path] = ("f", info.st_size, info.st_mtime_ns, None)
+    return result
+
+
+def load_sync_manifest(destination) -> set[str]:
+    """
+    :return: The paths of the entries relative to the destination that were synchronized into it before.
+    """
+    try:
+        with open(os.path.join(destination, SYNC_MANIFEST_NAME), "r") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return set()
+    if not isinstance(data, dict) or data.get("version") != SYNC_MANIFEST_VERSION:
+        return set()
+    return set(data.get("entries", []))
+
+
+def _save_sync_manifest(destination, entries) -> None:
+    path = os.path.join(destination, SYNC_MANIFEST_NAME)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"version": SYNC_MANIFEST_VERSION, "entries": sorted(entries)}, f)
+    os.replace(tmp_path, path)
+
+
+def sync_tree(
+    source,
+    destination,
+    compare_hashes: bool = False,
+    hardlink: bool = False,
+    workers: int | None = None,
+) -> SyncResult:
+    """
+    Update the destination tree to the source tree.
+    Entries that are not in the source are only deleted if they were synchronized into the destination before.
+    :param compare_hashes: Whether files with the same size but a different modification time are compared by
+        content. If they are identical, only the modification time is updated instead of copying them.
+    :param hardlink: Whether to hardlink files instead of copying them if source and destination are on the same
+        file system. Only use this if the source files are replaced and not modified in place later since the
+        destination shares them.
+    :return: The number of copied, deleted and unchanged entries.
+    @raises FileExistsError if an entry of the destination that was not synchronized before is in the way of an entry
+        of the source with another type, e.g., a file where the source has a directory.
+    """
+    result = SyncResult()
+    os.makedirs(destination, exist_ok=True)
+    workers = workers or min(32, (os.cpu_count() or 1) + 4)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        source_entries, destination_entries = executor.map(
+            scan_entries, [source, destination]
+        )
+        destination_entries.pop(SYNC_MANIFEST_NAME, None)
+        hardlink = hardlink and os.stat(source).st_dev == os.stat(destination).st_dev
+        synchronized = load_sync_manifest(destination)
+        # Check before recording the entries, otherwise the conflicting entries would be deleted by the next sync
+        for relative_path, old in destination_entries.items():
+            new = source_entries.get(relative_path, None)
+            if new is None or new[0] == old[0] or relative_path in synchronized:
+                continue
+            raise FileExistsError(
+                errno.EEXIST,
+                f"{_KIND_NAMES[old[0]]} that was not synchronized is in the way of a synchronized "
+                f"{_KIND_NAMES[new[0]].lower()}",
+                os.path.join(destination, relative_path),
+            )
+        # Record the new entries before copying, so they are known if the sync is interrupted
+        _save_sync_manifest(destination, synchronized | source_entries.keys())
+
+        # Delete vanished entries and entries whose type changed. Children sort after their parent directory,
+        # hence in reverse order, the directories are empty when they are deleted unless they contain entries that
+        # were not synchronized.
+        for relative_path in sorted(destination_entries.keys(), reverse=True):
+            old = destination_entries[relative_path]
+            new = source_entries.get(relative_path, None)
+            if new is not None and new[0] == old[0]:
+                continue
+            path = os.path.join(destination, relative_path)
+            if relative_path not in synchronized:
+                continue  # Only vanished entries, conflicts were checked above
+            if old[0] == "d":
+                try:
+                    os.rmdir(path)
+                except OSError as e:
+                    if e.errno != errno.ENOTEMPTY:
+                        raise
+                    if new is not None:
+                        raise FileExistsError(
+                            errno.EEXIST,
+                            f"Directory with files that were not synchronized is in the way of a synchronized "
+                            f"{_KIND_NAMES[new[0]].lower()}",
+                            path,
+                        )
+                    continue
+            else:
+                os.remove(path)
+            del destination_entries[relative_path]
+            result.deleted += 1
+
+        pending = []
+        for relative_path in sorted(source_entries.keys()):
+            new = source_entries[relative_path]
+            old = destination_entries.get(relative_path, None)
+            path = os.path.join(destination, relative_path)
+            if new[0] == "d":
+                if old is None:
+                    os.makedirs(path, exist_ok=True)
+            elif new[0] == "l":
+                if old is not None and old[3] == new[3]:
+                    result.unchanged += 1
+                    continue
+                if old is not None:
+                    os.remove(path)
+                os.symlink(new[3], path)
+                result.copied += 1
+            elif old is not None and old[1] == new[1] and old[2] == new[2]:
+                result.unchanged += 1
+            else:
+                same_size = old is not None and old[1] == new[1]
+                pending.append(
+                    executor.submit(
+                        _sync_file,
+                        os.path.join(source, relative_path),
+                        path,
+                        compare_hashes and same_size,
+                        hardlink,
+                    )
+                )
+        for future in pending:
+            size = future.result()
+            if size is None:
+                result.unchanged += 1
+            else:
+                result.copied += 1
+                result.copied_bytes += size
+    # Copying files updates the modification times of their directories
+    for relative_path, entry in source_entries.items():
+        if entry[0] == "d":
+            shutil.copystat(
+                os.path.join(source, relative_path),
+                os.path.join(destination, relative_path),
+            )
+    _save_sync_manifest(destination, source_entries.keys())
+    return result
+
+
+def _sync_file(source, destination, compare_hashes, hardlink) -> int | None:
+    """
+    Replace the destination file with the source file.
+    :param compare_hashes: Whether to compare the content first and only update the modification time if identical.
+    :return: The copied size or None if the content was identical.
+    """
+    if compare_hashes and hash_file(source) == hash_file(destination):
+        shutil.copystat(source, destination)
+        return None
+    tmp_path = f"{destination}.{os.getpid()}.sync"
+    if hardlink:
+        os.link(source, tmp_path)
+    else:
+        clone_file(source, tmp_path)
+    # Replace instead of overwriting in place so processes using the old file are not affected
+    os.replace(tmp_path, destination)
+    return os.path.getsize(destination)
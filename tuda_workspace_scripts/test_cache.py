@@ -0,0 +1,213 @@
+"""
+Local cache of the test results of packages.
+The key of a package is a hash of its install tree, its sources (which contain the tests and their data) and the
+install trees of all packages in the workspace it depends on. If the tests of a package passed with the same key
+before, the cached result files are copied into its build directory instead of running the tests again.
+Changes outside the workspace, e.g., updated system packages, are not detected. Use --no-cache after such changes.
+"""
+
+from .manifest import MANIFEST_VERSION, scan_packages, tree_digest
+from .test_results import find_result_files, parse_result_file
+from .workspace import get_cache_directory
+import hashlib
+import json
+import os
+import shutil
+import time
+
+# Version of the cache layout and keys. Bump if the structure of the cache or the inputs of the keys change.
+TEST_CACHE_VERSION = 1
+# Maximum number of cached test runs, the least recently used are removed first
+DEFAULT_MAX_ENTRIES = 2000
+# Environment variables that change the test results of a package
+KEY_ENVIRONMENT_VARIABLES = ["ROS_DISTRO", "RMW_IMPLEMENTATION"]
+
+
+def get_test_cache_path(workspace_root) -> str:
+    return os.path.join(workspace_root, ".cache", "test_results")
+
+
+class TestResultCache:
+    """
+    The cache consists of a directory per key containing the result files of the package (relative to its build
+    directory) and a meta.json. The modification time of the directory is the time it was last used and determines
+    the eviction order.
+    """
+
+    def __init__(self, workspace_root) -> None:
+        self._workspace_root = workspace_root
+        self.path = get_test_cache_path(workspace_root)
+        self._entries_path = os.path.join(self.path, "entries")
+        self._state_path = os.path.join(self.path, "state.json")
+        self._state = None
+
+    def compute_keys(self, index, names, install_base) -> dict[str, str]:
+        """
+        :param index: The package index of the workspace.
+        :param names: The packages for which the keys are computed.
+        :param install_base: The install base of the workspace. Packages need an isolated install directory.
+        :return: The key of every package by name. Packages without an install directory have no key.
+        """
+        names = set(names)
+        dependencies = {
+            name: index.get_dependencies([name]) & set(index.packages.keys())
+            for name in names
+        }
+        installed = {
+            name
+            for name in names.union(*dependencies.values())
+            if os.path.isdir(os.path.join(install_base, name))
+        }
+        state = self._load_state()
+        sources = scan_packages(
+            {name: index.packages[name].path for name in names}, state["sources"]
+        )
+        installs = scan_packages(
+            {
+                name: os.path.join(os.path.abspath(install_base), name)
+                for name in installed
+            },
+            state["installs"],
+        )
+        state["sources"].update(sources)
+        state["installs"].update(installs)
+        install_digests = {
+            name: tree_digest(manifest["files"]) for name, manifest in installs.items()
+        }
+        environment = {
+            name: os.environ.get(name, None) for name in KEY_ENVIRONMENT_VARIABLES
+        }
+        keys = {}
+        for name in names & installed:
+            data = {
+                "version": TEST_CACHE_VERSION,
+                "package": name,
+                "environment": environment,
+                "install": install_digests[name],
+                "sources": tree_digest(sources[name]["files"]),
+                "dependencies": {
+                    d: install_digests.get(d, None) for d in sorted(dependencies[name])
+                },
+            }
+            keys[name] = hashlib.sha1(
+                json.dumps(data, sort_keys=True).encode()
+            ).hexdigest()
+        return keys
+
+    def replay(self, name, key, build_base) -> bool:
+        """
+        Replace the result files in the build directory of the package with the cached result files for the key.
+        :return: True if the results were replayed, False if the key is not in the cache.
+        """
+        entry = os.path.join(self._entries_path, key)
+        try:
+            with open(os.path.join(entry, "meta.json"), "r") as f:
+                files = json.load(f)["files"]
+        except (OSError, ValueError, KeyError):
+            return False
+        package_build_path = os.path.join(build_base, name)
+        # Results of a previous run would be reported together with the replayed results
+        for path in find_result_files(package_build_path):
+            if parse_result_file(path) is not None:
+                os.remove(path)
+        for relative_path in files:
+            destination = os.path.join(package_build_path, relative_path)
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            shutil.copyfile(os.path.join(entry, "results", relative_path), destination)
+        os.utime(entry)
+        return True
+
+    def store(self, name, key, build_base, modified_after: float) -> bool:
+        """
+        Store the result files of the package if all of its tests passed.
+        :param modified_after: The start of the test run. Older result files in the build directory are not stored.
+        :return: True if the results were stored.
+        """
+        package_build_path = os.path.join(build_base, name)
+        files = {}
+        for path in find_result_files(package_build_path, modified_after):
+            cases = parse_result_file(path)
+            if cases is None:
+                continue
+            if any(case.result in ("failure", "error") for case in cases):
+                return False
+            files[os.path.relpath(path, package_build_path)] = path
+        if not files:
+            return False
+        entry = os.path.join(self._entries_path, key)
+        if os.path.isdir(entry):
+            os.utime(entry)
+            return True
+        get_cache_directory(self._workspace_root, "test_results")
+        tmp_entry = f"{entry}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+        for relative_path, path in files.items():
+            destination = os.path.join(tmp_entry, "results", relative_path)
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            shutil.copyfile(path, destination)
+        with open(os.path.join(tmp_entry, "meta.json"), "w") as f:
+            json.dump(
+                {"package": name, "files": sorted(files.keys()), "time": time.time()},
+                f,
+            )
+        try:
+            os.rename(tmp_entry, entry)
+        except OSError:
+            # Stored by another test run in the meantime
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+        return True
+
+    def evict(self, max_entries: int = DEFAULT_MAX_ENTRIES) -> int:
+        """
+        Remove the least recently used entries until there are at most max_entries.
+        :return: The number of removed entries.
+        """
+        try:
+            with os.scandir(self._entries_path) as it:
+                entries = sorted(
+                    (entry.stat().st_mtime, entry.path)
+                    for entry in it
+                    if entry.is_dir() and not entry.name.endswith(".tmp")
+                )
+        except OSError:
+            return 0
+        for _, path in entries[: max(0, len(entries) - max_entries)]:
+            shutil.rmtree(path, ignore_errors=True)
+        return max(0, len(entries) - max_entries)
+
+    def save(self) -> None:
+        """
+        Save the manifests of the source and install trees. Has to be called after computing keys.
+        """
+        if self._state is None:
+            return
+        get_cache_directory(self._workspace_root, "test_results")
+        tmp_path = f"{self._state_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    "version": TEST_CACHE_VERSION,
+                    "manifest_version": MANIFEST_VERSION,
+                    **self._state,
+                },
+                f,
+            )
+        os.replace(tmp_path, self._state_path)
+
+    def _load_state(self) -> dict:
+        if self._state is not None:
+            return self._state
+        self._state = {"sources": {}, "installs": {}}
+        try:
+            with open(self._state_path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return self._state
+        if (
+            isinstance(data, dict)
+            and data.get("version") == TEST_CACHE_VERSION
+            and data.get("manifest_version") == MANIFEST_VERSION
+        ):
+            self._state["sources"] = data.get("sources", {})
+            self._state["installs"] = data.get("installs", {})
+        return self._state
@@ -0,0 +1,48 @@
+"""
+History of the test runs in a workspace with the duration and result of every package and the durations of the
+individual tests.
+"""
+
+import json
+import os
+
+# Version of the on-disk format. Bump if the structure of the history changes.
+TEST_HISTORY_VERSION = 1
+# Number of test runs that are kept in the history
+MAX_TEST_HISTORY = 50
+
+
+def get_test_history_path(workspace_root) -> str:
+    return os.path.join(workspace_root, ".config", "test_history.json")
+
+
+def load_test_history(workspace_root) -> list[dict]:
+    """
+    :return: The recorded test runs, oldest first. Each run is a dict with the start time (seconds since epoch),
+        duration, return code and a dict of packages with their duration, success and the durations of their tests.
+        The packages have the same structure as in the build history, so its functions can be used to obtain the
+        expected durations.
+    """
+    try:
+        with open(get_test_history_path(workspace_root), "r") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return []
+    if not isinstance(data, dict) or data.get("version") != TEST_HISTORY_VERSION:
+        return []
+    return data.get("runs", [])
+
+
+def record_test_run(workspace_root, run: dict) -> None:
+    """
+    Append a test run to the history. Only the last MAX_TEST_HISTORY runs are kept.
+    """
+    history = load_test_history(workspace_root) + [run]
+    path = get_test_history_path(workspace_root)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(
+            {"version": TEST_HISTORY_VERSION, "runs": history[-MAX_TEST_HISTORY:]}, f
+        )
+    os.replace(tmp_path, path)
@@ -0,0 +1,265 @@
+"""
+Parsing of the JUnit and CTest result files that the tests of a package write into its build directory and a
+summary of the results of all packages. Replaces colcon test-result which is started once per package and slow to
+start and collect on large workspaces.
+"""
+
+from .build_history import format_duration
+from .print import Colors, print_color, print_error, print_header, TableOutput
+from concurrent.futures import ThreadPoolExecutor
+import os
+import xml.etree.ElementTree as ElementTree
+
+# Directories in the build directory of a package that never contain test results
+_SKIPPED_DIRECTORIES = {"CMakeFiles", "__pycache__"}
+# Lines of a failure message that are printed in the summary
+MAX_MESSAGE_LINES = 20
+
+
+class TestCase:
+    # Name of the test including its class or suite name
+    name: str
+    # Duration in seconds or None if unknown
+    duration: float | None
+    # One of "passed", "failure", "error", "skipped"
+    result: str
+    # Failure or error message
+    message: str | None
+    # The result file the test case was read from
+    path: str | None
+
+    def __init__(
+        self, name, duration=None, result="passed", message=None, path=None
+    ) -> None:
+        self.name = name
+        self.duration = duration
+        self.result = result
+        self.message = message
+        self.path = path
+
+
+def find_result_files(
+    package_build_path, modified_after: float | None = None
+) -> list[str]:
+    """
+    :param package_build_path: The build directory of the package.
+    :param modified_after: Only return files modified after this time (seconds since epoch).
+    :return: The paths of all XML files in the build directory of the package.
+    """
+    result = []
+    for directory, directories, files in os.walk(package_build_path):
+        directories[:] = [d for d in directories if d not in _SKIPPED_DIRECTORIES]
+        for name in files:
+            if not name.endswith(".xml"):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                if (
+                    modified_after is not None
+                    and os.stat(path).st_mtime < modified_after
+                ):
+                    continue
+            except OSError:
+                continue
+            result.append(path)
+    return result
+
+
+def parse_result_file(path) -> list[TestCase] | None:
+    """
+    :return: The test cases in the JUnit or CTest result file or None if it is not a result file.
+    """
+    try:
+        root = ElementTree.parse(path).getroot()
+    except (OSError, ElementTree.ParseError):
+        return None
+    if root.tag in ("testsuite", "testsuites"):
+        return _parse_junit(root, path)
+    if root.tag == "Site" and root.find("Testing") is not None:
+        return _parse_ctest(root, path)
+    return None
+
+
+def _parse_junit(root, path) -> list[TestCase]:
+    result = []
+    for case in root.iter("testcase"):
+        name = case.get("name", "")
+        if case.get("classname"):
+            name = f"{case.get('classname')}.{name}"
+        state = "passed"
+        message = None
+        for tag in ("failure", "error", "skipped"):
+            element = case.find(tag)
+            if element is not None:
+                state = tag
+                message = "\n".join(
+                    part.strip()
+                    for part in (element.get("message"), element.text)
+                    if part and part.strip()
+                )
+                break
+        try:
+            duration = float(case.get("time"))
+        except (TypeError, ValueError):
+            duration = None
+        result.append(TestCase(name, duration, state, message or None, path))
+    return result
+
+
+def _parse_ctest(root, path) -> list[TestCase]:
+    result = []
+    for test in root.find("Testing").iter("Test"):
+        status = test.get("Status")
+        if status is None:
+            continue  # Entry of the TestList
+        duration = None
+        for measurement in test.iter("NamedMeasurement"):
+            if measurement.get("name") == "Execution Time":
+                try:
+                    duration = float(measurement.findtext("Value"))
+                except (TypeError, ValueError):
+                    pass
+        state = {"passed": "passed", "notrun": "skipped"}.get(status, "failure")
+        message = None
+        if state == "failure":
+            message = (test.findtext("Results/Measurement/Value") or "").strip()
+        result.append(
+            TestCase(test.findtext("Name", ""), duration, state, message or None, path)
+        )
+    return result
+
+
+def collect_package_results(
+    package_build_path, modified_after: float | None = None
+) -> list[TestCase]:
+    """
+    :param package_build_path: The build directory of the package.
+    :param modified_after: Only use files modified after this time (seconds since epoch).
+    :return: The test cases of the package.
+    """
+    junit = []
+    ctest = []
+    for path in find_result_files(package_build_path, modified_after):
+        cases = parse_result_file(path)
+        if cases is None:
+            continue
+        if os.path.basename(os.path.dirname(os.path.dirname(path))) == "Testing":
+            ctest.append((path, cases))
+        else:
+            junit += cases
+    if junit or not ctest:
+        # CTest only wraps the tests that write the JUnit files, using both would count every test twice
+        return junit
+    # Every CTest run writes a new Testing/<timestamp> directory, only the last one is relevant
+    return max(ctest, key=lambda c: os.path.getmtime(c[0]))[1]
+
+
+def collect_test_results(
+    build_base_path,
+    packages: list[str] | None = None,
+    modified_after: float | None = None,
+    workers: int | None = None,
+) -> dict[str, list[TestCase]]:
+    """
+    Collect the test results of the packages. Every package is scanned and parsed as a separate task.
+    :param build_base_path: The build directory of the workspace.
+    :param packages: The packages whose results are collected. Defaults to all packages in the build directory.
+    :param modified_after: Only use files modified after this time (seconds since epoch).
+    :return: The test cases of every package that has test results by package name.
+    """
+    if packages is None:
+        try:
+            with os.scandir(build_base_path) as it:
+                packages = sorted(
+                    entry.name
+                    for entry in it
+                    if entry.is_dir(follow_symlinks=False)
+                    and not entry.name.startswith(".")
+                )
+        except OSError:
+            return {}
+    workers = workers or min(32, (os.cpu_count() or 1) * 2)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(
+            lambda name: collect_package_results(
+                os.path.join(build_base_path, name), modified_after
+            ),
+            packages,
+        )
+        return {name: cases for name, cases in zip(packages, results) if cases}
+
+
+def has_failures(results: dict[str, list[TestCase]]) -> bool:
+    return any(
+        case.result in ("failure", "error")
+        for cases in results.values()
+        for case in cases
+    )
+
+
+def print_test_results(
+    results: dict[str, list[TestCase]], max_slowest: int = 10
+) -> None:
+    """
+    Print the failed tests with their messages, the number of tests of every package and the slowest tests.
+    :param results: The test cases of every package as returned by collect_test_results.
+    :param max_slowest: The number of slowest tests that are listed.
+    """
+    failed = [
+        (name, case)
+        for name in sorted(results.keys())
+        for case in results[name]
+        if case.result in ("failure", "error")
+    ]
+    if failed:
+        print_header(f"{len(failed)} failed tests")
+        for name, case in failed:
+            print_error(f"{name}: {case.name} ({case.result})")
+            lines = (case.message or "").splitlines()
+            for line in lines[:MAX_MESSAGE_LINES]:
+                print(f"    {line}")
+            if len(lines) > MAX_MESSAGE_LINES:
+                print(f"    ... see {case.path}")
+        print()
+
+    print_header("Test results by package")
+    table = TableOutput(["Package", "Tests", "Failures", "Errors", "Skipped", "Time"])
+    totals = {"tests": 0, "failure": 0, "error": 0, "skipped": 0}
+    for name in sorted(results.keys()):
+        counts = {"passed": 0, "failure": 0, "error": 0, "skipped": 0}
+        for case in results[name]:
+            counts[case.result] += 1
+        table.add_row(
+            [
+                name,
+                str(len(results[name])),
+                str(counts["failure"]),
+                str(counts["error"]),
+                str(counts["skipped"]),
+                format_duration(sum(case.duration or 0.0 for case in results[name])),
+            ]
+        )
+        totals["tests"] += len(results[name])
+        for state in ("failure", "error", "skipped"):
+            totals[state] += counts[state]
+    table.print()
+
+    timed = [
+        (case.duration, name, case.name)
+        for name, cases in results.items()
+        for case in cases
+        if case.duration is not None
+    ]
+    if timed and max_slowest > 0:
+        print()
+        print_header("Slowest tests")
+        table = TableOutput(["Test", "Package", "Duration"])
+        for duration, name, test in sorted(timed, key=lambda t: -t[0])[:max_slowest]:
+            table.add_row([test, name, format_duration(duration)])
+        table.print()
+
+    print()
+    print_color(
+        Colors.RED if failed else Colors.GREEN,
+        f"Summary: {totals['tests']} tests, {totals['error']} errors, {totals['failure']} failures, {totals['skipped']} skipped",
+    )
@@ -0,0 +1,209 @@
+"""
+Runs the tests of a workspace with colcon. Packages with the longest expected test duration (including the tests of
+the packages waiting for them) are started first and the durations are recorded in the test history.
+"""
+
+from .build_history import get_expected_durations, parse_colcon_events
+from .git_status import get_changed_files
+from .package_index import load_package_index
+from .print import print_info, print_warn
+from .scheduling import DURATIONS_ENVIRONMENT_VARIABLE, split_into_shards
+from .test_cache import TestResultCache
+from .test_history import load_test_history, record_test_run
+from .test_results import collect_test_results
+from .workspace import find_git_repositories
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import shlex
+import subprocess
+import sys
+import time
+
+
+def get_expected_test_durations(workspace_root, last_n: int = 10) -> dict[str, float]:
+    """
+    :return: The median test duration of the last successful test runs of every package in seconds.
+    """
+    return get_expected_durations(load_test_history(workspace_root), last_n)
+
+
+def select_shard(
+    packages: list[str],
+    shard: int,
+    count: int,
+    durations: dict[str, float] | None = None,
+) -> list[str]:
+    """
+    Split the packages into count shards. The split only depends on the arguments, so every shard run (and machine)
+    obtains the same shards as long as they pass the same durations.
+    Do not pass the durations from the test history of the workspace since it is updated by every shard run.
+    :param shard: The index of the shard starting at 1.
+    :param durations: Pinned expected test durations of the packages, see load_shard_durations. If None, the sorted
+        packages are distributed evenly.
+    :return: The packages of the given shard.
+    """
+    shards = split_into_shards(packages, durations or {}, count)
+    return shards[shard - 1]
+
+
+def load_shard_durations(path) -> dict[str, float]:
+    """
+    :return: The expected test durations of the packages in seconds from a JSON file written by save_shard_durations.
+    @raises ValueError if the file is not a valid durations file and OSError if it can not be read.
+    """
+    with open(path, "r") as f:
+        data = json.load(f)
+    if not isinstance(data, dict) or not all(
+        isinstance(v, (int, float)) for v in data.values()
+    ):
+        raise ValueError(f"{path} does not contain durations by package name.")
+    return {name: float(duration) for name, duration in data.items()}
+
+
+def save_shard_durations(workspace_root, path) -> dict[str, float]:
+    """
+    Save the expected test durations from the test history of the workspace, e.g., to pin them for sharding.
+    :return: The saved durations.
+    """
+    durations = get_expected_test_durations(workspace_root)
+    with open(path, "w") as f:
+        json.dump(durations, f, indent=2, sort_keys=True)
+    return durations
+
+
+def find_affected_packages(workspace_root, since=None) -> tuple[set[str], set[str]]:
+    """
+    Find the packages affected by the changes in the repositories in the src folder of the workspace.
+    If since can not be resolved in a repository, all packages in that repository are considered changed.
+    :param since: A revision, e.g., origin/main. If given, the changes committed since the common ancestor of since and
+        the HEAD are included. Otherwise, only the uncommitted changes are used.
+    :return: The packages containing changed files and the packages depending on them (including test dependencies).
+    """
+    index = load_package_index(workspace_root)
+    repositories = find_git_repositories(os.path.join(workspace_root, "src"))
+
+    def get_changed_packages(repository) -> set[str]:
+        try:
+            files = get_changed_files(repository, since)
+        except RuntimeError as e:
+            print_warn(f"{os.path.relpath(repository, workspace_root)}: {e}")
+            return {
+                package.name for package in index.get_packages_in_directory(repository)
+            }
+        packages = (index.find_package_containing(file) for file in files)
+        return {package.name for package in packages if package is not None}
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        changed = set().union(*executor.map(get_changed_packages, repositories))
+    return changed, index.get_dependents(changed)
+
+
+def run_tests(
+    workspace_root,
+    packages: list[str] | None = None,
+    parallel_workers: int | None = None,
+    build_base: str = "build",
+    install_base: str = "install",
+    use_cache: bool = False,
+) -> int:
+    """
+    Run colcon test for the given packages or all packages and record the durations in the test history.
+    :param parallel_workers: The number of packages tested in parallel. Defaults to colcon's default.
+    :param use_cache: Whether to replay the cached results of packages whose install tree, sources and dependencies
+        did not change since their tests last passed instead of running them and to cache the passed tests.
+    :return: The return code of colcon.
+    """
+    cache = None
+    if use_cache:
+        index = load_package_index(workspace_root)
+        names = packages or sorted(index.packages.keys())
+        cache = TestResultCache(workspace_root)
+        keys = cache.compute_keys(
+            index, names, os.path.join(workspace_root, install_base)
+        )
+        replayed = [
+            name
+            for name in names
+            if name in keys
+            and cache.replay(name, keys[name], os.path.join(workspace_root, build_base))
+        ]
+        cache.save()
+        if replayed:
+            print_info(
+                f"Replaying cached test results of {len(replayed)} unchanged packages: {' '.join(replayed)}"
+            )
+        packages = [name for name in names if name not in replayed]
+        if not packages:
+            return 0
+    env = dict(os.environ)
+    env[DURATIONS_ENVIRONMENT_VARIABLE] = json.dumps(
+        get_expected_test_durations(workspace_root)
+    )
+    command = [sys.executable, "-m", "tuda_workspace_scripts.scheduling", "test"]
+    if packages:
+        command += ["--packages-select"] + packages
+    if parallel_workers:
+        command += ["--parallel-workers", str(parallel_workers)]
+    print_info("Command:")
+    print(shlex.join(["colcon"] + command[3:]))
+    started = time.time()
+    process = subprocess.Popen(command, cwd=workspace_root, env=env)
+    try:
+        returncode = process.wait()
+    except KeyboardInterrupt:
+        process.kill()
+        process.wait()
+        raise
+    try:
+        events = _record_test_run(workspace_root, started, returncode, build_base)
+        if cache is not None:
+            for name, event in events.items():
+                if name in keys and event["returncode"] == 0:
+                    cache.store(
+                        name,
+                        keys[name],
+                        os.path.join(workspace_root, build_base),
+                        started,
+                    )
+            cache.evict()
+    except OSError:
+        pass  # Workspace not writable, the test run is just not recorded
+    return returncode
+
+
+def _record_test_run(workspace_root, started, returncode, build_base) -> dict:
+    """
+    :return: The duration and return code of every tested package as returned by parse_colcon_events.
+    """
+    events_path = os.path.join(workspace_root, "log", "latest_test", "events.log")
+    if os.stat(events_path).st_mtime < started:
+        return {}  # colcon did not run any tests
+    events = parse_colcon_events(events_path)
+    # Only results of this run, files of tests that did not run might still exist
+    results = collect_test_results(
+        os.path.join(workspace_root, build_base),
+        list(events.keys()),
+        modified_after=started,
+    )
+    packages = {}
+    for name, event in events.items():
+        packages[name] = {
+            "duration": event["duration"],
+            "success": event["returncode"] == 0,
+            "tests": {
+                case.name: case.duration
+                for case in results.get(name, [])
+                if case.duration is not None
+            },
+        }
+    record_test_run(
+        workspace_root,
+        {
+            "time": started,
+            "duration": time.time() - started,
+            "returncode": returncode,
+            "packages": packages,
+        },
+    )
+    return events
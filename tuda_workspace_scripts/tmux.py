@@ -1,6 +1,3 @@
-import libtmux
-
-
 def launch_tmux(
     commands: dict | list[str],
     session_name: str | None = None,
@@ -17,6 +14,8 @@ def launch_tmux(
     @param keep_open_duration: Time in seconds to keep each pane or window open after the\
         command completes. Defaults to 5. Set to None to keep open indefinitely.
     """
+    import libtmux
+
     command_names = list(commands.keys()) if isinstance(commands, dict) else commands
     shell_commands = commands if isinstance(commands, list) else list(commands.values())
 
@@ -0,0 +1,144 @@
+"""
+Instant removal of large directory trees.
+The trees are atomically renamed into a trash directory in the workspace and deleted by a detached low priority
+reaper process. Since the rename is atomic, builds never see partially deleted trees.
+
+Run as python3 -m tuda_workspace_scripts.trash <trash directory> to empty a trash directory.
+"""
+
+from .workspace import get_cache_directory
+from concurrent.futures import ThreadPoolExecutor
+import fcntl
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+# Name of the lock file that ensures that only one reaper empties a trash directory
+_LOCK_FILE = ".lock"
+
+
+def get_trash_path(workspace_root) -> str:
+    return os.path.join(workspace_root, ".cache", "trash")
+
+
+def move_to_trash(workspace_root, path) -> bool:
+    """
+    Move the file or directory into the trash of the workspace.
+    If it can not be moved, e.g., because it is on another file system, it is deleted immediately.
+    Call start_reaper afterwards to delete the trash in the background.
+    :return: False if the path does not exist.
+    """
+    if not os.path.lexists(path):
+        return False
+    trash_path = get_cache_directory(workspace_root, "trash")
+    name = os.path.basename(os.path.normpath(path))
+    destination = os.path.join(trash_path, f"{name}.{time.time_ns()}.{os.getpid()}")
+    try:
+        os.rename(path, destination)
+    except OSError:
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+    return True
+
+
+def start_reaper(workspace_root) -> None:
+    """
+    Start a detached process with idle I/O and lowest CPU priority that empties the trash of the workspace.
+    Does nothing if the trash is empty. If another reaper is running, the new one exits immediately and the running
+    one deletes the new entries.
+    """
+    trash_path = get_trash_path(workspace_root)
+    if not any(_get_entries(trash_path)):
+        return
+    start_low_priority_process("tuda_workspace_scripts.trash", [trash_path])
+
+
+def start_low_priority_process(module: str, arguments: list[str]) -> None:
+    """
+    Run the given python module with the arguments in a detached process with idle I/O and lowest CPU priority.
+    """
+    command = [sys.executable, "-m", module] + arguments
+    if shutil.which("ionice") is not None:
+        command = ["ionice", "-c3"] + command
+    subprocess.Popen(
+        command,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+        preexec_fn=lambda: os.nice(19),
+    )
+
+
+def empty_trash(trash_path, workers: int | None = None) -> None:
+    """
+    Delete all entries in the trash directory with parallel workers.
+    Returns immediately if another process is already emptying it.
+    """
+    workers = workers or min(8, os.cpu_count() or 1)
+    try:
+        lock = open(os.path.join(trash_path, _LOCK_FILE), "w")
+    except OSError:
+        return
+    with lock:
+        # Entries that could not be deleted, e.g., due to missing permissions
+        undeletable = set()
+        while True:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return  # Another reaper is running
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                while entries := set(_get_entries(trash_path)) - undeletable:
+                    _remove_trees(entries, executor)
+                    undeletable |= {path for path in entries if os.path.lexists(path)}
+            fcntl.flock(lock, fcntl.LOCK_UN)
+            # Entries moved to the trash while releasing the lock would otherwise be left behind
+            if not set(_get_entries(trash_path)) - undeletable:
+                return
+
+
+def _get_entries(trash_path) -> list[str]:
+    try:
+        with os.scandir(trash_path) as it:
+            return [entry.path for entry in it if entry.name != _LOCK_FILE]
+    except OSError:
+        return []
+
+
+def _remove_trees(paths, executor: ThreadPoolExecutor) -> None:
+    """
+    Remove the given trees by deleting their subdirectories in parallel.
+    """
+    futures = []
+    for path in paths:
+        if os.path.isdir(path) and not os.path.islink(path):
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            futures.append(
+                                executor.submit(
+                                    shutil.rmtree, entry.path, ignore_errors=True
+                                )
+                            )
+            except OSError:
+                pass
+    for future in futures:
+        future.result()
+    for path in paths:
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+if __name__ == "__main__":
+    empty_trash(sys.argv[1])
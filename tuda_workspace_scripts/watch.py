@@ -0,0 +1,191 @@
+"""
+Watches the source directories of packages for changes using inotify or polling if inotify is not available.
+"""
+
+from .manifest import IGNORED_DIRECTORIES, changed_paths, scan_tree
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import time
+
+# inotify event masks, see inotify(7)
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_WATCH_MASK = (
+    _IN_CLOSE_WRITE
+    | _IN_MOVED_FROM
+    | _IN_MOVED_TO
+    | _IN_CREATE
+    | _IN_DELETE
+    | _IN_DELETE_SELF
+)
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def is_ignored_path(name: str) -> bool:
+    """
+    :return: Whether changes of a file or directory with this name never require a rebuild, e.g., editor swap files.
+    """
+    return (
+        name in IGNORED_DIRECTORIES
+        or name.startswith(".")
+        or name.endswith("~")
+        or name.endswith(".egg-info")
+        or name.endswith(".swp")
+    )
+
+
+class PackageWatcher:
+    """
+    Watches the source directories of the given packages.
+    Uses inotify if available and falls back to polling the modification times of all files otherwise.
+    """
+
+    def __init__(self, packages: dict[str, str], poll_interval: float = 1.0) -> None:
+        """
+        :param packages: The paths of the packages to watch by name.
+        :param poll_interval: The interval in seconds in which the files are checked if inotify is not available.
+        """
+        self._packages = packages
+        self._poll_interval = poll_interval
+        self._fd = None
+        self._libc = None
+        # Watch descriptor -> (directory, package)
+        self._watches: dict[int, tuple[str, str]] = {}
+        self._manifests = {}
+        # Nested packages are watched separately
+        self._package_paths = {os.path.abspath(path) for path in packages.values()}
+        try:
+            self._start_inotify()
+        except OSError:
+            self.close()
+            self._manifests = {
+                name: scan_tree(path, hash_files=False)
+                for name, path in packages.items()
+            }
+
+    @property
+    def is_polling(self) -> bool:
+        return self._fd is None
+
+    def wait_for_changes(self, debounce: float = 0.5) -> set[str]:
+        """
+        Block until files of the watched packages changed and no further changes occurred for debounce seconds.
+        :return: The names of the changed packages.
+        """
+        changed = set()
+        while not changed:
+            changed = self._read_changes(None)
+        while more := self._read_changes(debounce):
+            changed |= more
+        return changed
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _start_inotify(self) -> None:
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = self._libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._fd = fd
+        for name, path in self._packages.items():
+            self._add_watches(path, name)
+
+    def _add_watches(self, directory, package) -> None:
+        """
+        Watch the directory and all its subdirectories that are not ignored.
+        """
+        stack = [directory]
+        while stack:
+            path = stack.pop()
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), _WATCH_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                if error == errno.ENOSPC:
+                    raise OSError(error, "Maximum number of inotify watches reached")
+                continue  # Removed in the meantime
+            self._watches[wd] = (path, package)
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        if (
+                            entry.is_dir(follow_symlinks=False)
+                            and not is_ignored_path(entry.name)
+                            and os.path.abspath(entry.path) not in self._package_paths
+                        ):
+                            stack.append(entry.path)
+            except OSError:
+                continue
+
+    def _read_changes(self, timeout: float | None) -> set[str]:
+        """
+        :param timeout: The time in seconds to wait for changes or None to wait until something changed.
+        :return: The names of the changed packages.
+        """
+        if self._fd is None:
+            return self._poll(timeout)
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self._fd, 1 << 16)
+        except BlockingIOError:
+            return set()
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & _IN_Q_OVERFLOW:
+                # Events were lost, every package might have changed
+                changed |= set(self._packages.keys())
+                continue
+            if mask & _IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            if wd not in self._watches:
+                continue
+            directory, package = self._watches[wd]
+            if name and is_ignored_path(name):
+                continue
+            if mask & _IN_ISDIR and mask & (_IN_CREATE | _IN_MOVED_TO):
+                try:
+                    self._add_watches(os.path.join(directory, name), package)
+                except OSError:
+                    pass  # Out of watches, changes in this directory are missed
+            changed.add(package)
+        return changed
+
+    def _poll(self, timeout: float | None) -> set[str]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changed = set()
+            for name, path in self._packages.items():
+                manifest = scan_tree(path, hash_files=False)
+                if any(
+                    not any(is_ignored_path(part) for part in p.split(os.sep))
+                    for p in changed_paths(self._manifests[name], manifest)
+                ):
+                    changed.add(name)
+                self._manifests[name] = manifest
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+            sleep = self._poll_interval
+            if deadline is not None:
+                sleep = min(sleep, max(0.0, deadline - time.monotonic()))
+            time.sleep(sleep)
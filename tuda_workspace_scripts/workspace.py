@@ -1,9 +1,9 @@
 #!/usr/bin/env python33
-try:
-    from colcon_core.plugin_system import get_package_identification_extensions
-except ImportError:
-    from colcon_core.package_identification import get_package_identification_extensions
-from colcon_core.package_identification import identify, IgnoreLocationException
+from .package_index import (
+    import_colcon_identification,
+    load_package_index,
+    PackageIndex,
+)
 import os
 
 
@@ -29,11 +29,32 @@ def get_workspace_root(directory=None) -> str | None:
     return None if parent == directory else get_workspace_root(parent)
 
 
+def get_cache_directory(workspace_root, name) -> str:
+    """
+    Create the directory for bulky cached data with the given name in the .cache folder of the workspace.
+    The .cache folder is ignored by colcon.
+    :return: The path of the directory.
+    """
+    cache_path = os.path.join(workspace_root, ".cache")
+    path = os.path.join(cache_path, name)
+    os.makedirs(path, exist_ok=True)
+    ignore_marker = os.path.join(cache_path, "COLCON_IGNORE")
+    if not os.path.exists(ignore_marker):
+        open(ignore_marker, "w").close()
+    return path
+
+
 def find_packages_in_directory(directory) -> list[str]:
     """
     :param directory: The directory to search for packages.
     :return: A list of package names found in the directory.
     """
+    index = _get_package_index_for_path(directory)
+    if index is not None:
+        return [p.name for p in index.get_packages_in_directory(directory)]
+    get_package_identification_extensions, identify, IgnoreLocationException = (
+        import_colcon_identification()
+    )
     packages = []
     identification_extensions = get_package_identification_extensions()
     visited_paths = set()
@@ -57,12 +78,38 @@ def find_packages_in_directory(directory) -> list[str]:
     return [p.name for p in packages]
 
 
+def _get_package_index_for_path(path) -> PackageIndex | None:
+    """
+    :return: The package index of the workspace if path is inside the src folder of a workspace, otherwise None.
+    """
+    path = os.path.abspath(path)
+    if not os.path.exists(path):
+        return None
+    if not os.path.isdir(path):
+        path = os.path.dirname(path)
+    workspace_root = get_workspace_root(path)
+    if workspace_root is None:
+        return None
+    src_path = os.path.join(workspace_root, "src")
+    if os.path.commonpath([src_path, path]) != src_path:
+        return None
+    return load_package_index(workspace_root)
+
+
 def find_package_containing(path, identification_extensions=None):
     """
     :param path: The path to search for a package.
     :param identification_extensions: The identification extensions to use. If None will use get_package_identification_extensions().
     :return: The name of the package containing the path or None if path is not in a package.
     """
+    if identification_extensions is None:
+        index = _get_package_index_for_path(path)
+        if index is not None:
+            package = index.find_package_containing(path)
+            return package.name if package is not None else None
+    get_package_identification_extensions, identify, IgnoreLocationException = (
+        import_colcon_identification()
+    )
     if identification_extensions is None:
         identification_extensions = get_package_identification_extensions()
     while path:
@@ -72,7 +119,10 @@ def find_package_containing(path, identification_extensions=None):
                 return result.name
         except IgnoreLocationException:
             pass
-        path = os.path.dirname(path)
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
     return None
 
 
@@ -86,7 +136,7 @@ def get_packages_in_workspace(workspace_path=None):
         workspace_path = get_workspace_root()
         if workspace_path is None:
             return []
-    return find_packages_in_directory(os.path.join(workspace_path, "src"))
+    return sorted(load_package_index(workspace_path).packages.keys())
 
 
 def get_package_path(package_name, workspace_path=None):
@@ -100,8 +150,15 @@ def get_package_path(package_name, workspace_path=None):
         workspace_path = get_workspace_root()
         if workspace_path is None:
             return None
+    package = load_package_index(workspace_path).get_package(package_name)
+    if package is not None:
+        return package.path
+    # The index only contains the packages in the src folder, search the rest of the workspace
+    get_package_identification_extensions, identify, IgnoreLocationException = (
+        import_colcon_identification()
+    )
     identification_extensions = get_package_identification_extensions()
-    visited_paths = set()
+    visited_paths = {os.path.realpath(os.path.join(workspace_path, "src"))}
     for dirpath, dirnames, _ in os.walk(workspace_path, followlinks=True):
         real_dirpath = os.path.realpath(dirpath)
         if real_dirpath in visited_paths:
@@ -122,6 +179,93 @@ def get_package_path(package_name, workspace_path=None):
     return None
 
 
+# Directories containing one of these files are skipped when searching for repositories
+IGNORE_MARKERS = {"COLCON_IGNORE", "AMENT_IGNORE", "CATKIN_IGNORE"}
+
+
+def find_git_repositories(directory) -> list[str]:
+    """
+    Find all git repositories in the given directory.
+    Hidden directories and directories containing a COLCON_IGNORE, AMENT_IGNORE or CATKIN_IGNORE file are skipped.
+    Repositories are only searched for nested repositories if they declare them as submodules in a .gitmodules file
+    or in a vcstool .repos file in the repository root.
+    :param directory: The directory to search for repositories.
+    :return: The paths of the repositories in sorted depth-first order.
+    """
+    repositories = []
+    visited_paths = {os.path.realpath(directory)}
+
+    def scan(path):
+        try:
+            with os.scandir(path) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            return
+        names = {entry.name for entry in entries}
+        if names & IGNORE_MARKERS:
+            return
+        if ".git" in names:
+            repositories.append(path)
+            real_path = os.path.realpath(path)
+            for nested_path in sorted(_get_nested_repository_paths(path, names)):
+                nested_path = os.path.normpath(os.path.join(path, nested_path))
+                # Paths in .repos files may point anywhere, only follow those inside the repository
+                real_nested_path = os.path.realpath(nested_path)
+                if real_nested_path == real_path or (
+                    os.path.commonpath([real_path, real_nested_path]) != real_path
+                ):
+                    continue
+                if os.path.isdir(nested_path):
+                    scan(nested_path)
+            return
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            try:
+                if not entry.is_dir():
+                    continue
+                if entry.is_symlink():
+                    real_path = os.path.realpath(entry.path)
+                    if real_path in visited_paths:
+                        continue
+                    visited_paths.add(real_path)
+            except OSError:
+                continue
+            scan(entry.path)
+
+    scan(directory)
+    return repositories
+
+
+def _get_nested_repository_paths(repository_path, names) -> set[str]:
+    """
+    :return: The paths relative to repository_path of the submodules and nested repositories declared in vcstool
+        .repos files in the root of the repository.
+    """
+    paths = set()
+    if ".gitmodules" in names:
+        try:
+            with open(os.path.join(repository_path, ".gitmodules"), "r") as f:
+                for line in f:
+                    key, _, value = line.partition("=")
+                    if key.strip() == "path" and value.strip():
+                        paths.add(value.strip())
+        except OSError:
+            pass
+    repos_files = [name for name in names if name.endswith(".repos")]
+    if repos_files:
+        import yaml
+
+        for name in repos_files:
+            try:
+                with open(os.path.join(repository_path, name), "r") as f:
+                    config = yaml.safe_load(f)
+                paths.update(config["repositories"].keys())
+            except (OSError, yaml.YAMLError, KeyError, TypeError, AttributeError):
+                pass
+    return paths
+
+
 def get_ament_prefix_path_without_packages(packages):
     ament_prefix_path = os.environ.get("AMENT_PREFIX_PATH", None)
     if ament_prefix_path is None: